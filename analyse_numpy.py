@@ -0,0 +1,242 @@
+from database import list_challenges, find_days_for_user
+from streaks import challenge_period
+from periods import get_period, Daily, Weekly, Monthly, Weekdays, EveryNDays
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+"""
+Day ordinal (date.toordinal) of 1970-01-01, the epoch of numpy.datetime64.
+"""
+EPOCH_DAY = 719163
+
+
+def available():
+    """
+    Function to check whether the optional dependency numpy is installed.
+    :return: True if the analyses of this module can be used
+    """
+    return np is not None
+
+
+def day_buckets(period, days):
+    """
+    Function to map an array of day ordinals to the bucket numbers of a period (vectorized Period.day_bucket).
+    :param period: period object (see periods.py)
+    :param days: numpy array of day ordinals
+    :return: numpy array of bucket numbers
+    """
+    if isinstance(period, Daily):
+        return days
+    if isinstance(period, Weekly):
+        return (days - 1) // 7
+    if isinstance(period, Monthly):
+        months = (days - EPOCH_DAY).astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+        return months + 1970 * 12
+    if isinstance(period, Weekdays):
+        return (days - 1) // 7 * 5 + np.minimum((days - 1) % 7, 4)
+    if isinstance(period, EveryNDays):
+        return (days - period.anchor) // period.days
+    return np.fromiter((period.day_bucket(elt) for elt in days.tolist()), np.int64, len(days))
+
+
+def load_history(db: str, user: str):
+    """
+    Function to load the tracking history of all challenges of a user into numpy arrays with three queries.
+    The periods of all challenges are concatenated into flat arrays: the periods of the n-th challenge are at the
+    positions offsets[n] to offsets[n] + lengths[n] - 1, ordered by bucket number starting at first[n].
+    Challenges with an unknown period are left out.
+    :param db: an initialized sqlite3 database connection
+    :param user: username to filter challenge entries
+    :return: dictionary with the Challenge records, the period objects and the arrays first, offsets, lengths,
+    counts (tracking entries per period) and streaks (True for periods with a streak)
+    """
+    if np is None:
+        raise ImportError("numpy is required for analyse_numpy")
+    challenges = []
+    periods = []
+    first = []
+    lengths = []
+    for chal in list_challenges(db, user):
+        period = get_period(chal.period)
+        if period is None:
+            continue
+        buckets = period.buckets(*challenge_period(chal.start_date, chal.end_date))
+        challenges.append(chal)
+        periods.append(period)
+        first.append(buckets.start)
+        lengths.append(len(buckets))
+    first = np.array(first, dtype=np.int64)
+    lengths = np.array(lengths, dtype=np.int64)
+    offsets = np.cumsum(lengths) - lengths
+    total = int(lengths.sum())
+
+    index = {chal.challenge_id: n for n, chal in enumerate(challenges)}
+    kinds = list({id(period): period for period in periods}.values())
+    codes = np.array([kinds.index(period) for period in periods], dtype=np.int64)
+
+    def positions(table):
+        """
+        Function to find the positions of the tracking or streak entries of the challenges in the flat arrays.
+        :param table: "Tracker" or "Streaks"
+        :return: positions of the entries within the periods of their challenge
+        """
+        rows = [(index[elt[0]], np.fromstring(elt[1], dtype=np.int64, sep=","))
+                for elt in find_days_for_user(db, user, table) if elt[0] in index]
+        if not rows:
+            return np.zeros(0, dtype=np.int64)
+        owner = np.repeat([elt[0] for elt in rows], [len(elt[1]) for elt in rows])
+        days = np.concatenate([elt[1] for elt in rows])
+        kind = codes[owner]
+        buckets = np.zeros(len(days), dtype=np.int64)
+        for code, period in enumerate(kinds):
+            mask = kind == code
+            buckets[mask] = day_buckets(period, days[mask])
+        relative = buckets - first[owner]
+        valid = (relative >= 0) & (relative < lengths[owner])
+        return (offsets[owner] + relative)[valid]
+
+    counts = np.bincount(positions("Tracker"), minlength=total).astype(np.int64)
+    streaks = np.zeros(total, dtype=bool)
+    streaks[positions("Streaks")] = True
+
+    return {"challenges": challenges, "periods": periods, "first": first, "offsets": offsets, "lengths": lengths,
+            "counts": counts, "streaks": streaks}
+
+
+def segment_starts(history: dict):
+    """
+    Function to find the positions of the first period of every challenge with at least one period.
+    :param history: tracking history (see load_history)
+    :return: mask of the challenges with periods and their start positions
+    """
+    filled = history["lengths"] > 0
+    return filled, history["offsets"][filled]
+
+
+def streak_runs(history: dict):
+    """
+    Function to compute the current and longest run of streaks in a row of all challenges at once.
+    Like analyse.list_streaks, a run is broken by every period without streak.
+    :param history: tracking history (see load_history)
+    :return: numpy arrays of the current and the longest run per challenge
+    """
+    streaks = history["streaks"]
+    hits = streaks.astype(np.int64)
+    filled, starts = segment_starts(history)
+    current = np.zeros(len(filled), dtype=np.int64)
+    longest = np.zeros(len(filled), dtype=np.int64)
+    if len(starts) == 0:
+        return current, longest
+    total = np.cumsum(hits)
+    base = np.where(streaks, 0, total)
+    base[starts] = total[starts] - hits[starts]
+    runs = total - np.maximum.accumulate(base)
+    longest[filled] = np.maximum.reduceat(runs, starts)
+    current[filled] = runs[starts + history["lengths"][filled] - 1]
+    return current, longest
+
+
+def completion_rates(history: dict):
+    """
+    Function to compute the share of periods with a streak of all challenges at once.
+    :param history: tracking history (see load_history)
+    :return: numpy array of completion rates between 0 and 1 per challenge
+    """
+    filled, starts = segment_starts(history)
+    rates = np.zeros(len(filled))
+    if len(starts):
+        rates[filled] = np.add.reduceat(history["streaks"].astype(np.int64), starts) / history["lengths"][filled]
+    return rates
+
+
+def rolling_averages(history: dict, window: int):
+    """
+    Function to compute the rolling average of tracking entries over the last periods of every challenge.
+    At the beginning of a challenge the average is taken over the periods so far.
+    :param history: tracking history (see load_history)
+    :param window: number of periods of the average (e.g. 7)
+    :return: numpy array of the rolling average at every position of the flat arrays
+    """
+    lengths = history["lengths"]
+    position = np.arange(len(history["counts"]))
+    start = np.repeat(history["offsets"], lengths)
+    low = np.maximum(position - window + 1, start)
+    total = np.concatenate(([0], np.cumsum(history["counts"])))
+    return (total[position + 1] - total[low]) / (position + 1 - low)
+
+
+def best_and_worst(history: dict):
+    """
+    Function to find the period with the most and the fewest tracking entries of all challenges at once.
+    On a tie the earliest period is taken.
+    :param history: tracking history (see load_history)
+    :return: numpy arrays of the best and the worst position in the flat arrays per challenge (-1 without periods)
+    """
+    counts = history["counts"]
+    lengths = history["lengths"]
+    filled, starts = segment_starts(history)
+    best = np.full(len(filled), -1, dtype=np.int64)
+    worst = np.full(len(filled), -1, dtype=np.int64)
+    if len(starts) == 0:
+        return best, worst
+    position = np.arange(len(counts))
+    challenge = np.repeat(np.arange(len(lengths)), lengths)
+    for result, extreme in ((best, np.maximum), (worst, np.minimum)):
+        value = np.zeros(len(filled), dtype=np.int64)
+        value[filled] = extreme.reduceat(counts, starts)
+        candidates = np.where(counts == value[challenge], position, len(counts))
+        result[filled] = np.minimum.reduceat(candidates, starts)
+    return best, worst
+
+
+def analyse_user(db: str, user: str):
+    """
+    Function to analyse all challenges of a user at once: streak runs, completion rate, rolling 7- and 30-period
+    averages of the last period and the best and worst period.
+    :param db: an initialized sqlite3 database connection
+    :param user: username to filter challenge entries
+    :return: dictionary with challenge ID as key and a dictionary of the results as value
+    """
+    history = load_history(db, user)
+    current, longest = streak_runs(history)
+    rates = completion_rates(history)
+    best, worst = best_and_worst(history)
+    last = history["offsets"] + history["lengths"] - 1
+    averages = {window: rolling_averages(history, window) for window in (7, 30)}
+
+    result = {}
+    for n, chal in enumerate(history["challenges"]):
+        period = history["periods"][n]
+        entry = {"current": int(current[n]), "longest": int(longest[n]), "completion_rate": float(rates[n]),
+                 "rolling_7": None, "rolling_30": None, "best": None, "worst": None}
+        if history["lengths"][n] > 0:
+            for window in (7, 30):
+                entry[f"rolling_{window}"] = float(averages[window][last[n]])
+            for key, position in (("best", best[n]), ("worst", worst[n])):
+                bucket = int(history["first"][n] + position - history["offsets"][n])
+                entry[key] = (period.label(bucket), int(history["counts"][position]))
+        result[chal.challenge_id] = entry
+    return result
+
+
+def print_overview(db: str, user: str):
+    """
+    Function to print the analysis of all challenges of a user (see analyse_user).
+    :param db: an initialized sqlite3 database connection
+    :param user: username to filter challenge entries
+    :return: none
+    """
+    challenges = {chal.challenge_id: chal for chal in list_challenges(db, user)}
+    print("Habit ; Periodicity ; Current / longest streaks in a row ; Completion ; Avg 7 / 30 periods ; "
+          "Best period ; Worst period")
+    for challenge, entry in analyse_user(db, user).items():
+        chal = challenges[challenge]
+        text = (f"{chal.habit} ; {chal.period} ; {entry['current']} / {entry['longest']}"
+                f" ; {entry['completion_rate']:.0%}")
+        if entry["best"] is not None:
+            text += (f" ; {entry['rolling_7']:.2f} / {entry['rolling_30']:.2f}"
+                     f" ; {entry['best'][0]} ({entry['best'][1]}x) ; {entry['worst'][0]} ({entry['worst'][1]}x)")
+        print(text)
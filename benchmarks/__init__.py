@@ -0,0 +1,4 @@
+"""
+Benchmarks of the habit tracker with synthetic data.
+Run from the project folder with "python -m benchmarks.run".
+"""
@@ -0,0 +1,113 @@
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from database import get_db, get_user_names, get_habits_started, tracks_period
+from due import DueScheduler
+from periods import get_period
+from tracker import Tracker
+from benchmarks.generator import generate
+from benchmarks.run import measure
+
+
+def due_per_challenge(db, user: str, today: date):
+    """
+    Function to find the due challenges of a user without the scheduler: one lookup and one count per challenge,
+    the way the menu checks a single challenge.
+    :param db: an initialized sqlite3 database connection
+    :param user: username
+    :param today: current date
+    :return: list of habit and remaining number of trackings
+    """
+    due = []
+    for habit in get_habits_started(db, user):
+        tracker = Tracker(user)
+        tracker.import_challenge(db, habit)
+        period = get_period(tracker.period)
+        bucket = period.bucket(today)
+        tracked = tracks_period(db, tracker.challengeID, period.first_day(bucket), period.last_day(bucket))
+        if tracked < tracker.interval:
+            due.append((habit, tracker.interval - tracked))
+    return due
+
+
+def run_due(users: int, challenges: int, repeat: int, sample: int, seed: int):
+    """
+    Function to generate a database with users * challenges open challenges and time the scheduler against the
+    lookup per challenge.
+    :param users: number of users
+    :param challenges: number of open challenges per user
+    :param repeat: number of calls per operation
+    :param sample: number of users checked with the lookup per challenge, extrapolated to all users
+    :param seed: seed of the data generator
+    :return: list of results, one dictionary per operation
+    """
+    today = date.today()
+    with tempfile.TemporaryDirectory() as folder:
+        db = get_db(os.path.join(folder, "due.db"))
+        start = time.perf_counter()
+        trackings = generate(db, users, challenges, challenges, 0, seed)
+        results = [{"operation": "generate", "calls": 1, "trackings": trackings,
+                    "mean_ms": (time.perf_counter() - start) * 1000}]
+
+        start = time.perf_counter()
+        scheduler = DueScheduler(db, today)
+        results.append({"operation": "DueScheduler (one pass)", "calls": 1, "challenges": len(scheduler),
+                        "mean_ms": (time.perf_counter() - start) * 1000})
+
+        names = get_user_names(db)
+        start = time.perf_counter()
+        for user in names[:sample]:
+            due_per_challenge(db, user, today)
+        seconds = time.perf_counter() - start
+        results.append({"operation": "lookup per challenge (extrapolated to all users)", "calls": 1,
+                        "sample_users": sample, "mean_ms": seconds * 1000 * len(names) / sample})
+
+        challenge = next(iter(scheduler.entries))
+        operations = {"due(user)": lambda: scheduler.due(names[0]),
+                      "due_all(before=today)": lambda: scheduler.due_all(before=today),
+                      "due_all()": lambda: scheduler.due_all(),
+                      "track": lambda: scheduler.track(challenge, today)}
+        for operation, function in operations.items():
+            results.append(dict(operation=operation, **measure(function, repeat)))
+
+        start = time.perf_counter()
+        reloaded = scheduler.advance(today + timedelta(days=1))
+        results.append({"operation": "advance one day", "calls": 1, "reloaded": reloaded,
+                        "mean_ms": (time.perf_counter() - start) * 1000})
+        db.close()
+    return results
+
+
+def main(argv: list = None):
+    """
+    Entry point of the scheduler benchmark: writes the results as JSON.
+    :param argv: command line arguments, sys.argv by default
+    :return: none
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the due challenge scheduler")
+    parser.add_argument("--users", type=int, default=5000, help="number of users")
+    parser.add_argument("--challenges", type=int, default=20, help="open challenges per user, default 20 (100k in all)")
+    parser.add_argument("--repeat", type=int, default=20, help="calls per operation")
+    parser.add_argument("--sample", type=int, default=100, help="users checked with the lookup per challenge")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="JSON file for the results, printed if not given")
+    args = parser.parse_args(argv)
+
+    report = {"created": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+              "sqlite": sqlite3.sqlite_version, "seed": args.seed,
+              "results": run_due(args.users, args.challenges, args.repeat, min(args.sample, args.users), args.seed)}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+import random
+from datetime import date, timedelta
+from database import safe_user_name, create_habit, transaction
+from importer import import_events
+from periods import get_period
+
+PERIODS = ["daily", "weekly", "monthly"]
+
+
+def generate(db, users: int, habits: int, challenges: int, years: int, seed: int = 1, hit_rate: float = 0.8):
+    """
+    Function to fill a database with synthetic users, habits, challenges and trackings.
+    Every user starts the given number of challenges on random habits with a random period (daily, weekly or monthly)
+    and interval (1 to 3). Each challenge started the given number of years ago and was tracked in most periods since.
+    The same seed always creates the same data.
+    :param db: an initialized sqlite3 database connection
+    :param users: number of users
+    :param habits: number of habits
+    :param challenges: number of challenges per user (at most the number of habits)
+    :param years: number of years of tracking history
+    :param seed: seed of the random generator
+    :param hit_rate: share of the periods in which the interval of the challenge is reached
+    :return: number of created tracking entries
+    """
+    rng = random.Random(seed)
+    today = date.today()
+    start = today - timedelta(days=365 * years)
+    user_names = [f"User{i}" for i in range(users)]
+    habit_names = [f"Habit{i}" for i in range(habits)]
+
+    with transaction(db):
+        for user in user_names:
+            safe_user_name(db, user)
+        for habit in habit_names:
+            create_habit(db, habit, "Synthetic habit " + habit, user_names[0])
+        for user in user_names:
+            for habit in rng.sample(habit_names, min(challenges, habits)):
+                db.execute("""INSERT INTO Challenges (User, Habit, Period, Interval, Start_Date) VALUES (?,?,?,?,?)""",
+                           (user, habit, rng.choice(PERIODS), rng.randint(1, 3), start))
+
+    events = []
+    for user, habit, period_name, interval in db.execute("""SELECT User, Habit, Period, Interval FROM Challenges"""):
+        period = get_period(period_name)
+        for bucket in period.buckets(start, today):
+            first_day = max(period.first_day(bucket), start)
+            days = (min(period.last_day(bucket), today) - first_day).days + 1
+            count = interval if rng.random() < hit_rate else rng.randrange(interval)
+            for i in range(count):
+                events.append((user, habit, str(first_day + timedelta(days=rng.randrange(days)))))
+    import_events(db, events)
+    return len(events)
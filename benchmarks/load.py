@@ -0,0 +1,226 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from urllib.parse import urlencode
+from database import get_db, list_open_challenges, get_user_names
+from benchmarks.generator import generate
+from benchmarks.run import SIZES
+
+"""
+Folder of the service module, the service is started as a separate process like in production.
+"""
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(timings: list, share: float):
+    """
+    Function to find a percentile of latencies (nearest rank).
+    :param timings: sorted latencies
+    :param share: percentile between 0 and 1, e.g. 0.99
+    :return: latency at the percentile
+    """
+    return timings[min(len(timings) - 1, max(0, round(share * len(timings)) - 1))] if timings else None
+
+
+def summarize_timings(timings: list, seconds: float):
+    """
+    Function to summarize the latencies of one kind of request.
+    :param timings: latencies in milliseconds
+    :param seconds: duration of the load run
+    :return: dictionary with number of requests, requests per second and p50, p90, p99 and maximum in milliseconds
+    """
+    timings = sorted(timings)
+    return {"requests": len(timings), "per_second": len(timings) / seconds if seconds else None,
+            "p50_ms": percentile(timings, 0.5), "p90_ms": percentile(timings, 0.9),
+            "p99_ms": percentile(timings, 0.99), "max_ms": timings[-1] if timings else None}
+
+
+async def client(port: int, requests: list, timings: dict, errors: list):
+    """
+    Coroutine of one device: sends its requests one after another over one kept-alive connection.
+    :param port: port of the service
+    :param requests: list of method, path and JSON body
+    :param timings: dictionary of the latencies per endpoint, filled by the client
+    :param errors: list of the responses with a status other than 200, filled by the client
+    :return: none
+    """
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        for method, path, body in requests:
+            payload = json.dumps(body).encode("utf-8") if body is not None else b""
+            start = time.perf_counter()
+            writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                         f"Content-Length: {len(payload)}\r\n\r\n".encode("latin-1") + payload)
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if not line.strip():
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            response = await reader.readexactly(length)
+            timings.setdefault(path.split("?")[0], []).append((time.perf_counter() - start) * 1000)
+            if status != 200:
+                errors.append((status, response.decode("utf-8")))
+    finally:
+        writer.close()
+
+
+def plan(db, requests: int, clients: int, read_share: float, seed: int):
+    """
+    Function to create the requests of all clients: track requests for random open challenges and streak queries
+    of random users.
+    :param db: an initialized sqlite3 database connection
+    :param requests: total number of requests
+    :param clients: number of concurrent clients
+    :param read_share: share of streak queries between 0 and 1
+    :param seed: seed of the random generator
+    :return: list of the requests per client
+    """
+    rng = random.Random(seed)
+    users = get_user_names(db)
+    challenges = [(user, chal.habit) for user in users for chal in list_open_challenges(db, user)]
+    plans = [[] for i in range(clients)]
+    for n in range(requests):
+        if rng.random() < read_share:
+            request = ("GET", "/streaks?" + urlencode({"user": rng.choice(users)}), None)
+        else:
+            user, habit = rng.choice(challenges)
+            request = ("POST", "/track", {"user": user, "habit": habit})
+        plans[n % clients].append(request)
+    return plans
+
+
+def free_port():
+    """
+    Function to find a free local TCP port for the service.
+    :return: port number
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, process, timeout: float = 30.0):
+    """
+    Function to wait until the service accepts connections.
+    :param port: port of the service
+    :param process: process of the service
+    :param timeout: seconds to wait
+    :return: none
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Service stopped with exit code {process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"Service not started after {timeout} seconds")
+
+
+async def stats(port: int):
+    """
+    Coroutine to read the counters of the service (GET /stats).
+    :param port: port of the service
+    :return: dictionary of the counters
+    """
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /stats HTTP/1.1\r\nConnection: close\r\n\r\n")
+    response = await reader.read()
+    writer.close()
+    return json.loads(response.partition(b"\r\n\r\n")[2])
+
+
+def run_load(name: str, requests: int, clients: int, read_share: float, window: float, seed: int):
+    """
+    Function to generate a database, start the service on it and send the requests of all clients concurrently.
+    :param name: name of the data size (see benchmarks.run.SIZES)
+    :param requests: total number of requests
+    :param clients: number of concurrent clients
+    :param read_share: share of streak queries between 0 and 1
+    :param window: batch window of the writer in milliseconds
+    :param seed: seed of the data and request generator
+    :return: dictionary with the settings, throughput and latencies per endpoint and the counters of the service
+    """
+    size = SIZES[name]
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "load.db")
+        db = get_db(path)
+        generate(db, size["users"], size["habits"], size["challenges"], size["years"], seed)
+        plans = plan(db, requests, clients, read_share, seed)
+        db.close()
+
+        port = free_port()
+        process = subprocess.Popen([sys.executable, "service.py", "--db", path, "--port", str(port),
+                                    "--window", str(window)], cwd=ROOT, stdout=subprocess.DEVNULL)
+        try:
+            wait_for_port(port, process)
+            timings = {}
+            errors = []
+
+            async def load():
+                start = time.perf_counter()
+                await asyncio.gather(*(client(port, elt, timings, errors) for elt in plans))
+                seconds = time.perf_counter() - start
+                return seconds, await stats(port)
+
+            seconds, counters = asyncio.run(load())
+        finally:
+            process.terminate()
+            process.wait()
+
+    counters.pop("pool", None)
+    return {"size": name, "clients": clients, "read_share": read_share, "window_ms": window, "seconds": seconds,
+            "per_second": requests / seconds, "errors": len(errors),
+            "all": summarize_timings([elt for values in timings.values() for elt in values], seconds),
+            "endpoints": {path: summarize_timings(values, seconds) for path, values in timings.items()},
+            "service": counters}
+
+
+def main(argv: list = None):
+    """
+    Entry point of the load generator: runs the load for every chosen batch window and writes the results as JSON.
+    :param argv: command line arguments, sys.argv by default
+    :return: none
+    """
+    parser = argparse.ArgumentParser(description="Measure throughput and latency of the HTTP service")
+    parser.add_argument("--size", default="small", choices=list(SIZES), help="size of the generated database")
+    parser.add_argument("--requests", type=int, default=5000, help="total number of requests")
+    parser.add_argument("--clients", type=int, default=50, help="number of concurrent clients")
+    parser.add_argument("--read-share", type=float, default=0.2, help="share of streak queries, default 0.2")
+    parser.add_argument("--windows", default="0,2", help="comma separated batch windows of the writer in ms")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="JSON file for the results, printed if not given")
+    args = parser.parse_args(argv)
+
+    report = {"created": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+              "sqlite": sqlite3.sqlite_version, "cpus": os.cpu_count(), "seed": args.seed, "results": []}
+    for window in args.windows.split(","):
+        report["results"].append(run_load(args.size, args.requests, args.clients, args.read_share, float(window),
+                                          args.seed))
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from analyse import list_streaks
+from database import get_db, get_habits_started, list_challenges
+from main import print_longest_streaks
+from tracker import Tracker
+from benchmarks.generator import generate
+from heatmap import load_heatmap, render_text, render_svg
+
+"""
+Data sizes: number of users, habits, challenges per user and years of tracking.
+"""
+SIZES = {
+    "small": {"users": 2, "habits": 10, "challenges": 5, "years": 1},
+    "medium": {"users": 20, "habits": 50, "challenges": 10, "years": 3},
+    "large": {"users": 100, "habits": 200, "challenges": 20, "years": 5},
+}
+
+
+def measure(function, repeat: int):
+    """
+    Function to time repeated calls of a function. Printed output of the function is discarded.
+    :param function: function without arguments
+    :param repeat: number of calls
+    :return: dictionary with the number of calls and mean, median and minimum time per call in milliseconds
+    """
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(repeat):
+            start = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - start) * 1000)
+    return {"calls": repeat, "mean_ms": statistics.mean(timings), "median_ms": statistics.median(timings),
+            "min_ms": min(timings)}
+
+
+def run_size(name: str, repeat: int, seed: int):
+    """
+    Function to generate a database of the given size and time the main operations on it.
+    :param name: name of the data size (see SIZES)
+    :param repeat: number of calls per operation
+    :param seed: seed of the data generator
+    :return: list of results, one dictionary per operation
+    """
+    size = SIZES[name]
+    with tempfile.TemporaryDirectory() as folder:
+        db = get_db(os.path.join(folder, "benchmark.db"))
+        start = time.perf_counter()
+        trackings = generate(db, size["users"], size["habits"], size["challenges"], size["years"], seed)
+        results = [{"operation": "generate", "calls": 1, "trackings": trackings,
+                    "mean_ms": (time.perf_counter() - start) * 1000}]
+
+        user = "User0"
+        start_day = date.today() - timedelta(days=365 * size["years"])
+        challenges = list_challenges(db, user)
+        tracker = Tracker(user)
+        tracker.import_challenge(db, get_habits_started(db, user)[0])
+        operations = {"Tracker.safe_track": lambda: tracker.safe_track(db, date.today())}
+        for period in ("daily", "weekly", "monthly"):
+            chal = [elt for elt in challenges if elt.period == period]
+            if chal:
+                operations[f"list_streaks {period}"] = (lambda chal_no=chal[0].challenge_id, chal_period=period:
+                                                        list_streaks(db, chal_no, chal_period, "list"))
+        operations["longest streak scan"] = lambda: print_longest_streaks(db, user)
+        operations["get_habits_started"] = lambda: get_habits_started(db, user)
+        operations["list_challenges"] = lambda: list_challenges(db, user)
+        operations["heatmap text"] = lambda: render_text(load_heatmap(db, user, start_day))
+        operations["heatmap svg"] = lambda: render_svg(load_heatmap(db, user, start_day))
+
+        for operation, function in operations.items():
+            results.append(dict(operation=operation, **measure(function, repeat)))
+        db.close()
+    for elt in results:
+        elt["size"] = name
+        elt.update(size)
+    return results
+
+
+def main(argv: list = None):
+    """
+    Entry point of the benchmark: runs all operations for every chosen size and writes the results as JSON.
+    :param argv: command line arguments, sys.argv by default
+    :return: none
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the habit tracker with synthetic data")
+    parser.add_argument("--sizes", default="small,medium", help="comma separated sizes: " + ", ".join(SIZES))
+    parser.add_argument("--repeat", type=int, default=20, help="calls per operation")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="JSON file for the results, printed if not given")
+    args = parser.parse_args(argv)
+
+    report = {"created": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+              "sqlite": sqlite3.sqlite_version, "seed": args.seed, "results": []}
+    for name in args.sizes.split(","):
+        report["results"] += run_size(name, args.repeat, args.seed)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+import inspect
+import itertools
+import sqlite3
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+"""
+Maximum number of cached results of all lookup functions together.
+"""
+MAXSIZE = 512
+
+"""
+Source of the connection tokens (see CachedConnection), a token is never used twice within a program run.
+"""
+tokens = itertools.count(1)
+
+
+class LookupCache:
+    def __init__(self, maxsize: int = MAXSIZE):
+        """
+        Bounded cache for the results of read functions of the database module. The least recently used entry is
+        removed when the cache is full. Entries are invalidated by the write functions of the database module.
+        :param maxsize: maximum number of entries
+        """
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: tuple, version: int):
+        """
+        Function to look up a cached result.
+        :param key: function name, connection token and arguments of the call
+        :param version: data version of the connection (PRAGMA data_version)
+        :return: cached result or None on a miss
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: tuple, version: int, result: list):
+        """
+        Function to store the result of a call.
+        :param key: function name, connection token and arguments of the call
+        :param version: data version of the connection when the result was read
+        :param result: result of the call
+        :return: none
+        """
+        with self.lock:
+            self.entries[key] = (version, result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def drop(self, token: int):
+        """
+        Function to remove the cached results of a connection, e.g. when it is closed.
+        :param token: token of the connection (see CachedConnection)
+        :return: number of removed entries
+        """
+        with self.lock:
+            keys = [key for key in self.entries if key[1] == token]
+            for key in keys:
+                del self.entries[key]
+            return len(keys)
+
+    def invalidate(self, name: str, *args):
+        """
+        Function to remove the cached results of a function for all connections.
+        :param name: name of the function
+        :param args: leading arguments (after the connection) the results are removed for, all results by default
+        :return: number of removed entries
+        """
+        with self.lock:
+            keys = [key for key in self.entries if key[0] == name and key[2][:len(args)] == args]
+            for key in keys:
+                del self.entries[key]
+            return len(keys)
+
+    def clear(self):
+        """
+        Function to remove all entries and reset the counters.
+        :return: none
+        """
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Function to report the counters of the cache.
+        :return: dictionary with hits, misses, current size and maximum size
+        """
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.entries), "maxsize": self.maxsize}
+
+
+lookups = LookupCache()
+
+
+class CachedConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        """
+        sqlite3 connection whose results are cached by cached(). The results are keyed by a token of the connection
+        instead of its id(), which a later connection may get again after this one is closed, and they are removed
+        from the cache when the connection is closed. Connections opened by database.get_db are of this class.
+        """
+        super().__init__(*args, **kwargs)
+        self.token = next(tokens)
+
+    def close(self):
+        lookups.drop(self.token)
+        super().close()
+
+
+def cached(function):
+    """
+    Decorator to cache the results of a read function of the database module, whose first argument is the connection.
+    A result is reused until a write function invalidates it (see invalidate) or another connection commits a
+    change to the database (PRAGMA data_version, also of attached schemas listed in the attribute "schemas" of the
+    connection, see shards.ShardConnection). Reads inside an open transaction are not cached, as the transaction
+    may still be rolled back, and neither are reads of plain sqlite3 connections without token (see
+    CachedConnection). Every call returns a new list, so callers may modify it.
+    :param function: function to wrap
+    :return: wrapped function
+    """
+    name = function.__name__
+    signature = inspect.signature(function)
+
+    @wraps(function)
+    def wrapper(db, *args, **kwargs):
+        if kwargs:
+            args = tuple(signature.bind(db, *args, **kwargs).arguments.values())[1:]
+        token = getattr(db, "token", None)
+        if token is None:
+            return list(function(db, *args))
+        key = (name, token, args)
+        version = db.execute("""PRAGMA data_version""").fetchone()[0]
+        for schema in getattr(db, "schemas", ()):
+            version = version, db.execute(f"""PRAGMA {schema}.data_version""").fetchone()[0]
+        result = lookups.get(key, version)
+        if result is None:
+            result = function(db, *args)
+            if not db.in_transaction:
+                lookups.put(key, version, result)
+        return list(result)
+
+    return wrapper
+
+
+def invalidate(name: str, *args):
+    """
+    Function to remove cached results of a read function after a write.
+    :param name: name of the read function
+    :param args: leading arguments of the results to remove (e.g. the user), all results by default
+    :return: none
+    """
+    lookups.invalidate(name, *args)
+
+
+def stats():
+    """
+    Function to report hits, misses and size of the lookup cache.
+    :return: dictionary with hits, misses, current size and maximum size
+    """
+    return lookups.stats()
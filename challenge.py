@@ -1,18 +1,17 @@
+import records
 from database import start_challenge, stop_challenge
 
 
-class Challenge:
+class Challenge(records.Challenge):
+    __slots__ = ()
+
     def __init__(self, user: str, habit: str):
         """
         Challenge class constructor for started challenges
         :param user: User that started the challenge
         :param habit: Habit on which the challenge was based on
         """
-        self.user = user
-        self.habit = habit
-        self.period = ""
-        self.interval = ""
-        self.db = ""
+        super().__init__(user=user, habit=habit)
 
     def store(self, db: str, period: str, interval: int):
         """
@@ -24,8 +23,7 @@ class Challenge:
         """
         self.period = period
         self.interval = interval
-        self.db = db
-        start_challenge(self.db, self.user, self.habit, self.period, self.interval)
+        start_challenge(db, self.user, self.habit, self.period, self.interval)
 
     def stop(self, db):
         """
@@ -33,5 +31,4 @@ class Challenge:
         :param db: an initialized sqlite3 database connection
         :return: none
         """
-        self.db = db
-        stop_challenge(self.db, self.user, self.habit)
+        stop_challenge(db, self.user, self.habit)
@@ -1,18 +1,126 @@
+import inspect
+import os
+import re
 import sqlite3
+from contextlib import contextmanager
 from datetime import date
+from profiling import profiled, enabled, install
+from cache import cached, invalidate, CachedConnection
+from periods import as_day, calendar_row, sql_calendar_row, anchored_period, PERIODS, JULIAN_OFFSET
+from records import Habit, Challenge, Streak, ChallengeStats, DueChallenge, row_factory
 
 
-def get_db(name: str ="main.db"):
+SCHEMA_VERSION = 8
+PAGE_SIZE = 20
+JOURNAL_MODE = "WAL"
+SYNCHRONOUS = "NORMAL"
+
+"""
+Number of days before today whose tracking entries are kept raw by compact_trackings.
+"""
+COMPACT_HORIZON = 365
+
+"""
+Shortest word of a habit search that is ranked by relevance (see search_habits).
+"""
+RANKED_PREFIX = 3
+
+"""
+Number of open transaction() blocks per connection (by id of the connection).
+"""
+sessions = {}
+
+"""
+Numbers from 1 to the largest count of the TrackerDaily table. Joined with N <= Count, every compacted day is
+repeated once per tracking entry, so that compacted and raw trackings can be read as one list of entries.
+"""
+COPIES = """WITH RECURSIVE Copies(N) AS (SELECT 1 UNION ALL SELECT N + 1 FROM Copies
+WHERE N < (SELECT MAX(Count) FROM TrackerDaily))"""
+
+
+def get_db(name: str ="main.db", journal_mode: str = JOURNAL_MODE, synchronous: str = SYNCHRONOUS, user: str = None,
+           **connect_args):
     """
     Creates and connects a database connection "main.db"
-    :param name: name of the database/sql file with fixed name "main.db"
+    The schema is only migrated when the stored schema version is behind SCHEMA_VERSION.
+    A folder is a sharded layout (see shards.py): the connection goes to the shard of the user, or to the catalog of
+    users and habits without user.
+    :param name: name of the database/sql file with fixed name "main.db" or folder of a sharded layout
+    :param journal_mode: SQLite journal mode of the connection (default WAL)
+    :param synchronous: SQLite synchronous level of the connection (OFF, NORMAL, FULL or EXTRA)
+    :param user: user whose data is read and written, only used for a sharded layout
+    :param connect_args: further arguments for sqlite3.connect, e.g. timeout or check_same_thread
     :return: an initialized sqlite3 database connection
     """
-    db = sqlite3.connect(name)
-    create_tables(db)
+    if os.path.isdir(name):
+        from shards import open_shard
+        return open_shard(name, user, journal_mode, synchronous, **connect_args)
+    connect_args.setdefault("factory", CachedConnection)
+    db = sqlite3.connect(name, **connect_args)
+    if enabled():
+        install(db)
+    db.execute(f"""PRAGMA journal_mode = {journal_mode}""")
+    db.execute(f"""PRAGMA synchronous = {synchronous}""")
+    migrate(db)
     return db
 
 
+@contextmanager
+def transaction(db: str):
+    """
+    Context manager to group several database operations into one transaction (unit of work).
+    The write functions of this module don't commit inside the block, the whole block is committed at its end
+    or rolled back on an exception. Nested blocks join the outer transaction.
+    :param db: an initialized sqlite3 database connection
+    :return: the database connection
+    """
+    key = id(db)
+    if key not in sessions and not db.in_transaction:
+        db.execute("""BEGIN IMMEDIATE""")
+    sessions[key] = sessions.get(key, 0) + 1
+    try:
+        yield db
+    except BaseException:
+        sessions[key] -= 1
+        if sessions[key] == 0:
+            del sessions[key]
+            db.rollback()
+        raise
+    sessions[key] -= 1
+    if sessions[key] == 0:
+        del sessions[key]
+        db.commit()
+
+
+def commit(db: str):
+    """
+    Function to commit the changes of a write function, unless it is called inside a transaction() block.
+    :param db: an initialized sqlite3 database connection
+    :return: none
+    """
+    if id(db) not in sessions:
+        db.commit()
+
+
+def migrate(db: str):
+    """
+    Function to upgrade the schema of a database in place.
+    The applied schema version is kept in "PRAGMA user_version". Every migration step that is newer than the stored
+    version is executed in order and the version is raised after each step.
+    :param db: an initialized sqlite3 database connection
+    :return: schema version of the database after the migration
+    """
+    cur = db.cursor()
+    version = cur.execute("""PRAGMA user_version""").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return version
+    for step in range(version, SCHEMA_VERSION):
+        MIGRATIONS[step](db)
+        cur.execute(f"""PRAGMA user_version = {step + 1}""")
+        db.commit()
+    return SCHEMA_VERSION
+
+
 def create_tables(db: str):
     """
     Creates 5 SQL tables: User, Habits, Challenges, Tracker, Streaks
@@ -68,6 +176,180 @@ def create_tables(db: str):
     db.commit()
 
 
+def create_indexes(db: str):
+    """
+    Creates the indexes used by the tracking and streak lookups:
+    Tracker and Streaks by challenge and date, week/year and month/year, Challenges by user and end date.
+    :param db: an initialized sqlite3 database connection
+    :return: none
+    """
+    cur = db.cursor()
+    for table in ("Tracker", "Streaks"):
+        cur.execute(f"""CREATE INDEX IF NOT EXISTS {table}_Challenge_Date ON {table}(ChallengeID, Date)""")
+        cur.execute(f"""CREATE INDEX IF NOT EXISTS {table}_Challenge_Week ON {table}(ChallengeID, Year, Week)""")
+        cur.execute(f"""CREATE INDEX IF NOT EXISTS {table}_Challenge_Month ON {table}(ChallengeID, Year, Month)""")
+    cur.execute("""CREATE INDEX IF NOT EXISTS Challenges_User_End ON Challenges(User, End_Date)""")
+    db.commit()
+
+
+def create_streak_summary(db: str):
+    """
+    Creates the StreakSummary table with one row per challenge:
+    current run of streaks in a row, longest run, bucket number of the last streak and number of streaks.
+    :param db: an initialized sqlite3 database connection
+    :return: none
+    """
+    cur = db.cursor()
+    cur.execute("""CREATE TABLE IF NOT EXISTS StreakSummary(
+    ChallengeID INTEGER PRIMARY KEY NOT NULL,
+    Current_Run INTEGER NOT NULL,
+    Longest_Run INTEGER NOT NULL,
+    Last_Bucket INTEGER,
+    Completions INTEGER NOT NULL,
+    FOREIGN KEY (ChallengeID) REFERENCES Challenges(Challenge_ID)
+    )""")
+    db.commit()
+
+
+def convert_dates_to_days(db: str):
+    """
+    Converts the Tracker and Streaks tables to compact integer day ordinals (date.toordinal) in the column Day
+    instead of date text and separate week, month and year columns. Week, month and year of every tracked day are
+    kept once in the new Calendar table.
+    :param db: an initialized sqlite3 database connection
+    :return: none
+    """
+    cur = db.cursor()
+    cur.execute("""CREATE TABLE IF NOT EXISTS Calendar(
+    Day INTEGER PRIMARY KEY NOT NULL,
+    Year INTEGER NOT NULL,
+    Month INTEGER NOT NULL,
+    Iso_Year INTEGER NOT NULL,
+    Iso_Week INTEGER NOT NULL,
+    Weekday INTEGER NOT NULL
+    )""")
+    for table, key in (("Tracker", "Tracker_ID"), ("Streaks", "Streak_ID")):
+        cur.execute(f"""CREATE TABLE {table}_Days(
+        {key} INTEGER PRIMARY KEY AUTOINCREMENT,
+        ChallengeID INTEGER NOT NULL,
+        Day INTEGER NOT NULL,
+        FOREIGN KEY (ChallengeID) REFERENCES Challenges(Challenge_ID)
+        )""")
+        cur.execute(f"""INSERT INTO {table}_Days ({key}, ChallengeID, Day)
+        SELECT {key}, ChallengeID, CAST(julianday(Date) - {JULIAN_OFFSET} AS INTEGER) FROM {table}""")
+        cur.execute(f"""DROP TABLE {table}""")
+        cur.execute(f"""ALTER TABLE {table}_Days RENAME TO {table}""")
+        cur.execute(f"""CREATE INDEX IF NOT EXISTS {table}_Challenge_Day ON {table}(ChallengeID, Day)""")
+    days = cur.execute("""SELECT Day FROM Tracker UNION SELECT Day FROM Streaks""").fetchall()
+    extend_calendar(db, [elt[0] for elt in days])
+    db.commit()
+
+
+def extend_calendar(db: str, days):
+    """
+    Function to add days to the Calendar table, if they are missing.
+    :param db: an initialized sqlite3 database connection
+    :param days: iterable of day ordinals
+    :return: none
+    """
+    cur = db.cursor()
+    cur.executemany("""INSERT OR IGNORE INTO Calendar (Day, Year, Month, Iso_Year, Iso_Week, Weekday)
+    VALUES (?,?,?,?,?,?)""", ((day, ) + calendar_row(day) for day in days))
+
+
+def create_page_indexes(db: str):
+    """
+    Creates the indexes for the paginated challenge listings, which read the challenges of a user (and period)
+    ordered by challenge ID. The challenge ID is the rowid, so it is the last column of every index.
+    :param db: an initialized sqlite3 database connection
+    :return: none
+    """
+    cur = db.cursor()
+    cur.execute("""CREATE INDEX IF NOT EXISTS Challenges_User ON Challenges(User)""")
+    cur.execute("""CREATE INDEX IF NOT EXISTS Challenges_User_Period ON Challenges(User, Period)""")
+    db.commit()
+
+
+def create_tracker_daily(db: str):
+    """
+    Creates the TrackerDaily table, which holds the number of tracking entries per challenge and day of the
+    compacted trackings (see compact_trackings). Enabled streak triggers are created again, so that they count the
+    compacted trackings as well.
+    :param db: an initialized sqlite3 database connection
+    :return: none
+    """
+    cur = db.cursor()
+    cur.execute("""CREATE TABLE IF NOT EXISTS TrackerDaily(
+    ChallengeID INTEGER NOT NULL,
+    Day INTEGER NOT NULL,
+    Count INTEGER NOT NULL,
+    PRIMARY KEY (ChallengeID, Day)
+    ) WITHOUT ROWID""")
+    if list_streak_triggers(db):
+        drop_streak_triggers(db)
+        create_streak_triggers(db)
+    db.commit()
+
+
+def create_habit_search(db: str):
+    """
+    Creates the full text index HabitSearch over name and description of the habits, with prefix indexes for the
+    type-ahead search (see search_habits), and the triggers that keep it up to date. The started habits of a user
+    are left out with a partial index of the open challenges by user and habit. The index has its own copy of
+    name and description, as the rowids of the Habit table (primary key Name) may change with VACUUM. Without the
+    FTS5 extension of SQLite, or in a shard file without Habit table (see shards.py), no index is created and
+    search_habits falls back to LIKE.
+    :param db: an initialized sqlite3 database connection
+    :return: none
+    """
+    cur = db.cursor()
+    cur.execute("""CREATE INDEX IF NOT EXISTS Challenges_User_Habit_Open ON Challenges(User, Habit)
+    WHERE End_Date IS NULL""")
+    db.commit()
+    if not cur.execute("""SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'Habit'""").fetchone():
+        return
+    try:
+        cur.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS HabitSearch USING fts5(Name, Description,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3')""")
+    except sqlite3.OperationalError:
+        return
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS Habit_Search_Insert AFTER INSERT ON Habit BEGIN
+    INSERT INTO HabitSearch (Name, Description) VALUES (NEW.Name, NEW.Description);
+    END""")
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS Habit_Search_Update AFTER UPDATE OF Name, Description ON Habit BEGIN
+    UPDATE HabitSearch SET Name = NEW.Name, Description = NEW.Description WHERE Name = OLD.Name;
+    END""")
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS Habit_Search_Delete AFTER DELETE ON Habit BEGIN
+    DELETE FROM HabitSearch WHERE Name = OLD.Name;
+    END""")
+    cur.execute("""INSERT INTO HabitSearch (Name, Description) SELECT Name, Description FROM Habit""")
+    db.commit()
+
+
+def limit_streak_summaries(db: str):
+    """
+    Removes the StreakSummary entries, which counted streaks outside of the periods of their challenge before, so
+    that they are rebuilt on first use (see streaks.user_streak_summaries). Enabled streak triggers are created
+    again with the same limit.
+    :param db: an initialized sqlite3 database connection
+    :return: none
+    """
+    cur = db.cursor()
+    if cur.execute("""SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'StreakSummary'""").fetchone():
+        cur.execute("""DELETE FROM StreakSummary""")
+    if list_streak_triggers(db):
+        drop_streak_triggers(db)
+        create_streak_triggers(db)
+    db.commit()
+
+
+"""
+Migration steps in order of the schema version they lead to. Step n upgrades a database from version n to n+1.
+"""
+MIGRATIONS = [create_tables, create_indexes, create_streak_summary, convert_dates_to_days, create_page_indexes,
+              create_tracker_daily, create_habit_search, limit_streak_summaries]
+
+
 def safe_user_name(db: str, name: str):
     """
     Function to check User table for existing username. In case it doesn't exist, a new username entry is created.
@@ -80,12 +362,15 @@ def safe_user_name(db: str, name: str):
     exists = len(cur.fetchall())
     if exists < 1:
         cur.execute("""INSERT INTO User (Name) VALUES (?)""", (name,))
-        db.commit()
+        invalidate("get_user_names")
+        commit(db)
 
 
+@cached
 def get_user_names(db: str):
     """
     Function to list all created and stored usernames in sqlite3 database
+    The result is cached until a username is added (see cache.cached).
     :param db: an initialized sqlite3 database connection
     :return: list of usernames
     """
@@ -116,12 +401,15 @@ def create_habit(db: str, name: str, description: str, user: str):
         cur.execute("""INSERT INTO Habit
         (Name, Description, Creation_Date, User_Created)
         VALUES (?,?,?,?)""", (name, description, current_date, user))
-        db.commit()
+        invalidate("get_habits")
+        commit(db)
         
         
+@cached
 def get_habits(db: str):
     """
     The function lists the habit names in the Habit table and returns it.
+    The result is cached until a habit is created (see cache.cached).
     :param db: an initialized sqlite3 database connection
     :return: list of habit names in the habit list
     """
@@ -131,11 +419,12 @@ def get_habits(db: str):
     return [elt[0] for elt in habit]
 
 
+@cached
 def get_habits_started(db: str, user: str):
     """
     The funktion lists the challenges in the Challenges table,
     that were started by the logged in user but not stopped, yet.
-    The list is then returned.
+    The list is then returned. It is cached until a challenge of the user is started or stopped (see cache.cached).
     :param db: an initialized sqlite3 database connection
     :param user: logged in user, by whom the list will be filtered
     :return: list of habit names that with an entry in the Challenges table but were not stopped, yet.
@@ -146,16 +435,19 @@ def get_habits_started(db: str, user: str):
     return [elt[0] for elt in habit]
 
 
+@cached
 def get_challenge_for_habit(db: str, user: str, habit: str):
     """
     Function to list and return all entries in Challenges table with a defined habit, stared by a defined user
     and where the challenge was not stopped yet (no end_date).
+    The result is cached until the challenge is started or stopped (see cache.cached).
     :param db: an initialized sqlite3 database connection
     :param user: username that is checked for started challenges
     :param habit: habit for which the challenge list is to be filtered
-    :return: list of filtered entries from Challenges table
+    :return: list of filtered entries from Challenges table as Challenge records
     """
     cur = db.cursor()
+    cur.row_factory = row_factory(Challenge)
     cur.execute("""SELECT * FROM Challenges WHERE Habit = (?) AND User = (?) AND End_Date IS NULL""", (habit, user))
     challenge = cur.fetchall()
     return challenge
@@ -169,15 +461,59 @@ def start_challenge(db: str, user: str, habit: str, period: str, interval: int):
     :param db: an initialized sqlite3 database connection
     :param user: user who started the challenge
     :param habit: the habit on which the challenge is based
-    :param period: the periodicity of the habit to be tracked (e.g. daily)
+    :param period: the periodicity of the habit to be tracked (e.g. daily), periods of a fixed number of days are
+    anchored on the start date (see periods.anchored_period)
     :param interval: The interval of the habit to be tracked (e.g. 2 times per period)
     :return: none
     """
     start_date = date.today()
+    period = anchored_period(period, start_date)
     cur = db.cursor()
     cur.execute("""INSERT INTO Challenges
     (User, Habit, Period, Interval, Start_Date) VALUES (?,?,?,?,?)""", (user, habit, period, interval, start_date))
-    db.commit()
+    invalidate("get_habits_started", user)
+    invalidate("get_challenge_for_habit", user, habit)
+    invalidate("cohort_histograms", habit)
+    commit(db)
+
+
+def restore_habit(db: str, name: str, description: str, creation_date: str, user: str):
+    """
+    Function to add a habit of an export (see exporter.py) with its original creation date, unless the habit exists.
+    :param db: an initialized sqlite3 database connection
+    :param name: name of the habit
+    :param description: a short description of the habit
+    :param creation_date: creation date of the habit (YYYY-MM-DD)
+    :param user: the username that created the habit
+    :return: none
+    """
+    cur = db.cursor()
+    cur.execute("""INSERT OR IGNORE INTO Habit (Name, Description, Creation_Date, User_Created) VALUES (?,?,?,?)""",
+                (name, description, creation_date, user))
+    invalidate("get_habits")
+    commit(db)
+
+
+def restore_challenge(db: str, user: str, habit: str, period: str, interval: int, start_date: str, end_date: str):
+    """
+    Function to add a challenge of an export (see exporter.py) with its original start and end date.
+    :param db: an initialized sqlite3 database connection
+    :param user: user who started the challenge
+    :param habit: the habit on which the challenge is based
+    :param period: the periodicity of the challenge (e.g. daily)
+    :param interval: number of trackings per period
+    :param start_date: start date of the challenge (YYYY-MM-DD)
+    :param end_date: end date of the challenge (YYYY-MM-DD) or None for a started challenge
+    :return: challenge ID of the new challenge
+    """
+    cur = db.cursor()
+    cur.execute("""INSERT INTO Challenges (User, Habit, Period, Interval, Start_Date, End_Date) VALUES (?,?,?,?,?,?)""",
+                (user, habit, period, interval, start_date, end_date))
+    invalidate("get_habits_started", user)
+    invalidate("get_challenge_for_habit", user, habit)
+    invalidate("cohort_histograms", habit)
+    commit(db)
+    return cur.lastrowid
 
 
 def list_challenges(db: str, user: str):
@@ -185,10 +521,12 @@ def list_challenges(db: str, user: str):
     Function to list all challenges of the logged in user in the Challenges table.
     :param db: an initialized sqlite3 database connection
     :param user: username to filter challenge entries
-    :return: list of all challenges in the Challenges table filtered by user
+    :return: list of all challenges in the Challenges table filtered by user as Challenge records
     """
     cur = db.cursor()
-    chall = cur.execute("""SELECT Challenge_ID, Habit, Period, Start_Date, End_Date FROM Challenges WHERE User = (?)""", (user,))
+    cur.row_factory = row_factory(Challenge)
+    chall = cur.execute("""SELECT Challenge_ID, Habit, Period, Start_Date, End_Date FROM Challenges WHERE User = (?)
+    ORDER BY Challenge_ID""", (user,))
     return [elt for elt in chall]
 
 
@@ -197,13 +535,154 @@ def list_open_challenges(db: str, user: str):
     Function to list all challenge entries in the Challenges table for the logged in user, that have no end date.
     :param db: an initialized sqlite3 database connection
     :param user: username to filter challenge entries
-    :return: list of started but not ended challenges
+    :return: list of started but not ended challenges as Challenge records (habit, period and interval)
     """
     cur = db.cursor()
-    chall = cur.execute("""SELECT Habit, Period, Interval FROM Challenges WHERE User = (?) AND End_Date IS NULL """, (user,))
+    cur.row_factory = row_factory(Challenge)
+    chall = cur.execute("""SELECT Habit, Period, Interval FROM Challenges WHERE User = (?) AND End_Date IS NULL
+    ORDER BY Challenge_ID""", (user,))
     return [elt for elt in chall]
 
 
+def list_challenges_page(db: str, user: str, after: int = 0, size: int = PAGE_SIZE):
+    """
+    Function to list one page of the challenges of a user (see list_challenges), ordered by challenge ID.
+    :param db: an initialized sqlite3 database connection
+    :param user: username to filter challenge entries
+    :param after: challenge ID of the last challenge of the previous page
+    :param size: maximum number of challenges of the page
+    :return: list of Challenge records (challenge ID, habit, period, start date and end date) after the given one
+    """
+    cur = db.cursor()
+    cur.row_factory = row_factory(Challenge)
+    cur.execute("""SELECT Challenge_ID, Habit, Period, Start_Date, End_Date FROM Challenges
+    WHERE User = (?) AND Challenge_ID > (?) ORDER BY Challenge_ID LIMIT (?)""", (user, after, size))
+    return cur.fetchall()
+
+
+def list_open_challenges_page(db: str, user: str, after: int = 0, size: int = PAGE_SIZE):
+    """
+    Function to list one page of the started but not ended challenges of a user (see list_open_challenges),
+    ordered by challenge ID.
+    :param db: an initialized sqlite3 database connection
+    :param user: username to filter challenge entries
+    :param after: challenge ID of the last challenge of the previous page
+    :param size: maximum number of challenges of the page
+    :return: list of Challenge records (challenge ID, habit, period and interval) after the given one
+    """
+    cur = db.cursor()
+    cur.row_factory = row_factory(Challenge)
+    cur.execute("""SELECT Challenge_ID, Habit, Period, Interval FROM Challenges
+    WHERE User = (?) AND End_Date IS NULL AND Challenge_ID > (?) ORDER BY Challenge_ID LIMIT (?)""",
+                (user, after, size))
+    return cur.fetchall()
+
+
+def find_challenges_by_period_page(db: str, user: str, period: str, after: int = 0, size: int = PAGE_SIZE):
+    """
+    Function to list one page of the challenges of a user with a given periodicity (see find_challenges_by_period),
+    ordered by challenge ID.
+    :param db: an initialized sqlite3 database connection
+    :param user: logged in user
+    :param period: periodicity to filter challenge entries
+    :param after: challenge ID of the last challenge of the previous page
+    :param size: maximum number of challenges of the page
+    :return: list of Challenge records (challenge ID, habit, period, interval and start date) after the given one
+    """
+    cur = db.cursor()
+    cur.row_factory = row_factory(Challenge)
+    cur.execute("""SELECT Challenge_ID, Habit, Period, Interval, Start_Date FROM Challenges
+    WHERE User = (?) AND Period = (?) AND Challenge_ID > (?) ORDER BY Challenge_ID LIMIT (?)""",
+                (user, period, after, size))
+    return cur.fetchall()
+
+
+def get_habits_page(db: str, after: str = "", size: int = PAGE_SIZE, not_started_by: str = None):
+    """
+    Function to list one page of the habit names (see get_habits), ordered by name.
+    :param db: an initialized sqlite3 database connection
+    :param after: name of the last habit of the previous page
+    :param size: maximum number of habits of the page
+    :param not_started_by: optional username to leave out the habits of the started challenges of the user
+    :return: list of Habit records (name only) after the given one
+    """
+    cur = db.cursor()
+    cur.row_factory = row_factory(Habit)
+    if not_started_by is None:
+        cur.execute("""SELECT Name FROM Habit WHERE Name > (?) ORDER BY Name LIMIT (?)""", (after, size))
+    else:
+        cur.execute("""SELECT Name FROM Habit WHERE Name > (?)
+        AND Name NOT IN (SELECT Habit FROM Challenges WHERE User = (?) AND End_Date IS NULL)
+        ORDER BY Name LIMIT (?)""", (after, not_started_by, size))
+    return cur.fetchall()
+
+
+def habit_search_query(words: list):
+    """
+    Function to turn the words of a search text into an FTS5 query: every word is searched as prefix in name and
+    description and all words must match. Quotes and operators of the text are not interpreted.
+    :param words: words of the typed text
+    :return: FTS5 query
+    """
+    return " ".join('"' + word + '"*' for word in words)
+
+
+def search_habits(db: str, text: str, not_started_by: str = None, size: int = PAGE_SIZE):
+    """
+    Function to search habits by words or word prefixes of name and description with the full text index (see
+    create_habit_search), best matches first, names weighted above descriptions. Words shorter than RANKED_PREFIX
+    match most habits, so they are only searched in the names and returned without ranking, which lets SQLite stop
+    after the first page. The habits of the started challenges of a user are left out with an anti-join. Without the
+    full text index the words are searched with LIKE, ordered by name.
+    :param db: an initialized sqlite3 database connection
+    :param text: typed search text, without words the habits are listed by name
+    :param not_started_by: optional username to leave out the habits of the started challenges of the user
+    :param size: maximum number of habits
+    :return: list of Habit records (name and description)
+    """
+    words = re.findall(r"\w+", text or "")
+    started = """AND NOT EXISTS (SELECT 1 FROM Challenges WHERE User = (?) AND Habit = {name} AND End_Date IS NULL)"""
+    user = [not_started_by] if not_started_by is not None else []
+    cur = db.cursor()
+    cur.row_factory = row_factory(Habit)
+    if words:
+        query = habit_search_query(words)
+        order = """ORDER BY bm25(HabitSearch, 10.0, 1.0), Name"""
+        if max(map(len, words)) < RANKED_PREFIX:
+            query = "Name : (" + query + ")"
+            order = ""
+        try:
+            cur.execute(f"""SELECT Name, Description FROM HabitSearch WHERE HabitSearch MATCH (?)
+            {started.format(name="HabitSearch.Name") if user else ""} {order} LIMIT (?)""", [query] + user + [size])
+            return cur.fetchall()
+        except sqlite3.OperationalError as error:
+            if "no such table" not in str(error):
+                raise
+    likes = " ".join("""AND (Name LIKE (?) OR Description LIKE (?))""" for word in words)
+    parameters = [value for word in words for value in ("%" + word + "%", ) * 2]
+    cur.execute(f"""SELECT Name, Description FROM Habit WHERE 1 {likes}
+    {started.format(name="Habit.Name") if user else ""} ORDER BY Name LIMIT (?)""", parameters + user + [size])
+    return cur.fetchall()
+
+
+def paginate(function, db: str, *args, size: int = PAGE_SIZE):
+    """
+    Generator over the pages of a paginated listing (e.g. list_challenges_page). Each page is only read when it is
+    needed, continuing after the key (e.g. the challenge ID) of the last record of the previous page.
+    :param function: listing function with the parameters after and size
+    :param db: an initialized sqlite3 database connection
+    :param args: further arguments of the listing function (e.g. the user)
+    :param size: number of rows per page
+    :return: yields the pages as lists of rows
+    """
+    page = function(db, *args, size=size)
+    while page:
+        yield page
+        if len(page) < size:
+            break
+        page = function(db, *args, after=page[-1].key, size=size)
+
+
 def stop_challenge(db: str, user: str, habit: str):
     """
     Function to find a started entry in the Challenge table.
@@ -218,7 +697,10 @@ def stop_challenge(db: str, user: str, habit: str):
     cur = db.cursor()
     cur.execute("""UPDATE Challenges SET End_Date = (?) WHERE Habit = (?) AND User = (?)AND End_Date is NULL""",
                     (end_date, habit, user))
-    db.commit()
+    invalidate("get_habits_started", user)
+    invalidate("get_challenge_for_habit", user, habit)
+    invalidate("cohort_histograms", habit)
+    commit(db)
 
 
 def find_challenge_dates(db: str, challenge: int):
@@ -226,13 +708,14 @@ def find_challenge_dates(db: str, challenge: int):
     Function to extract start and end dates from a Challenge table entry.
     :param db: an initialized sqlite3 database connection
     :param challenge: unique identifier of challenge in database (challenge ID)
-    :return: returns a list with start and end date for a given challenge
+    :return: returns start and end date for a given challenge
     """
     cur = db.cursor()
+    cur.row_factory = row_factory(Challenge)
     cur.execute("""SELECT Start_Date, End_Date FROM Challenges WHERE Challenge_ID = (?)""",
                 (challenge, ))
-    dates = cur.fetchall()
-    return dates[0][0], dates[0][1]
+    dates = cur.fetchone()
+    return dates.start_date, dates.end_date
 
 
 def find_challenges_by_period(db, user, period):
@@ -241,29 +724,133 @@ def find_challenges_by_period(db, user, period):
     :param db: an initialized sqlite3 database connection
     :param user: logged in user
     :param period: periodicity (daily, weekly or monthly) to filter challenge entries
-    :return: list of filtered challenge entries
+    :return: list of filtered challenge entries as Challenge records
     """
     cur = db.cursor()
-    chall = cur.execute("""SELECT Challenge_ID, Habit, Period, Interval, Start_Date FROM Challenges WHERE User = (?) AND Period = (?)""",
-                        (user, period))
+    cur.row_factory = row_factory(Challenge)
+    chall = cur.execute("""SELECT Challenge_ID, Habit, Period, Interval, Start_Date FROM Challenges
+    WHERE User = (?) AND Period = (?) ORDER BY Challenge_ID""", (user, period))
     return [elt for elt in chall]
 
 
-def safe_tracking(db: str, date: date, challenge: int, week: int, month: int, year: int):
+def safe_tracking(db: str, date: date, challenge: int):
     """
     Function to safe information from tacker object into sqlite3 database.
     :param db: an initialized sqlite3 database connection
-    :param date: tracking date
+    :param date: tracking date (date, date string or day ordinal)
     :param challenge: unique identifier of challenge in database (challenge ID)
-    :param week: week of tracking date
-    :param month: month of tracking date
-    :param year: year of tracking date
     :return: none
     """
+    day = as_day(date)
+    extend_calendar(db, [day])
     cur = db.cursor()
-    cur.execute("""INSERT INTO Tracker (Date, ChallengeID, Week, Month, Year) VALUES (?,?,?,?,?)""",
-                (date, challenge, week, month, year))
-    db.commit()
+    cur.execute("""INSERT INTO Tracker (Day, ChallengeID) VALUES (?,?)""", (day, challenge))
+    invalidate("cohort_histograms")
+    commit(db)
+
+
+def safe_tracking_in_period(db: str, date: date, challenge: int, period: str, first_day: date, last_day: date):
+    """
+    Function to safe a tracking entry and count the tracking entries of its period with a single statement.
+    If streak triggers are enabled for the period (see create_streak_triggers), the streak and the StreakSummary
+    entry are already stored by the trigger.
+    :param db: an initialized sqlite3 database connection
+    :param date: tracking date (date, date string or day ordinal)
+    :param challenge: unique identifier of challenge in database (challenge ID)
+    :param period: period defined for the challenge (e.g. daily)
+    :param first_day: first date of the period of the tracking date
+    :param last_day: last date of the period of the tracking date
+    :return: number of tracking entries in the period including the new one and True if a streak trigger handled
+    the tracking
+    """
+    day = as_day(date)
+    cur = db.cursor()
+    cur.execute("""INSERT INTO Tracker (Day, ChallengeID) VALUES (?,?) RETURNING
+    (SELECT COUNT(*) FROM Tracker AS Period WHERE Period.ChallengeID = Tracker.ChallengeID
+    AND Period.Day BETWEEN (?) AND (?))
+    + (SELECT COALESCE(SUM(Count), 0) FROM TrackerDaily WHERE TrackerDaily.ChallengeID = Tracker.ChallengeID
+    AND TrackerDaily.Day BETWEEN (?) AND (?)),
+    (SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name = (?))""",
+                (day, challenge, as_day(first_day), as_day(last_day), as_day(first_day), as_day(last_day),
+                 "Tracker_Streak_" + period))
+    tracked, triggered = cur.fetchone()
+    if not triggered:
+        extend_calendar(db, [day])
+    else:
+        invalidate("cohort_histograms")
+    commit(db)
+    return tracked, bool(triggered)
+
+
+def create_streak_triggers(db: str):
+    """
+    Function to enable the streak detection inside SQLite. AFTER INSERT triggers on the Tracker table add the
+    Calendar entry of a new tracking day and, for every registered period that can be computed in SQL, insert the
+    Streaks entry when the number of trackings in the period reaches the interval of the challenge.
+    The StreakSummary entry is advanced by the trigger as well or removed for a later rebuild, if the streak is
+    not after the last streak of the challenge. Streaks outside of the periods between start and end date of the
+    challenge leave the entry unchanged (see streaks.summarize).
+    :param db: an initialized sqlite3 database connection
+    :return: list of the period names with a streak trigger
+    """
+    cur = db.cursor()
+    cur.execute(f"""CREATE TRIGGER IF NOT EXISTS Tracker_Calendar AFTER INSERT ON Tracker BEGIN
+    INSERT OR IGNORE INTO Calendar (Day, Year, Month, Iso_Year, Iso_Week, Weekday)
+    VALUES (NEW.Day, {", ".join(sql_calendar_row("NEW.Day"))});
+    END""")
+    names = []
+    for name, period in PERIODS.items():
+        bucket = period.sql_bucket("NEW.Day")
+        days = period.sql_days("NEW.Day")
+        if bucket is None or days is None or not name.isidentifier():
+            continue
+        run = f"CASE WHEN Last_Bucket = {bucket} - 1 THEN Current_Run + 1 ELSE 1 END"
+        """
+        The period of the tracking is within the challenge, if it ends on or after the start date and begins on or
+        before the end date of the challenge.
+        """
+        start, end = (f"(SELECT CAST(julianday({column}) - {JULIAN_OFFSET} AS INTEGER) FROM Challenges "
+                      f"WHERE Challenge_ID = NEW.ChallengeID)" for column in ("Start_Date", "End_Date"))
+        within = f"{days[1]} >= {start} AND {days[0]} <= COALESCE({end}, {days[0]})"
+        cur.execute(f"""CREATE TRIGGER IF NOT EXISTS Tracker_Streak_{name} AFTER INSERT ON Tracker
+        WHEN (SELECT Period FROM Challenges WHERE Challenge_ID = NEW.ChallengeID) = '{name}'
+        AND (SELECT COUNT(*) FROM Tracker WHERE ChallengeID = NEW.ChallengeID AND Day BETWEEN {days[0]} AND {days[1]})
+        + (SELECT COALESCE(SUM(Count), 0) FROM TrackerDaily WHERE ChallengeID = NEW.ChallengeID
+        AND Day BETWEEN {days[0]} AND {days[1]})
+        = (SELECT Interval FROM Challenges WHERE Challenge_ID = NEW.ChallengeID)
+        BEGIN
+        INSERT INTO Streaks (Day, ChallengeID) VALUES (NEW.Day, NEW.ChallengeID);
+        DELETE FROM StreakSummary WHERE ChallengeID = NEW.ChallengeID AND Last_Bucket >= {bucket} AND {within};
+        UPDATE StreakSummary SET Current_Run = {run}, Longest_Run = MAX(Longest_Run, {run}),
+        Last_Bucket = {bucket}, Completions = Completions + 1 WHERE ChallengeID = NEW.ChallengeID AND {within};
+        END""")
+        names.append(name)
+    commit(db)
+    return names
+
+
+def drop_streak_triggers(db: str):
+    """
+    Function to disable the streak detection inside SQLite again (see create_streak_triggers).
+    :param db: an initialized sqlite3 database connection
+    :return: none
+    """
+    cur = db.cursor()
+    for name in list_streak_triggers(db):
+        cur.execute(f"""DROP TRIGGER IF EXISTS Tracker_Streak_{name}""")
+    cur.execute("""DROP TRIGGER IF EXISTS Tracker_Calendar""")
+    commit(db)
+
+
+def list_streak_triggers(db: str):
+    """
+    Function to list the periods with an enabled streak trigger.
+    :param db: an initialized sqlite3 database connection
+    :return: list of period names
+    """
+    cur = db.cursor()
+    cur.execute("""SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'Tracker_Streak_%'""")
+    return [elt[0][len("Tracker_Streak_"):] for elt in cur.fetchall()]
 
 
 def tracks_today(db: str, challenge: int, date: date):
@@ -275,8 +862,10 @@ def tracks_today(db: str, challenge: int, date: date):
     :return: number of tracking entries for a given challenge at tracking date
     """
     cur = db.cursor()
-    cur.execute("""SELECT * FROM Tracker WHERE ChallengeID = (?) AND Date = (?)""", (challenge, date))
-    number = len(cur.fetchall())
+    cur.execute("""SELECT (SELECT COUNT(*) FROM Tracker WHERE ChallengeID = (?1) AND Day = (?2))
+    + (SELECT COALESCE(SUM(Count), 0) FROM TrackerDaily WHERE ChallengeID = (?1) AND Day = (?2))""",
+                (challenge, as_day(date)))
+    number = cur.fetchone()[0]
     return number
 
 
@@ -290,9 +879,11 @@ def tracks_week(db: str, challenge: int, week: int, year: int):
     :return: number of tracking entries for a given challenge at week+year of tracking date
     """
     cur = db.cursor()
-    cur.execute("""SELECT * FROM Tracker WHERE ChallengeID = (?) AND Week = (?) AND Year = (?)""",
-                (challenge, week, year))
-    number = len(cur.fetchall())
+    cur.execute("""SELECT (SELECT COUNT(*) FROM Tracker JOIN Calendar ON Tracker.Day = Calendar.Day
+    WHERE ChallengeID = (?1) AND Iso_Week = (?2) AND Year = (?3))
+    + (SELECT COALESCE(SUM(Count), 0) FROM TrackerDaily JOIN Calendar ON TrackerDaily.Day = Calendar.Day
+    WHERE ChallengeID = (?1) AND Iso_Week = (?2) AND Year = (?3))""", (challenge, week, year))
+    number = cur.fetchone()[0]
     return number
 
 
@@ -306,27 +897,387 @@ def tracks_month(db: str, challenge: int, month: int, year: int):
     :return: number of tracking entries for a given challenge at month+year of tracking date
     """
     cur = db.cursor()
-    cur.execute("""SELECT * FROM Tracker WHERE ChallengeID = (?) AND Month = (?) AND Year = (?)""",
-                (challenge, month, year))
-    number = len(cur.fetchall())
+    cur.execute("""SELECT (SELECT COUNT(*) FROM Tracker JOIN Calendar ON Tracker.Day = Calendar.Day
+    WHERE ChallengeID = (?1) AND Month = (?2) AND Year = (?3))
+    + (SELECT COALESCE(SUM(Count), 0) FROM TrackerDaily JOIN Calendar ON TrackerDaily.Day = Calendar.Day
+    WHERE ChallengeID = (?1) AND Month = (?2) AND Year = (?3))""", (challenge, month, year))
+    number = cur.fetchone()[0]
     return number
 
 
-def safe_streak(db: str, challenge: int, date: date,  week: int, month: int, year: int):
+def tracks_period(db: str, challenge: int, first_day: date, last_day: date):
+    """
+    Function to count tracking entries to a specific challenge that were tracked between two dates.
+    :param db: an initialized sqlite3 database connection
+    :param challenge: unique identifier of challenge in database (challenge ID)
+    :param first_day: first date of the period
+    :param last_day: last date of the period
+    :return: number of tracking entries for a given challenge within the period
+    """
+    cur = db.cursor()
+    cur.execute("""SELECT (SELECT COUNT(*) FROM Tracker WHERE ChallengeID = (?1) AND Day BETWEEN (?2) AND (?3))
+    + (SELECT COALESCE(SUM(Count), 0) FROM TrackerDaily WHERE ChallengeID = (?1) AND Day BETWEEN (?2) AND (?3))""",
+                (challenge, as_day(first_day), as_day(last_day)))
+    number = cur.fetchone()[0]
+    return number
+
+
+def stage_trackings(db: str, trackings):
+    """
+    Function to collect many tracking entries for a bulk import in the temporary table Tracker_Import,
+    which has no indexes.
+    :param db: an initialized sqlite3 database connection
+    :param trackings: iterable of day ordinal and challenge ID of the tracking entries
+    :return: none
+    """
+    cur = db.cursor()
+    cur.execute("""CREATE TEMP TABLE IF NOT EXISTS Tracker_Import(
+    ChallengeID INTEGER NOT NULL,
+    Day INTEGER NOT NULL
+    )""")
+    cur.executemany("""INSERT INTO Tracker_Import (Day, ChallengeID) VALUES (?,?)""", trackings)
+    commit(db)
+
+
+def insert_staged_trackings(db: str):
+    """
+    Function to move the entries of the temporary table Tracker_Import (see stage_trackings) into the Tracker table.
+    The entries are inserted sorted by challenge and day, so that the index is filled in order.
+    :param db: an initialized sqlite3 database connection
+    :return: none
+    """
+    cur = db.cursor()
+    days = cur.execute("""SELECT DISTINCT Day FROM Tracker_Import""").fetchall()
+    extend_calendar(db, [elt[0] for elt in days])
+    cur.execute("""INSERT INTO Tracker (Day, ChallengeID)
+    SELECT Day, ChallengeID FROM Tracker_Import ORDER BY ChallengeID, Day""")
+    cur.execute("""DELETE FROM Tracker_Import""")
+    invalidate("cohort_histograms")
+    commit(db)
+
+
+def compact_trackings(db: str, horizon: int = COMPACT_HORIZON, archive: str = None, today: date = None):
+    """
+    Function to roll the raw tracking entries older than the horizon up into the TrackerDaily table, one row with
+    the number of entries per challenge and day. The counting functions (e.g. tracks_period) add the compacted
+    counts to the raw entries, so their results don't change. Optionally the raw entries are moved to the Tracker
+    table of an archive file. The freed pages are reused by new entries, reclaim_space returns them to the system.
+    Must not be called inside a transaction() block, as the archive is attached to the connection.
+    :param db: an initialized sqlite3 database connection
+    :param horizon: number of days before today whose tracking entries stay raw
+    :param archive: optional name of the archive database/sql file, created if missing
+    :param today: date the horizon is counted back from, today by default
+    :return: number of compacted tracking entries
+    """
+    cutoff = as_day(today or date.today()) - horizon
+    cur = db.cursor()
+    if archive is not None:
+        cur.execute("""ATTACH DATABASE (?) AS archive""", (archive, ))
+        cur.execute("""CREATE TABLE IF NOT EXISTS archive.Tracker(
+        Tracker_ID INTEGER NOT NULL,
+        ChallengeID INTEGER NOT NULL,
+        Day INTEGER NOT NULL
+        )""")
+    try:
+        with transaction(db):
+            if archive is not None:
+                cur.execute("""INSERT INTO archive.Tracker (Tracker_ID, ChallengeID, Day)
+                SELECT Tracker_ID, ChallengeID, Day FROM main.Tracker WHERE Day < (?)""", (cutoff, ))
+            cur.execute("""INSERT INTO main.TrackerDaily (ChallengeID, Day, Count)
+            SELECT ChallengeID, Day, COUNT(*) FROM main.Tracker WHERE Day < (?) GROUP BY ChallengeID, Day
+            ON CONFLICT (ChallengeID, Day) DO UPDATE SET Count = Count + excluded.Count""", (cutoff, ))
+            cur.execute("""DELETE FROM main.Tracker WHERE Day < (?)""", (cutoff, ))
+            compacted = cur.rowcount
+    finally:
+        if archive is not None:
+            cur.execute("""DETACH DATABASE archive""")
+    return compacted
+
+
+def reclaim_space(db: str, incremental: bool = False):
+    """
+    Function to return the free pages of the database file to the file system, e.g. after compact_trackings.
+    VACUUM rewrites the whole file. The incremental mode switches the file to auto_vacuum = INCREMENTAL, which needs
+    one VACUUM, and afterwards only releases the free pages at the end of the file with incremental_vacuum.
+    Must not be called inside a transaction() block.
+    :param db: an initialized sqlite3 database connection
+    :param incremental: use incremental_vacuum instead of a full VACUUM
+    :return: number of pages returned to the file system, 0 if the pointer map pages of auto_vacuum outweigh them
+    """
+    cur = db.cursor()
+    pages = cur.execute("""PRAGMA main.page_count""").fetchone()[0]
+    if incremental:
+        if cur.execute("""PRAGMA main.auto_vacuum""").fetchone()[0] != 2:
+            cur.execute("""PRAGMA main.auto_vacuum = INCREMENTAL""")
+            cur.execute("""VACUUM main""")
+        cur.execute("""PRAGMA main.incremental_vacuum""").fetchall()
+    else:
+        cur.execute("""VACUUM main""")
+    return max(pages - cur.execute("""PRAGMA main.page_count""").fetchone()[0], 0)
+
+
+def find_tracking_days(db: str, challenge: int):
+    """
+    Function to list the days of all tracking entries of a challenge in the order they were tracked.
+    Compacted trackings (see compact_trackings) are older than the raw entries and come first, ordered by day.
+    :param db: an initialized sqlite3 database connection
+    :param challenge: unique identifier of challenge in database (challenge ID)
+    :return: list of tracking days (day ordinals)
+    """
+    cur = db.cursor()
+    cur.execute("""SELECT Day, Count FROM TrackerDaily WHERE ChallengeID = (?) ORDER BY Day""", (challenge, ))
+    days = [elt[0] for elt in cur.fetchall() for _ in range(elt[1])]
+    cur.execute("""SELECT Day FROM Tracker WHERE ChallengeID = (?) ORDER BY Tracker_ID""", (challenge, ))
+    return days + [elt[0] for elt in cur.fetchall()]
+
+
+def insert_streaks(db: str, streaks):
+    """
+    Function to add many entries to the Streaks table, e.g. of an export.
+    :param db: an initialized sqlite3 database connection
+    :param streaks: iterable of day ordinal and challenge ID of the streak entries
+    :return: none
+    """
+    cur = db.cursor()
+    cur.executemany("""INSERT INTO Streaks (Day, ChallengeID) VALUES (?,?)""", streaks)
+    invalidate("cohort_histograms")
+    commit(db)
+
+
+def replace_streaks(db: str, challenge: int, days: list):
+    """
+    Function to replace all entries of the Streaks table of a challenge.
+    :param db: an initialized sqlite3 database connection
+    :param challenge: unique identifier of challenge in database (challenge ID)
+    :param days: list of the days (day ordinals) of the new streak entries
+    :return: none
+    """
+    cur = db.cursor()
+    cur.execute("""DELETE FROM Streaks WHERE ChallengeID = (?)""", (challenge, ))
+    cur.executemany("""INSERT INTO Streaks (Day, ChallengeID) VALUES (?,?)""", ((day, challenge) for day in days))
+    invalidate("cohort_histograms")
+    commit(db)
+
+
+def safe_streak(db: str, challenge: int, date: date, summary: tuple = None):
     """
     Function to safe accomplished streak entry in a challenge into the "Streaks" table
     :param db: an initialized sqlite3 database connection
     :param challenge: unique identifier of challenge in database (challenge ID)
-    :param date: tracking date
-    :param week: week of tracking date
-    :param month: month of tracking date
-    :param year: year of tracking date
+    :param date: tracking date (date, date string or day ordinal)
+    :param summary: optional new StreakSummary entry (current run, longest run, last bucket, completions),
+    stored together with the streak
     :return: none
     """
     cur = db.cursor()
-    cur.execute("""INSERT INTO Streaks (Date, ChallengeID, Week, Month, Year) VALUES (?,?,?,?,?)""",
-                (date, challenge, week, month, year))
-    db.commit()
+    cur.execute("""INSERT INTO Streaks (Day, ChallengeID) VALUES (?,?)""", (as_day(date), challenge))
+    if summary is not None:
+        cur.execute("""INSERT OR REPLACE INTO StreakSummary
+        (ChallengeID, Current_Run, Longest_Run, Last_Bucket, Completions) VALUES (?,?,?,?,?)""",
+                    (challenge, ) + tuple(summary))
+    invalidate("cohort_histograms")
+    commit(db)
+
+
+def safe_streak_summaries(db: str, summaries: list):
+    """
+    Function to replace entries of the StreakSummary table
+    :param db: an initialized sqlite3 database connection
+    :param summaries: list of challenge ID, current run, longest run, last bucket and completions
+    :return: none
+    """
+    cur = db.cursor()
+    cur.executemany("""INSERT OR REPLACE INTO StreakSummary
+    (ChallengeID, Current_Run, Longest_Run, Last_Bucket, Completions) VALUES (?,?,?,?,?)""", summaries)
+    commit(db)
+
+
+def get_streak_summary(db: str, challenge: int):
+    """
+    Function to read the StreakSummary entry of a challenge
+    :param db: an initialized sqlite3 database connection
+    :param challenge: unique identifier of challenge in database (challenge ID)
+    :return: current run, longest run, last bucket and completions or None if there is no entry
+    """
+    cur = db.cursor()
+    cur.execute("""SELECT Current_Run, Longest_Run, Last_Bucket, Completions FROM StreakSummary
+    WHERE ChallengeID = (?)""", (challenge, ))
+    return cur.fetchone()
+
+
+def get_streak_summaries_for_user(db: str, user: str):
+    """
+    Function to list all challenges of a user together with their StreakSummary entry
+    :param db: an initialized sqlite3 database connection
+    :param user: username to filter challenge entries
+    :return: list of challenge ID, period, current run, longest run, last bucket and completions.
+    The summary values are None for challenges without a StreakSummary entry.
+    """
+    cur = db.cursor()
+    cur.execute("""SELECT Challenges.Challenge_ID, Challenges.Period, StreakSummary.Current_Run,
+    StreakSummary.Longest_Run, StreakSummary.Last_Bucket, StreakSummary.Completions
+    FROM Challenges LEFT JOIN StreakSummary ON Challenges.Challenge_ID = StreakSummary.ChallengeID
+    WHERE Challenges.User = (?)""", (user, ))
+    return cur.fetchall()
+
+
+def list_all_challenges(db: str):
+    """
+    Function to list the challenge ID, period, start and end date of all challenges of all users
+    :param db: an initialized sqlite3 database connection
+    :return: list of Challenge records (challenge ID, period, start and end date)
+    """
+    cur = db.cursor()
+    cur.row_factory = row_factory(Challenge)
+    cur.execute("""SELECT Challenge_ID, Period, Start_Date, End_Date FROM Challenges""")
+    return cur.fetchall()
+
+
+def find_all_streaks(db: str):
+    """
+    Function to list all entries of the Streaks table of all challenges with a single query
+    :param db: an initialized sqlite3 database connection
+    :return: list of Streak records (challenge ID and day ordinal) of every streak
+    """
+    cur = db.cursor()
+    cur.row_factory = row_factory(Streak)
+    cur.execute("""SELECT ChallengeID, Day FROM Streaks""")
+    return cur.fetchall()
+
+
+def find_days_for_user(db: str, user: str, table: str = "Tracker"):
+    """
+    Function to list the days of all tracking or streak entries of all challenges of a user with a single query.
+    The days are joined to one text per challenge, which is much faster to read than one row per entry.
+    :param db: an initialized sqlite3 database connection
+    :param user: username to filter challenge entries
+    :param table: "Tracker" for tracking entries or "Streaks" for streak entries
+    :return: list of challenge ID and comma separated days (day ordinals) of every challenge with entries
+    """
+    if table not in ("Tracker", "Streaks"):
+        raise ValueError(f"Unknown table {table}")
+    cur = db.cursor()
+    if table == "Tracker":
+        cur.execute(COPIES + """ SELECT Challenge_ID, (SELECT group_concat(Day) FROM (
+        SELECT Day FROM TrackerDaily JOIN Copies ON N <= Count WHERE ChallengeID = Challenge_ID
+        UNION ALL SELECT Day FROM Tracker WHERE ChallengeID = Challenge_ID))
+        FROM Challenges WHERE User = (?)""", (user, ))
+    else:
+        cur.execute(f"""SELECT Challenge_ID, (SELECT group_concat(Day) FROM {table} WHERE ChallengeID = Challenge_ID)
+        FROM Challenges WHERE User = (?)""", (user, ))
+    return [elt for elt in cur.fetchall() if elt[1] is not None]
+
+
+def stream_table(db: str, table: str, user: str = None, challenge: int = None, first_day: date = None,
+                 last_day: date = None, chunk_size: int = 1000):
+    """
+    Generator over the rows of a table for an export, read in chunks with fetchmany, so that the memory use does not
+    depend on the size of the table. Tracker and Streaks rows are returned with user, habit and date of the entry.
+    Compacted trackings (see compact_trackings) are returned first, once per tracking entry.
+    :param db: an initialized sqlite3 database connection
+    :param table: User, Habit, Challenges, Tracker or Streaks
+    :param user: optional username to export only the data of a user
+    :param challenge: optional challenge ID to export only the data of a challenge
+    :param first_day: optional first date of the exported Tracker and Streaks entries
+    :param last_day: optional last date of the exported Tracker and Streaks entries
+    :param chunk_size: number of rows fetched at once
+    :return: yields the rows of the table
+    """
+    conditions = []
+    params = []
+    queries = []
+    if user is not None:
+        conditions.append("Challenges.User = (?)")
+        params.append(user)
+    if challenge is not None:
+        conditions.append("Challenges.Challenge_ID = (?)")
+        params.append(challenge)
+
+    if table == "User":
+        query = """SELECT Name FROM User"""
+        if conditions:
+            query += """ WHERE Name IN (SELECT User FROM Challenges WHERE """ + " AND ".join(conditions) + ")"
+            if challenge is None:
+                query += """ OR Name = (?)"""
+                params.append(user)
+    elif table == "Habit":
+        query = """SELECT Name, Description, Creation_Date, User_Created FROM Habit"""
+        if conditions:
+            query += """ WHERE Name IN (SELECT Habit FROM Challenges WHERE """ + " AND ".join(conditions) + ")"
+            if challenge is None:
+                query += """ OR User_Created = (?)"""
+                params.append(user)
+    elif table == "Challenges":
+        query = """SELECT Challenge_ID, User, Habit, Period, Interval, Start_Date, End_Date FROM Challenges"""
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY Challenge_ID"
+    elif table in ("Tracker", "Streaks"):
+        key = "Tracker_ID" if table == "Tracker" else "Streak_ID"
+        if first_day is not None:
+            conditions.append(f"{table}.Day >= (?)")
+            params.append(as_day(first_day))
+        if last_day is not None:
+            conditions.append(f"{table}.Day <= (?)")
+            params.append(as_day(last_day))
+        fields = f"""{table}.ChallengeID, Challenges.User, Challenges.Habit, date({table}.Day + {JULIAN_OFFSET})"""
+        join = f"""JOIN Challenges ON {table}.ChallengeID = Challenges.Challenge_ID"""
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        query = f"""SELECT {fields} FROM {table} {join}{where} ORDER BY {table}.{key}"""
+        if table == "Tracker":
+            queries.append((COPIES + f""" SELECT {fields} FROM TrackerDaily AS Tracker JOIN Copies ON N <= Count
+            {join}{where} ORDER BY Tracker.ChallengeID, Tracker.Day""", params))
+    else:
+        raise ValueError(f"Unknown table {table}")
+
+    cur = db.cursor()
+    for query, params in queries + [(query, params)]:
+        cur.execute(query, params)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield from rows
+
+
+def list_challenges_in_range(db: str, first_id: int, last_id: int):
+    """
+    Function to list the challenges of all users within a range of challenge IDs, e.g. a shard of a leaderboard
+    :param db: an initialized sqlite3 database connection
+    :param first_id: first challenge ID of the range
+    :param last_id: last challenge ID of the range
+    :return: list of Challenge records (challenge ID, user, habit, period, start date and end date)
+    """
+    cur = db.cursor()
+    cur.row_factory = row_factory(Challenge)
+    cur.execute("""SELECT Challenge_ID, User, Habit, Period, Start_Date, End_Date FROM Challenges
+    WHERE Challenge_ID BETWEEN (?) AND (?) ORDER BY Challenge_ID""", (first_id, last_id))
+    return cur.fetchall()
+
+
+def list_challenge_ids(db: str):
+    """
+    Function to list the IDs of all challenges of all users in ascending order
+    :param db: an initialized sqlite3 database connection
+    :return: list of challenge IDs
+    """
+    cur = db.cursor()
+    cur.execute("""SELECT Challenge_ID FROM Challenges ORDER BY Challenge_ID""")
+    return [elt[0] for elt in cur.fetchall()]
+
+
+def find_streaks_in_range(db: str, first_id: int, last_id: int):
+    """
+    Function to list the streak entries of all challenges within a range of challenge IDs with a single query
+    :param db: an initialized sqlite3 database connection
+    :param first_id: first challenge ID of the range
+    :param last_id: last challenge ID of the range
+    :return: list of Streak records (challenge ID and day ordinal) of every streak
+    """
+    cur = db.cursor()
+    cur.row_factory = row_factory(Streak)
+    cur.execute("""SELECT ChallengeID, Day FROM Streaks WHERE ChallengeID BETWEEN (?) AND (?)""", (first_id, last_id))
+    return cur.fetchall()
 
 
 def find_streak(db: str, challenge: int, date: date):
@@ -338,9 +1289,9 @@ def find_streak(db: str, challenge: int, date: date):
     :return: streak yes or no at given date
     """
     cur = db.cursor()
-    cur.execute("""SELECT * FROM Streaks WHERE ChallengeID = (?) AND Date = (?)""",
-                (challenge, date))
-    streak = cur.fetchall()
+    cur.execute("""SELECT 1 FROM Streaks WHERE ChallengeID = (?) AND Day = (?)""",
+                (challenge, as_day(date)))
+    streak = cur.fetchmany(1)
     check = "yes"
     if streak == []:
         check = "no"
@@ -359,9 +1310,9 @@ def find_streak_week(db, challenge, week, year):
     :return: streak yes or no at given date
     """
     cur = db.cursor()
-    cur.execute("""SELECT * FROM Streaks WHERE ChallengeID = (?) AND Week = (?) AND Year = (?)""",
-                (challenge, week, year))
-    streak = cur.fetchall()
+    cur.execute("""SELECT 1 FROM Streaks JOIN Calendar ON Streaks.Day = Calendar.Day
+    WHERE ChallengeID = (?) AND Iso_Week = (?) AND Year = (?)""", (challenge, week, year))
+    streak = cur.fetchmany(1)
     check = "yes"
     if streak == []:
         check = "no"
@@ -380,9 +1331,9 @@ def find_streak_month(db, challenge, month, year):
     :return: streak yes or no at given date
     """
     cur = db.cursor()
-    cur.execute("""SELECT * FROM Streaks WHERE ChallengeID = (?) AND Month = (?) AND Year = (?)""",
-                (challenge, month, year))
-    streak = cur.fetchall()
+    cur.execute("""SELECT 1 FROM Streaks JOIN Calendar ON Streaks.Day = Calendar.Day
+    WHERE ChallengeID = (?) AND Month = (?) AND Year = (?)""", (challenge, month, year))
+    streak = cur.fetchmany(1)
     check = "yes"
     if streak == []:
         check = "no"
@@ -390,3 +1341,222 @@ def find_streak_month(db, challenge, month, year):
         check = "streak"
     return check
 
+
+
+def find_streaks(db: str, challenge: int):
+    """
+    Function to list the days of all entries of the Streaks table for a challenge with a single query
+    :param db: an initialized sqlite3 database connection
+    :param challenge: unique identifier of challenge in database (challenge ID)
+    :return: list of days (day ordinals) of every streak of the challenge
+    """
+    cur = db.cursor()
+    cur.execute("""SELECT Day FROM Streaks WHERE ChallengeID = (?)""", (challenge, ))
+    return [elt[0] for elt in cur.fetchall()]
+
+
+def count_buckets_for_user(db: str, user: str, bucket: str, first_day: date, last_day: date):
+    """
+    Function to count the tracking entries of all challenges of a user per period (e.g. day, week or month) with a
+    single GROUP BY over trackings, compacted trackings (see compact_trackings) and streaks, and to mark the periods
+    with a streak entry.
+    :param db: an initialized sqlite3 database connection
+    :param user: username to filter challenge entries
+    :param bucket: SQL expression of the period number of the column Day (see periods.Period.sql_bucket)
+    :param first_day: first date of the counted entries
+    :param last_day: last date of the counted entries
+    :return: list of challenge ID, period number, number of tracking entries and 1 if the period has a streak else 0,
+    ordered by challenge and period
+    """
+    cur = db.cursor()
+    selected = """ChallengeID IN (SELECT Challenge_ID FROM Challenges WHERE User = (?1))
+    AND Day BETWEEN (?2) AND (?3)"""
+    cur.execute(f"""SELECT ChallengeID, {bucket} AS Bucket, SUM(Trackings), MAX(Streak) FROM (
+    SELECT ChallengeID, Day, 1 AS Trackings, 0 AS Streak FROM Tracker WHERE {selected}
+    UNION ALL SELECT ChallengeID, Day, Count, 0 FROM TrackerDaily WHERE {selected}
+    UNION ALL SELECT ChallengeID, Day, 0, 1 FROM Streaks WHERE {selected})
+    GROUP BY ChallengeID, Bucket ORDER BY ChallengeID, Bucket""", (user, as_day(first_day), as_day(last_day)))
+    return cur.fetchall()
+
+
+def sql_challenge_bucket(day: str):
+    """
+    Function to build the SQL expression of the bucket number of a day in the period of a challenge (column Period)
+    for every registered period that is available in SQL (see periods.Period.sql_bucket).
+    :param day: SQL expression of a day ordinal
+    :return: SQL expression of the bucket number, NULL for periods that are only available in Python
+    """
+    cases = " ".join(f"WHEN '{name}' THEN {period.sql_bucket(day)}" for name, period in PERIODS.items()
+                     if period.sql_bucket(day) is not None and name.isidentifier())
+    return f"(CASE Period {cases} ELSE NULL END)"
+
+
+def sql_challenge_statistics(condition: str):
+    """
+    Function to build the query of the statistics of the challenges matching a condition, computed set-based:
+    the elapsed periods from the bucket numbers of start and end date, the periods with a streak as the distinct
+    streak buckets within them, the longest run of streaks in a row as the largest group of consecutive buckets
+    (bucket number minus ROW_NUMBER() is the same within a run) and the tracking entries including compacted ones.
+    Challenges with a period that is only available in Python are left out, see list_python_period_challenges.
+    :param condition: SQL condition on the Challenges table with named parameters, the parameter today is the end
+    date of open challenges
+    :return: SQL query with the columns of records.ChallengeStats
+    """
+    return f"""WITH Bounds AS (
+    SELECT Challenge_ID, User, Habit, Period, CAST(julianday(Start_Date) - {JULIAN_OFFSET} AS INTEGER) AS First_Day,
+    CAST(julianday(COALESCE(End_Date, :today)) - {JULIAN_OFFSET} AS INTEGER) AS Last_Day
+    FROM Challenges WHERE {condition}),
+    Ranges AS (
+    SELECT *, {sql_challenge_bucket("First_Day")} AS First_Bucket, {sql_challenge_bucket("Last_Day")} AS Last_Bucket
+    FROM Bounds),
+    Hits AS (
+    SELECT DISTINCT Challenge_ID, Bucket FROM (
+    SELECT Challenge_ID, First_Bucket, Last_Bucket, {sql_challenge_bucket("Streaks.Day")} AS Bucket
+    FROM Ranges JOIN Streaks ON Streaks.ChallengeID = Ranges.Challenge_ID)
+    WHERE Bucket BETWEEN First_Bucket AND Last_Bucket),
+    Runs AS (
+    SELECT Challenge_ID, SUM(Length) AS Completions, MAX(Length) AS Longest FROM (
+    SELECT Challenge_ID, COUNT(*) AS Length FROM (
+    SELECT Challenge_ID, Bucket - ROW_NUMBER() OVER (PARTITION BY Challenge_ID ORDER BY Bucket) AS Run FROM Hits)
+    GROUP BY Challenge_ID, Run)
+    GROUP BY Challenge_ID),
+    Tracked AS (
+    SELECT ChallengeID, SUM(Entries) AS Trackings FROM (
+    SELECT ChallengeID, COUNT(*) AS Entries FROM Tracker
+    WHERE ChallengeID IN (SELECT Challenge_ID FROM Ranges) GROUP BY ChallengeID
+    UNION ALL SELECT ChallengeID, SUM(Count) FROM TrackerDaily
+    WHERE ChallengeID IN (SELECT Challenge_ID FROM Ranges) GROUP BY ChallengeID)
+    GROUP BY ChallengeID),
+    Statistics AS (
+    SELECT Ranges.Challenge_ID, User, Habit, Period, MAX(Last_Bucket - First_Bucket + 1, 0) AS Elapsed,
+    COALESCE(Completions, 0) AS Completions, COALESCE(Trackings, 0) AS Trackings, COALESCE(Longest, 0) AS Longest
+    FROM Ranges LEFT JOIN Runs ON Runs.Challenge_ID = Ranges.Challenge_ID
+    LEFT JOIN Tracked ON Tracked.ChallengeID = Ranges.Challenge_ID
+    WHERE First_Bucket IS NOT NULL)
+    SELECT Challenge_ID, User, Habit, Period, Elapsed, Completions,
+    CASE WHEN Elapsed > 0 THEN CAST(ROUND(100.0 * Completions / Elapsed) AS INTEGER) ELSE 0 END AS Completion_Percent,
+    Trackings, Longest FROM Statistics"""
+
+
+def challenge_statistics(db: str, user: str, today: date = None):
+    """
+    Function to compute completion rate, trackings per period and longest run of streaks in a row of all challenges
+    of a user with a single query (see sql_challenge_statistics).
+    :param db: an initialized sqlite3 database connection
+    :param user: username to filter challenge entries
+    :param today: end date of open challenges, today by default
+    :return: list of ChallengeStats records ordered by challenge ID
+    """
+    cur = db.cursor()
+    cur.row_factory = row_factory(ChallengeStats)
+    cur.execute(sql_challenge_statistics("User = :user") + " ORDER BY Challenge_ID",
+                {"user": user, "today": str(today or date.today())})
+    return cur.fetchall()
+
+
+def list_python_period_challenges(db: str, user: str = None, habit: str = None):
+    """
+    Function to list the challenges of a user or on a habit whose period is not available in SQL, which are left
+    out by sql_challenge_statistics: periods that are only available in Python (e.g. every 3 days from 2024-01-05)
+    and unknown periods.
+    :param db: an initialized sqlite3 database connection
+    :param user: username to filter challenge entries
+    :param habit: name of the habit to filter challenge entries
+    :return: list of Challenge records ordered by challenge ID
+    """
+    names = ", ".join(f"'{name}'" for name, period in PERIODS.items()
+                      if period.sql_bucket("Day") is not None and name.isidentifier())
+    condition = "User = :user" if user is not None else "Habit = :habit"
+    cur = db.cursor()
+    cur.row_factory = row_factory(Challenge)
+    cur.execute(f"""SELECT Challenge_ID, User, Habit, Period, Interval, Start_Date, End_Date FROM Challenges
+    WHERE {condition} AND Period NOT IN ({names}) ORDER BY Challenge_ID""", {"user": user, "habit": habit})
+    return cur.fetchall()
+
+
+@cached
+def cohort_histograms(db: str, habit: str, today: date):
+    """
+    Function to count the challenges of all users on a habit per longest run of streaks in a row and per completion
+    rate in percent. Both histograms are grouped from the same materialized statistics, so the cohort is computed once.
+    Their size depends on the number of distinct values and not on the number of users, so percentiles are looked up
+    quickly (see stats.percentile). Results are cached until a challenge, tracking or streak is written.
+    :param db: an initialized sqlite3 database connection
+    :param habit: name of the habit of the cohort
+    :param today: end date of open challenges
+    :return: list of measure ("completion" or "longest"), value and number of challenges, ordered by measure and value
+    """
+    cur = db.cursor()
+    cur.execute(f"""WITH Cohort AS MATERIALIZED ({sql_challenge_statistics("Habit = :habit")})
+    SELECT 'longest', Longest, COUNT(*) FROM Cohort GROUP BY Longest
+    UNION ALL SELECT 'completion', Completion_Percent, COUNT(*) FROM Cohort GROUP BY Completion_Percent
+    ORDER BY 1, 2""", {"habit": habit, "today": str(today)})
+    return cur.fetchall()
+
+
+def list_open_periods(db: str):
+    """
+    Function to list the periods of all open challenges.
+    :param db: an initialized sqlite3 database connection
+    :return: list of period names
+    """
+    cur = db.cursor()
+    cur.execute("""SELECT DISTINCT Period FROM Challenges WHERE End_Date IS NULL""")
+    return [elt[0] for elt in cur.fetchall()]
+
+
+def count_current_trackings(db: str, bounds: dict, user: str = None):
+    """
+    Function to count the trackings of all open challenges in their current period with a single query.
+    The current periods are passed as table of period name, first and last day, so that periods that are only
+    available in Python are counted in the same pass.
+    :param db: an initialized sqlite3 database connection
+    :param bounds: dictionary of period name to first and last day ordinal of the current period, challenges with
+    other periods are left out
+    :param user: username to filter challenge entries, all users by default
+    :return: list of DueChallenge records ordered by challenge ID
+    """
+    if not bounds:
+        return []
+    values = ", ".join("(?, ?, ?)" for elt in bounds)
+    parameters = [value for name, days in bounds.items() for value in (name, *days)]
+    condition = ""
+    if user is not None:
+        condition = """AND User = (?)"""
+        parameters.append(user)
+    cur = db.cursor()
+    cur.row_factory = row_factory(DueChallenge)
+    cur.execute(f"""WITH Bounds(Period, First_Day, Last_Day) AS (VALUES {values})
+    SELECT Challenge_ID, User, Habit, Challenges.Period, Interval, First_Day, Last_Day,
+    (SELECT COUNT(*) FROM Tracker WHERE ChallengeID = Challenge_ID AND Day BETWEEN First_Day AND Last_Day)
+    + (SELECT COALESCE(SUM(Count), 0) FROM TrackerDaily WHERE ChallengeID = Challenge_ID
+    AND Day BETWEEN First_Day AND Last_Day) AS Tracked
+    FROM Challenges JOIN Bounds ON Bounds.Period = Challenges.Period
+    WHERE End_Date IS NULL {condition} ORDER BY Challenge_ID""", parameters)
+    return cur.fetchall()
+
+
+def find_streaks_for_user(db: str, user: str):
+    """
+    Function to list all entries of the Streaks table for all challenges of a user with a single query
+    :param db: an initialized sqlite3 database connection
+    :param user: username to filter challenge entries
+    :return: list of Streak records (challenge ID and day ordinal) of every streak of the user
+    """
+    cur = db.cursor()
+    cur.row_factory = row_factory(Streak)
+    cur.execute("""SELECT Streaks.ChallengeID, Streaks.Day
+    FROM Streaks JOIN Challenges ON Streaks.ChallengeID = Challenges.Challenge_ID WHERE Challenges.User = (?)""",
+                (user, ))
+    return cur.fetchall()
+
+
+"""
+All public functions are wrapped for the optional query tracing and latency recording of the profiling module.
+Generator functions (e.g. stream_table, paginate) are left out, as their statements run while they are iterated,
+after the wrapper returned. Their statements are still counted, without function name.
+"""
+for _name, _function in list(globals().items()):
+    if (inspect.isfunction(_function) and _function.__module__ == __name__ and _name != "transaction"
+            and not inspect.isgeneratorfunction(_function)):
+        globals()[_name] = profiled(_function)
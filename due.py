@@ -0,0 +1,190 @@
+import argparse
+import heapq
+from datetime import date
+from database import get_db, list_open_periods, count_current_trackings
+from periods import get_period, as_day
+
+
+class DueScheduler:
+    """
+    Index of the open challenges by the deadline of their current period, for reminder jobs asking which challenges
+    have not reached their interval yet. All open challenges are loaded with one query (see
+    database.count_current_trackings) into a heap of deadline and challenge ID. Trackings update the counts in
+    memory (see track), and when the date moves on only the challenges whose period ended are counted again.
+    Heap entries of stopped or reloaded challenges stay in the heap until they are popped, they are recognised by a
+    deadline that differs from the one of the challenge.
+    """
+
+    def __init__(self, db, today: date = None):
+        """
+        :param db: an initialized sqlite3 database connection
+        :param today: current date, today by default
+        """
+        self.db = db
+        self.today = as_day(today or date.today())
+        self.entries = {}
+        self.users = {}
+        self.heap = []
+        self.load(self.bounds(list_open_periods(db)))
+
+    def bounds(self, periods):
+        """
+        Function to find the first and last day of the current period of every given period.
+        :param periods: iterable of period names, unknown periods are left out
+        :return: dictionary of period name to first and last day ordinal
+        """
+        bounds = {}
+        for name in periods:
+            period = get_period(name)
+            if period is not None:
+                bucket = period.day_bucket(self.today)
+                bounds[name] = (period.first_day(bucket).toordinal(), period.last_day(bucket).toordinal())
+        return bounds
+
+    def load(self, bounds: dict, user: str = None):
+        """
+        Function to (re)load the open challenges with the given periods and push them into the heap.
+        :param bounds: current periods (see bounds)
+        :param user: only load the challenges of this user
+        :return: list of the loaded DueChallenge records
+        """
+        return self.add(count_current_trackings(self.db, bounds, user))
+
+    def add(self, rows: list):
+        """
+        Function to index counted open challenges (see database.count_current_trackings) and push them into the heap.
+        :param rows: list of DueChallenge records
+        :return: list of the added DueChallenge records
+        """
+        for entry in rows:
+            previous = self.entries.get(entry.challenge_id)
+            self.entries[entry.challenge_id] = entry
+            self.users.setdefault(entry.user, set()).add(entry.challenge_id)
+            if previous is None or previous.last_day != entry.last_day:
+                heapq.heappush(self.heap, (entry.last_day, entry.challenge_id))
+        return rows
+
+    def remove(self, challenge: int):
+        """
+        Function to drop a challenge from the index, e.g. after it was stopped. Its heap entry is skipped from now on.
+        :param challenge: challenge ID
+        :return: none
+        """
+        entry = self.entries.pop(challenge, None)
+        if entry is not None:
+            self.users[entry.user].discard(challenge)
+
+    def refresh_user(self, user: str):
+        """
+        Function to reload the open challenges of a user after a challenge was started or stopped.
+        :param user: username
+        :return: number of open challenges of the user
+        """
+        previous = set(self.users.get(user, ()))
+        rows = self.load(self.bounds(list_open_periods(self.db)), user)
+        for challenge in previous.difference(entry.challenge_id for entry in rows):
+            self.remove(challenge)
+        return len(rows)
+
+    def track(self, challenge: int, day, tracked: int = None):
+        """
+        Function to count a new tracking of a challenge. Trackings outside of the current period are ignored.
+        :param challenge: challenge ID
+        :param day: date, date string or day ordinal of the tracking
+        :param tracked: number of trackings in the period after the tracking (see tracker.Tracker.store_track),
+        by default the count is increased by one
+        :return: remaining number of trackings of the challenge, None if it is not indexed
+        """
+        entry = self.entries.get(challenge)
+        if entry is None:
+            return None
+        if entry.first_day <= as_day(day) <= entry.last_day:
+            entry.tracked = tracked if tracked is not None else entry.tracked + 1
+        return entry.remaining
+
+    def advance(self, today: date = None):
+        """
+        Function to move the scheduler to a new date. The challenges whose deadline has passed are popped from the
+        heap and counted again for their new period, grouped by period with one query.
+        :param today: new current date, today by default
+        :return: number of reloaded challenges
+        """
+        bounds = self.expire(today)
+        return len(self.load(bounds)) if bounds else 0
+
+    def expire(self, today: date = None):
+        """
+        Function to move the scheduler to a new date without database access: the challenges whose deadline has
+        passed are popped from the heap and removed, until they are counted again for their new period (see advance,
+        or count_current_trackings and add, e.g. to run the query in another thread).
+        :param today: new current date, today by default
+        :return: current periods of the removed challenges (see bounds), empty if none expired
+        """
+        self.today = as_day(today or date.today())
+        expired = {}
+        while self.heap and self.heap[0][0] < self.today:
+            last_day, challenge = heapq.heappop(self.heap)
+            entry = self.entries.get(challenge)
+            if entry is not None and entry.last_day == last_day:
+                expired[challenge] = entry
+        for challenge in expired:
+            self.remove(challenge)
+        return self.bounds({entry.period for entry in expired.values()})
+
+    def due(self, user: str):
+        """
+        Function to list the open challenges of a user that have not reached their interval in the current period.
+        :param user: username
+        :return: list of DueChallenge records ordered by deadline and challenge ID
+        """
+        entries = (self.entries[challenge] for challenge in self.users.get(user, ()))
+        return sorted((entry for entry in entries if entry.remaining),
+                      key=lambda entry: (entry.last_day, entry.challenge_id))
+
+    def due_all(self, before: date = None):
+        """
+        Function to list the open challenges of all users that have not reached their interval yet and whose
+        deadline is on or before a date. Only the part of the heap up to the date is visited.
+        :param before: last deadline, all deadlines by default
+        :return: list of DueChallenge records ordered by deadline and challenge ID
+        """
+        last = as_day(before) if before is not None else None
+        found = []
+        positions = [0]
+        while positions:
+            position = positions.pop()
+            if position >= len(self.heap) or (last is not None and self.heap[position][0] > last):
+                continue
+            found.append(self.heap[position])
+            positions += [2 * position + 1, 2 * position + 2]
+        due = []
+        for last_day, challenge in sorted(set(found)):
+            entry = self.entries.get(challenge)
+            if entry is not None and entry.last_day == last_day and entry.remaining:
+                due.append(entry)
+        return due
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def print_due(entries: list):
+    """
+    Function to print due challenges with their remaining trackings and deadline.
+    :param entries: list of DueChallenge records (see DueScheduler.due)
+    :return: none
+    """
+    print("Deadline ; User ; Habit ; Periodicity ; Tracked ; Remaining")
+    for entry in entries:
+        print(f"{entry.deadline} ; {entry.user} ; {entry.habit} ; {entry.period} ; {entry.tracked} ; "
+              f"{entry.remaining}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="List the open challenges that have not reached their interval yet")
+    parser.add_argument("--db", default="main.db", help="database file")
+    parser.add_argument("--user", help="only the challenges of this user")
+    parser.add_argument("--before", type=date.fromisoformat, help="last deadline, YYYY-MM-DD")
+    args = parser.parse_args()
+    scheduler = DueScheduler(get_db(args.db))
+    print_due(scheduler.due(args.user) if args.user else scheduler.due_all(args.before))
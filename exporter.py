@@ -0,0 +1,145 @@
+import argparse
+import csv
+import json
+import os
+from datetime import date
+from database import get_db, stream_table
+
+"""
+Exported tables in the order they are written and restored, with the exported fields.
+Tracker and Streaks entries carry user and habit, so that a Tracker.csv file can also be imported as events.
+"""
+TABLES = {
+    "User": ("name", ),
+    "Habit": ("name", "description", "creation_date", "user_created"),
+    "Challenges": ("challenge_id", "user", "habit", "period", "interval", "start_date", "end_date"),
+    "Tracker": ("challenge_id", "user", "habit", "date"),
+    "Streaks": ("challenge_id", "user", "habit", "date"),
+}
+
+
+def json_text(value, texts: dict):
+    """
+    Function to encode a value of an exported row as JSON. The texts of strings are cached, because users, habits
+    and dates repeat in almost every row.
+    :param value: integer, string or None
+    :param texts: cache of encoded strings, cleared when it gets large
+    :return: JSON text of the value
+    """
+    if isinstance(value, str):
+        text = texts.get(value)
+        if text is None:
+            if len(texts) > 100000:
+                texts.clear()
+            text = texts[value] = json.dumps(value)
+        return text
+    if value is None:
+        return "null"
+    return str(value)
+
+
+def export_records(db: str, user: str = None, challenge: int = None, first_day: date = None, last_day: date = None,
+                   chunk_size: int = 1000):
+    """
+    Generator over all exported rows of the database, table by table. Only one chunk of rows is held in memory.
+    :param db: an initialized sqlite3 database connection
+    :param user: optional username to export only the data of a user
+    :param challenge: optional challenge ID to export only the data of a challenge
+    :param first_day: optional first date of the exported Tracker and Streaks entries
+    :param last_day: optional last date of the exported Tracker and Streaks entries
+    :param chunk_size: number of rows fetched at once
+    :return: yields table name and row of every exported row
+    """
+    for table in TABLES:
+        for row in stream_table(db, table, user, challenge, first_day, last_day, chunk_size):
+            yield table, row
+
+
+def export(db: str, path: str, user: str = None, challenge: int = None, first_day: date = None,
+           last_day: date = None, chunk_size: int = 1000):
+    """
+    Function to export users, habits, challenges, trackings and streaks.
+    A path ending with ".jsonl" gets one JSON object per line with the field "table", any other path is a directory
+    with one CSV file per table (e.g. Tracker.csv).
+    :param db: an initialized sqlite3 database connection
+    :param path: JSONL file or directory for the CSV files
+    :param user: optional username to export only the data of a user
+    :param challenge: optional challenge ID to export only the data of a challenge
+    :param first_day: optional first date of the exported Tracker and Streaks entries
+    :param last_day: optional last date of the exported Tracker and Streaks entries
+    :param chunk_size: number of rows fetched at once
+    :return: dictionary with the number of exported rows per table
+    """
+    counts = {table: 0 for table in TABLES}
+    records = export_records(db, user, challenge, first_day, last_day, chunk_size)
+    if path.endswith((".jsonl", ".json")):
+        prefixes = {table: [json.dumps({"table": table})[:-1]] + [f", {json.dumps(field)}: " for field in fields]
+                    for table, fields in TABLES.items()}
+        texts = {}
+        with open(path, "w", encoding="utf-8") as file:
+            for table, row in records:
+                prefix = prefixes[table]
+                file.write(prefix[0] + "".join([prefix[n + 1] + json_text(value, texts)
+                                                for n, value in enumerate(row)]) + "}\n")
+                counts[table] += 1
+        return counts
+
+    os.makedirs(path, exist_ok=True)
+    files = {}
+    writers = {}
+    try:
+        for table, row in records:
+            if table not in writers:
+                files[table] = open(os.path.join(path, table + ".csv"), "w", newline="", encoding="utf-8")
+                writers[table] = csv.writer(files[table])
+                writers[table].writerow(TABLES[table])
+            writers[table].writerow(row)
+            counts[table] += 1
+    finally:
+        for file in files.values():
+            file.close()
+    return counts
+
+
+def read_export(path: str):
+    """
+    Generator over the rows of an export (see export), table by table. The files are read line by line.
+    :param path: JSONL file or directory with CSV files
+    :return: yields table name and row as dictionary of every exported row
+    """
+    if path.endswith((".jsonl", ".json")):
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record.pop("table"), record
+        return
+
+    for table, fields in TABLES.items():
+        name = os.path.join(path, table + ".csv")
+        if not os.path.exists(name):
+            continue
+        with open(name, newline="", encoding="utf-8") as file:
+            reader = csv.reader(file)
+            next(reader)
+            for row in reader:
+                record = dict(zip(fields, row))
+                if table == "Challenges":
+                    record["challenge_id"] = int(record["challenge_id"])
+                    record["interval"] = int(record["interval"])
+                    record["end_date"] = record["end_date"] or None
+                elif table in ("Tracker", "Streaks"):
+                    record["challenge_id"] = int(record["challenge_id"])
+                yield table, record
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export users, habits, challenges, trackings and streaks")
+    parser.add_argument("path", help="JSONL file or directory for one CSV file per table")
+    parser.add_argument("--db", default="main.db", help="database file")
+    parser.add_argument("--user", help="export only the data of this user")
+    parser.add_argument("--challenge", type=int, help="export only the data of this challenge ID")
+    parser.add_argument("--from", dest="first_day", type=date.fromisoformat, help="first tracking date, YYYY-MM-DD")
+    parser.add_argument("--to", dest="last_day", type=date.fromisoformat, help="last tracking date, YYYY-MM-DD")
+    args = parser.parse_args()
+    print(export(get_db(args.db), args.path, args.user, args.challenge, args.first_day, args.last_day))
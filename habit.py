@@ -1,7 +1,10 @@
+import records
 from database import create_habit
 
 
-class Habit:
+class Habit(records.Habit):
+    __slots__ = ()
+
     def __init__(self, name: str, description: str, user: str):
         """
         Habit class constructor for habits to track
@@ -9,15 +12,11 @@ class Habit:
         :param description: short description of the habit
         :param user: username that created the habit
         """
-        self.name = name
-        self.description = description
-        self.user = user
-        self.db = ""
+        super().__init__(name, description, None, user)
 
     def store(self, db: str):
         """
         Store habit in database
         :param db: an initialized sqlite3 database connection
         """
-        self.db = db
-        create_habit(self.db, self.name, self.description, self.user)
+        create_habit(db, self.name, self.description, self.user)
@@ -0,0 +1,244 @@
+import argparse
+from datetime import date, timedelta
+from html import escape
+from database import get_db, list_challenges, count_buckets_for_user
+from periods import Daily, Weekly, Monthly, as_date
+
+"""
+Resolutions of the heatmap: the period of one cell.
+"""
+RESOLUTIONS = {"day": Daily(), "week": Weekly(), "month": Monthly()}
+"""
+Characters of the text heatmap: no tracking, few to many trackings (relative to the busiest cell of the challenge)
+and a period with a streak.
+"""
+SHADES = "·░▒▓"
+STREAK = "█"
+"""
+Fill colors of the SVG heatmap in the same order as the characters, and size of a cell in pixels.
+"""
+COLORS = ("#ebedf0", "#9be9a8", "#40c463", "#30a14e", "#216e39")
+CELL = 12
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+def load_heatmap(db: str, user: str, first_day: date = None, last_day: date = None, resolution: str = "day"):
+    """
+    Function to load the tracking counts and streak markers of all challenges of a user with a single query.
+    :param db: an initialized sqlite3 database connection
+    :param user: username to filter challenge entries
+    :param first_day: first date of the heatmap, one year before the last date by default
+    :param last_day: last date of the heatmap, today by default
+    :param resolution: period of a cell: "day", "week" or "month"
+    :return: dictionary with user, resolution, period object, first and last date, the Challenge records that ran in
+    the range and the cells per challenge ID as dictionary of period number to number of trackings and streak flag
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unknown resolution {resolution}. Choose one of: " + ", ".join(RESOLUTIONS))
+    last_day = as_date(last_day) if last_day is not None else date.today()
+    first_day = as_date(first_day) if first_day is not None else last_day - timedelta(days=364)
+    period = RESOLUTIONS[resolution]
+    challenges = [chal for chal in list_challenges(db, user)
+                  if chal.start_date <= str(last_day) and (chal.end_date is None or chal.end_date >= str(first_day))]
+    cells = {chal.challenge_id: {} for chal in challenges}
+    for challenge, bucket, count, streak in count_buckets_for_user(db, user, period.sql_bucket("Day"), first_day,
+                                                                   last_day):
+        if challenge in cells:
+            cells[challenge][bucket] = (count, streak)
+    return {"user": user, "resolution": resolution, "period": period, "first_day": first_day, "last_day": last_day,
+            "challenges": challenges, "cells": cells}
+
+
+def levels(cells: dict):
+    """
+    Function to map the cells of a challenge to shading levels: 0 without tracking, 1 to 3 for the number of
+    trackings relative to the busiest cell of the challenge and 4 for a period with a streak.
+    :param cells: dictionary of period number to number of trackings and streak flag (see load_heatmap)
+    :return: dictionary of period number to level
+    """
+    top = max((count for count, streak in cells.values()), default=0)
+    return {bucket: 4 if streak else -(-3 * count // top) if count else 0 for bucket, (count, streak) in cells.items()}
+
+
+def columns(heatmap: dict):
+    """
+    Function to list the columns of the heatmap: weeks for the day resolution (one row per weekday), otherwise the
+    periods of the resolution.
+    :param heatmap: heatmap data (see load_heatmap)
+    :return: range of the week or period numbers of the columns
+    """
+    if heatmap["resolution"] == "day":
+        return Weekly().buckets(heatmap["first_day"], heatmap["last_day"])
+    return heatmap["period"].buckets(heatmap["first_day"], heatmap["last_day"])
+
+
+def column_labels(heatmap: dict):
+    """
+    Function to label the columns where a new month (day and week resolution) or year (month resolution) starts.
+    :param heatmap: heatmap data (see load_heatmap)
+    :return: list of column position and label
+    """
+    labels = []
+    previous = None
+    for n, column in enumerate(columns(heatmap)):
+        if heatmap["resolution"] == "month":
+            key = label = str(column // 12)
+        else:
+            first = max(Weekly().first_day(column), heatmap["first_day"])
+            key = first.year, first.month
+            label = MONTHS[first.month - 1]
+        if key != previous:
+            labels.append((n, label))
+            previous = key
+    return labels
+
+
+def grid(heatmap: dict, challenge: int):
+    """
+    Function to arrange the levels of a challenge in rows and columns: seven rows (Monday to Sunday) for the day
+    resolution, else one row. Cells outside of the date range are None.
+    :param heatmap: heatmap data (see load_heatmap)
+    :param challenge: challenge ID
+    :return: list of rows with the level of every column
+    """
+    shades = levels(heatmap["cells"][challenge])
+    if heatmap["resolution"] != "day":
+        return [[shades.get(column, 0) for column in columns(heatmap)]]
+    first = heatmap["first_day"].toordinal()
+    last = heatmap["last_day"].toordinal()
+    return [[shades.get(day, 0) if first <= day <= last else None
+             for day in (column * 7 + 1 + weekday for column in columns(heatmap))] for weekday in range(7)]
+
+
+def render_text(heatmap: dict):
+    """
+    Function to render the heatmap of all challenges as a text grid for the terminal.
+    :param heatmap: heatmap data (see load_heatmap)
+    :return: text of the heatmap
+    """
+    characters = SHADES + STREAK
+    width = len(columns(heatmap))
+    header = [" "] * width
+    end = 0
+    for n, label in column_labels(heatmap):
+        if n >= end and n + len(label) <= width:
+            header[n:n + len(label)] = label
+            end = n + len(label) + 1
+    names = [WEEKDAYS if heatmap["resolution"] == "day" else [""]]
+    margin = 4 if heatmap["resolution"] == "day" else 0
+    lines = [f"Heatmap of {heatmap['user']} from {heatmap['first_day']} to {heatmap['last_day']} per "
+             f"{heatmap['resolution']}: {SHADES[0]} no tracking, {SHADES[1:]} more trackings, {STREAK} streak", ""]
+    for chal in heatmap["challenges"]:
+        lines.append(f"{chal.habit} ({chal.period})")
+        lines.append(" " * margin + "".join(header).rstrip())
+        for name, row in zip(names[0], grid(heatmap, chal.challenge_id)):
+            lines.append(name.ljust(margin) + "".join(" " if level is None else characters[level] for level in row))
+        lines.append("")
+    return "\n".join(lines)
+
+
+def render_svg(heatmap: dict):
+    """
+    Function to render the heatmap of all challenges as a static SVG image, one block per challenge.
+    Every cell with trackings has a tooltip with its period and number of trackings.
+    :param heatmap: heatmap data (see load_heatmap)
+    :return: SVG text
+    """
+    period = heatmap["period"]
+    day = heatmap["resolution"] == "day"
+    margin = 32 if day else 0
+    buckets = columns(heatmap)
+    width = margin + len(buckets) * CELL + CELL
+    parts = []
+    y = 0
+    for chal in heatmap["challenges"]:
+        cells = heatmap["cells"][chal.challenge_id]
+        parts.append(f'<text x="0" y="{y + 14}" class="title">{escape(chal.habit)} ({escape(chal.period)})</text>')
+        y += 20
+        for n, label in column_labels(heatmap):
+            parts.append(f'<text x="{margin + n * CELL}" y="{y + 10}">{label}</text>')
+        y += 14
+        rows = grid(heatmap, chal.challenge_id)
+        for weekday, row in enumerate(rows):
+            if day and weekday % 2 == 0:
+                parts.append(f'<text x="0" y="{y + weekday * CELL + 10}">{WEEKDAYS[weekday]}</text>')
+            for n, level in enumerate(row):
+                if level is None:
+                    continue
+                x = margin + n * CELL
+                cell = f'<rect x="{x}" y="{y + weekday * CELL}" width="{CELL - 2}" height="{CELL - 2}" class="l{level}"'
+                if level:
+                    bucket = buckets[n] * 7 + 1 + weekday if day else buckets[n]
+                    count, streak = cells[bucket]
+                    title = f"{period.label(bucket)}: {count} tracking{'s' if count != 1 else ''}"
+                    parts.append(cell + f"><title>{title}{', streak' if streak else ''}</title></rect>")
+                else:
+                    parts.append(cell + "/>")
+        y += len(rows) * CELL + 16
+    style = " ".join(f".l{n} {{fill: {color}}}" for n, color in enumerate(COLORS))
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{y}" viewBox="0 0 {width} {y}">'
+            f'<style>text {{font: 10px sans-serif}} .title {{font: bold 12px sans-serif}} {style}</style>'
+            + "\n".join(parts) + "</svg>")
+
+
+def render_html(heatmap: dict):
+    """
+    Function to render the heatmap of all challenges as a static HTML page with the SVG image and a legend.
+    :param heatmap: heatmap data (see load_heatmap)
+    :return: HTML text
+    """
+    legend = " ".join(f'<span style="background: {color}">&nbsp;&nbsp;</span> {text}' for color, text in
+                      zip(COLORS, ("no tracking", "few", "more", "most trackings", "streak")))
+    title = escape(f"Heatmap of {heatmap['user']} from {heatmap['first_day']} to {heatmap['last_day']}")
+    return (f'<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>{title}</title></head>\n<body>'
+            f'<h1 style="font: bold 16px sans-serif">{title}</h1>\n<p style="font: 12px sans-serif">{legend}</p>\n'
+            + render_svg(heatmap) + "\n</body></html>\n")
+
+
+def write_heatmap(heatmap: dict, path: str):
+    """
+    Function to write the heatmap to a static file.
+    :param heatmap: heatmap data (see load_heatmap)
+    :param path: file ending with .svg or .html
+    :return: none
+    """
+    if path.endswith(".svg"):
+        text = render_svg(heatmap)
+    elif path.endswith((".html", ".htm")):
+        text = render_html(heatmap)
+    else:
+        raise ValueError("The heatmap file must end with .svg or .html")
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(text)
+
+
+def print_heatmap(db: str, user: str, first_day: date = None, last_day: date = None, resolution: str = "day",
+                  path: str = None):
+    """
+    Function to print the heatmap of all challenges of a user and optionally write it to an SVG or HTML file.
+    :param db: an initialized sqlite3 database connection
+    :param user: username to filter challenge entries
+    :param first_day: first date of the heatmap, one year before the last date by default
+    :param last_day: last date of the heatmap, today by default
+    :param resolution: period of a cell: "day", "week" or "month"
+    :param path: optional file ending with .svg or .html
+    :return: none
+    """
+    heatmap = load_heatmap(db, user, first_day, last_day, resolution)
+    print(render_text(heatmap))
+    if path:
+        write_heatmap(heatmap, path)
+        print("Heatmap written to " + path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Heatmap of the trackings and streaks of all challenges of a user")
+    parser.add_argument("user", help="username")
+    parser.add_argument("--db", default="main.db", help="database file")
+    parser.add_argument("--resolution", choices=list(RESOLUTIONS), default="day", help="period of a cell")
+    parser.add_argument("--from", dest="first_day", type=date.fromisoformat, help="first date, YYYY-MM-DD")
+    parser.add_argument("--to", dest="last_day", type=date.fromisoformat, help="last date, YYYY-MM-DD")
+    parser.add_argument("--output", help="SVG or HTML file")
+    args = parser.parse_args()
+    print_heatmap(get_db(args.db), args.user, args.first_day, args.last_day, args.resolution, args.output)
@@ -0,0 +1,149 @@
+import argparse
+import csv
+import json
+from database import (get_db, transaction, get_challenge_for_habit, stage_trackings, insert_staged_trackings,
+                      find_tracking_days, replace_streaks, safe_user_name, restore_habit, restore_challenge,
+                      insert_streaks, list_streak_triggers)
+from periods import as_day
+from streaks import derive_streaks, rebuild_streak_summaries
+
+
+def read_events(path: str):
+    """
+    Generator over the tracking events of a CSV or JSONL file.
+    Every event has the fields "user", "habit" and "date" (YYYY-MM-DD). The file is read line by line.
+    :param path: path of the file, JSONL for the ending ".jsonl" or ".json", CSV otherwise
+    :return: yields user, habit and date of every event
+    """
+    with open(path, newline="", encoding="utf-8") as file:
+        if path.endswith((".jsonl", ".json")):
+            for line in file:
+                if line.strip():
+                    event = json.loads(line)
+                    yield event["user"], event["habit"], event["date"]
+        else:
+            reader = csv.reader(file)
+            header = next(reader)
+            user, habit, day = header.index("user"), header.index("habit"), header.index("date")
+            for row in reader:
+                yield row[user], row[habit], row[day]
+
+
+def import_events(db: str, events, chunk_size: int = 10000):
+    """
+    Function to import tracking events in bulk, e.g. the history of another habit tracker.
+    The challenge of every user/habit pair is looked up once and the events are collected with executemany in chunks.
+    They are added to the Tracker table sorted by challenge and date and the streaks of all affected challenges are
+    derived afterwards. Everything is committed in one transaction, or rolled back completely on an error.
+    Events without a started challenge for the user and habit are skipped.
+    :param db: an initialized sqlite3 database connection
+    :param events: iterable of user, habit and date (YYYY-MM-DD) of the events
+    :param chunk_size: number of tracking entries inserted per statement
+    :return: number of imported and number of skipped events
+    """
+    challenges = {}
+    days = {}
+    imported = 0
+    skipped = 0
+    chunk = []
+
+    with transaction(db):
+        for user, habit, day in events:
+            key = user, habit
+            if key not in challenges:
+                challenge = get_challenge_for_habit(db, user, habit)
+                challenges[key] = challenge[0] if challenge else None
+            challenge = challenges[key]
+            if challenge is None:
+                skipped += 1
+                continue
+
+            if day not in days:
+                days[day] = as_day(day)
+            chunk.append((days[day], challenge.challenge_id))
+            imported += 1
+            if len(chunk) >= chunk_size:
+                stage_trackings(db, chunk)
+                chunk = []
+        stage_trackings(db, chunk)
+        insert_staged_trackings(db)
+
+        touched = {elt.challenge_id: elt for elt in challenges.values() if elt is not None}
+        for challenge in touched.values():
+            replace_streaks(db, challenge.challenge_id, derive_streaks(find_tracking_days(db, challenge.challenge_id),
+                                                                       challenge.period, challenge.interval))
+        rebuild_streak_summaries(db, list(touched))
+    return imported, skipped
+
+
+def restore_records(db: str, records, chunk_size: int = 10000):
+    """
+    Function to load an export (see exporter.py) into a database, e.g. to move the data of a user to another database.
+    Users and habits are added if they are missing, every challenge is added as a new challenge and its trackings and
+    streaks are added with the new challenge ID. Everything is committed in one transaction.
+    With streak triggers (see database.create_streak_triggers) the streaks of the periods with a trigger are derived
+    from the restored trackings, the exported ones are counted but not added a second time.
+    :param db: an initialized sqlite3 database connection
+    :param records: iterable of table name and row dictionary, ordered like exporter.TABLES (see exporter.read_export)
+    :param chunk_size: number of tracking or streak entries inserted per statement
+    :return: dictionary with the number of restored rows per table and of skipped entries without exported challenge
+    """
+    counts = {"User": 0, "Habit": 0, "Challenges": 0, "Tracker": 0, "Streaks": 0, "skipped": 0}
+    challenges = {}
+    days = {}
+    trackings = []
+    streaks = []
+    triggers = set(list_streak_triggers(db))
+    derived = set()
+
+    with transaction(db):
+        for table, record in records:
+            if table == "User":
+                safe_user_name(db, record["name"])
+            elif table == "Habit":
+                restore_habit(db, record["name"], record["description"], record["creation_date"],
+                              record["user_created"])
+            elif table == "Challenges":
+                challenges[record["challenge_id"]] = restore_challenge(
+                    db, record["user"], record["habit"], record["period"], record["interval"],
+                    record["start_date"], record["end_date"])
+                if record["period"] in triggers:
+                    derived.add(challenges[record["challenge_id"]])
+            elif table in ("Tracker", "Streaks"):
+                challenge = challenges.get(record["challenge_id"])
+                if challenge is None:
+                    counts["skipped"] += 1
+                    continue
+                if table == "Streaks" and challenge in derived:
+                    counts[table] += 1
+                    continue
+                day = record["date"]
+                if day not in days:
+                    days[day] = as_day(day)
+                chunk = trackings if table == "Tracker" else streaks
+                chunk.append((days[day], challenge))
+                if len(chunk) >= chunk_size:
+                    if table == "Tracker":
+                        stage_trackings(db, chunk)
+                    else:
+                        insert_streaks(db, chunk)
+                    chunk.clear()
+            else:
+                continue
+            counts[table] += 1
+        stage_trackings(db, trackings)
+        insert_staged_trackings(db)
+        insert_streaks(db, streaks)
+        rebuild_streak_summaries(db, list(challenges.values()))
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Import tracking events from CSV or JSONL files")
+    parser.add_argument("files", nargs="+", help="CSV or JSONL files with the columns user, habit and date")
+    parser.add_argument("--db", default="main.db", help="database file")
+    args = parser.parse_args()
+    database = get_db(args.db)
+    for name in args.files:
+        done, missing = import_events(database, read_events(name))
+        print(f"{name}: {done} events imported, {missing} skipped without started challenge")
@@ -0,0 +1,160 @@
+import heapq
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from database import get_db, list_challenge_ids, list_challenges_in_range, find_streaks_in_range
+from pool import connect_read_only
+from shards import is_sharded, shard_files
+from streaks import challenge_period, summarize
+from periods import get_period
+
+"""
+Number of leaders per list of the leaderboard.
+"""
+TOP = 10
+
+
+def shard_ranges(ids: list, shards: int):
+    """
+    Function to split sorted challenge IDs into contiguous ranges of about the same number of challenges.
+    :param ids: challenge IDs in ascending order
+    :param shards: number of ranges
+    :return: list of first and last challenge ID of every range
+    """
+    size = -(-len(ids) // max(shards, 1))
+    return [(ids[n], ids[min(n + size, len(ids)) - 1]) for n in range(0, len(ids), size)] if ids else []
+
+
+def sort_key(entry: tuple):
+    """
+    Function to order leaderboard entries: longest run first, on a tie the older challenge first.
+    :param entry: longest run, challenge ID, user, habit and period
+    :return: sort key of the entry
+    """
+    return -entry[0], entry[1]
+
+
+def top_entries(entries, top: int):
+    """
+    Function to keep the best entries of a leaderboard list.
+    :param entries: iterable of leaderboard entries
+    :param top: number of entries to keep
+    :return: list of the best entries in order
+    """
+    return heapq.nsmallest(top, entries, key=sort_key)
+
+
+def rank(entries: list, top: int):
+    """
+    Function to build the top lists of the leaderboard: overall, per period and per habit.
+    :param entries: leaderboard entries
+    :param top: number of entries per list
+    :return: dictionary with the lists "overall", "period" (dictionary by period) and "habit" (dictionary by habit)
+    """
+    periods = {}
+    habits = {}
+    for entry in entries:
+        periods.setdefault(entry[4], []).append(entry)
+        habits.setdefault(entry[3], []).append(entry)
+    return {"overall": top_entries(entries, top),
+            "period": {key: top_entries(value, top) for key, value in periods.items()},
+            "habit": {key: top_entries(value, top) for key, value in habits.items()}}
+
+
+def shard_leaders(name: str, first_id: int, last_id: int, top: int = TOP):
+    """
+    Function to compute the top lists of a range of challenges. Runs in a worker process with its own read-only
+    connection, so only the small top lists are sent back to the parent.
+    :param name: name of the database/sql file, a shard file in a sharded layout
+    :param first_id: first challenge ID of the range
+    :param last_id: last challenge ID of the range
+    :param top: number of entries per list
+    :return: top lists of the range (see rank)
+    """
+    db = connect_read_only(name)
+    try:
+        days = {}
+        for elt in find_streaks_in_range(db, first_id, last_id):
+            days.setdefault(elt.challenge_id, []).append(elt.day)
+        entries = []
+        for chal in list_challenges_in_range(db, first_id, last_id):
+            period_type = get_period(chal.period)
+            if period_type is None:
+                continue
+            buckets = period_type.buckets(*challenge_period(chal.start_date, chal.end_date))
+            streaks = [bucket for bucket in map(period_type.day_bucket, days.get(chal.challenge_id, []))
+                       if bucket in buckets]
+            entries.append((summarize(streaks)[1], chal.challenge_id, chal.user, chal.habit, chal.period))
+    finally:
+        db.close()
+    return rank(entries, top)
+
+
+def merge_leaders(results: list, top: int = TOP):
+    """
+    Function to merge the top lists of all ranges into the top lists of the whole database.
+    :param results: top lists of the ranges (see shard_leaders)
+    :param top: number of entries per list
+    :return: merged top lists (see rank)
+    """
+    board = {"overall": top_entries([entry for result in results for entry in result["overall"]], top),
+             "period": {}, "habit": {}}
+    for group in ("period", "habit"):
+        lists = {}
+        for result in results:
+            for key, entries in result[group].items():
+                lists.setdefault(key, []).extend(entries)
+        board[group] = {key: top_entries(lists[key], top) for key in sorted(lists)}
+    return board
+
+
+def leaderboard(name: str = "main.db", top: int = TOP, workers: int = None):
+    """
+    Function to rank the longest streak runs of all challenges of all users.
+    The challenge IDs are split into one range per worker process, in a sharded layout (see shards.py) the challenge
+    IDs of every shard file. With a single worker, or if no worker process can be started, the ranges are computed
+    one after another in this process with the same result.
+    :param name: name of the database/sql file or folder of a sharded layout
+    :param top: number of entries per list
+    :param workers: number of worker processes, the number of CPUs by default
+    :return: top lists overall, per period and per habit (see rank)
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    files = shard_files(name) if is_sharded(name) else [name]
+    ranges = []
+    for file in files:
+        db = get_db(file)
+        ids = list_challenge_ids(db)
+        db.close()
+        ranges += [(file, first, last) for first, last in shard_ranges(ids, -(-workers // len(files)))]
+    results = None
+    if workers > 1 and len(ranges) > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as executor:
+                futures = [executor.submit(shard_leaders, *elt, top) for elt in ranges]
+                results = [future.result() for future in futures]
+        except (BrokenProcessPool, OSError, ImportError, NotImplementedError) as error:
+            print(f"Worker processes not available ({error}), computing the leaderboard serially")
+    if results is None:
+        results = [shard_leaders(*elt, top) for elt in ranges]
+    return merge_leaders(results, top)
+
+
+def print_leaderboard(board: dict, per_habit: bool = False):
+    """
+    Function to print the top lists of the leaderboard.
+    :param board: top lists (see leaderboard)
+    :param per_habit: also print the top list of every habit
+    :return: none
+    """
+    lists = [("All challenges", board["overall"])]
+    lists += [(f"Periodicity {key}", value) for key, value in board["period"].items()]
+    if per_habit:
+        lists += [(f"Habit {key}", value) for key, value in board["habit"].items()]
+    for title, entries in lists:
+        print(title)
+        print("Rank ; User ; Habit ; Periodicity ; Longest streaks in a row")
+        for n, entry in enumerate(entries):
+            print(f"{n + 1} ; {entry[2]} ; {entry[3]} ; {entry[4]} ; {entry[0]}")
+        print()
@@ -1,20 +1,133 @@
-import questionary
+import argparse
+import heapq
+import sys
+import profiling
 from habit import Habit
 from challenge import Challenge
 from tracker import Tracker
 from database import (get_db, get_habits, get_user_names, safe_user_name, get_habits_started, list_challenges,
-                      list_open_challenges, find_challenges_by_period)
+                      get_challenge_for_habit, create_streak_triggers, drop_streak_triggers, list_streak_triggers,
+                      list_challenges_page, list_open_challenges_page, find_challenges_by_period_page,
+                      get_habits_page, paginate, search_habits, compact_trackings, reclaim_space, PAGE_SIZE,
+                      COMPACT_HORIZON)
+from functools import partial
 from datetime import date, datetime
 from analyse import list_streaks
-
-
-def cli():
-    db = get_db()
+from streaks import user_streak_summaries, rebuild_streak_summaries
+from periods import period_names, get_period
+from shards import is_sharded, for_each_shard, route_events
+from heatmap import print_heatmap
+from stats import print_statistics
+from due import DueScheduler, print_due
+
+
+def print_longest_streaks(db, user: str):
+    """
+    Function to print all challenges of a user with the maximum number of streaks in a row for that challenge.
+    :param db: an initialized sqlite3 database connection
+    :param user: username to filter challenge entries
+    :return: none
+    """
+    challenges = list_challenges(db, user)
+    user_streak_runs = user_streak_summaries(db, user)
+    max_streaks = 0
+    print("Habit / Periodicity / Start Date / End Date / Max No of Streaks in a Row")
+    for chal in challenges:
+        chal_text = chal.habit + " ; " + chal.period + " ; " + chal.start_date + " ; " + str(chal.end_date)
+        streak_row = user_streak_runs[chal.challenge_id][1]
+        if max_streaks < streak_row:
+            max_streaks = streak_row
+        print(f"{chal_text} : Streaks in a row = {streak_row}")
+    print(f"Your longest streaks in a row are {max_streaks} Streaks")
+
+
+def select_page(questionary, message: str, fetch, label, size: int = PAGE_SIZE):
+    """
+    Function to let the user select a record of a paginated listing page by page with "Next page" and
+    "Previous page". Only the records of the shown page are read from the database.
+    :param questionary: the questionary module
+    :param message: question shown above the choices
+    :param fetch: listing function with the parameters after and size, e.g. a partial of list_challenges_page
+    :param label: function to build the display text of a record
+    :param size: number of records per page
+    :return: selected record or None for Exit
+    """
+    starts = [None]
+    while True:
+        after = {} if starts[-1] is None else {"after": starts[-1]}
+        page = fetch(size=size + 1, **after)
+        choices = [questionary.Choice(label(row), value=row) for row in page[:size]]
+        if len(page) > size:
+            choices.append(questionary.Choice("Next page", value="Next page"))
+        if len(starts) > 1:
+            choices.append(questionary.Choice("Previous page", value="Previous page"))
+        choices.append(questionary.Choice("Exit", value="Exit"))
+        answer = questionary.select(message, choices=choices).ask()
+        if answer == "Next page":
+            starts.append(page[size - 1].key)
+        elif answer == "Previous page":
+            starts.pop()
+        elif answer is None or answer == "Exit":
+            return None
+        else:
+            return answer
+
+
+def search_habit(questionary, db, user: str, size: int = PAGE_SIZE):
+    """
+    Function to let the user find a habit that is not started yet by typing (type-ahead): while typing, the best
+    matches of the full text search are offered as completions (see database.search_habits). An entered text that
+    is not a habit name shows its matches for selection, an empty text lists all habits page by page.
+    :param questionary: the questionary module
+    :param db: an initialized sqlite3 database connection
+    :param user: username whose started habits are left out
+    :param size: number of offered habits
+    :return: selected Habit record or None for Exit
+    """
+    from prompt_toolkit.completion import Completer, Completion
+
+    class HabitCompleter(Completer):
+        def get_completions(self, document, complete_event):
+            text = document.text_before_cursor
+            for habit in search_habits(db, text, user, size):
+                yield Completion(habit.name, start_position=-len(text), display_meta=habit.description)
+
+    while True:
+        text = questionary.autocomplete("Search the habit you want to track (empty to list all):", choices=[],
+                                        completer=HabitCompleter()).ask()
+        if text is None:
+            return None
+        if not text.strip():
+            return select_page(questionary, "What is the habit you want to track?",
+                               partial(get_habits_page, db, not_started_by=user), lambda elt: elt.name, size)
+        matches = search_habits(db, text, user, size)
+        exact = [habit for habit in matches if habit.name == text.strip()]
+        if exact:
+            return exact[0]
+        if not matches:
+            print("No habit found. Try again")
+            continue
+        choices = [questionary.Choice(f"{habit.name} - {habit.description}", value=habit) for habit in matches]
+        answer = questionary.select("What is the habit you want to track?",
+                                    choices=choices + ["Search again", "Exit"]).ask()
+        if answer is None or answer == "Exit":
+            return None
+        if answer != "Search again":
+            return answer
+
+
+def cli(name: str = "main.db"):
+    """
+    Interactive command line menu. questionary is only imported here, so that the subcommands start fast.
+    :param name: name of the database/sql file
+    """
+    import questionary
+    catalog = get_db(name)
 
     stop = False
 
     while not stop:
-        user_list = get_user_names(db)
+        user_list = get_user_names(catalog)
         user_list.append("New name")
         user_list.append("Exit")
 
@@ -24,13 +137,18 @@ def cli():
 
         if user_selected == "New name":
             new_user = questionary.text("Type in new name").ask()
-            safe_user_name(db, new_user)
+            safe_user_name(catalog, new_user)
             user_selected = new_user
 
         if user_selected == "Exit":
             print("Bye")
             break
 
+        """
+        In a sharded database the data of the user is in the shard of the user, otherwise in the same file.
+        """
+        db = get_db(name, user=user_selected) if is_sharded(name) else catalog
+
         task = questionary.select(
             "What do you want to do?",
             choices=["Track an action", "Start challenge", "Stop challenge",
@@ -44,13 +162,12 @@ def cli():
             """
             Task to track an executed action/habit.
             """
-            habits_started = get_habits_started(db, user_selected)
-            habits_started.append("Exit")
-            habit_selected = questionary.select(
-                "What is the habit you want to track?",
-                choices=[elt for elt in habits_started]).ask()
+            challenge_selected = select_page(questionary, "What is the habit you want to track?",
+                                             partial(list_open_challenges_page, db, user_selected),
+                                             lambda elt: elt.habit)
 
-            if not habit_selected == "Exit":
+            if challenge_selected is not None:
+                habit_selected = challenge_selected.habit
                 date_answer = questionary.select("What is the date for tracking?",
                                                  choices=["Today", "Enter date"]).ask()
                 date_selected = date.today()
@@ -82,7 +199,8 @@ def cli():
                         ("What do you want to analyze?",
                          choices=["Analyse specific challenge", "List started challenges",
                                   "List challenges with same periodicity", "Find challenge with longest streak",
-                                  "Exit"]))
+                                  "Overview of all challenges", "Heatmap of all challenges",
+                                  "Statistics and ranking of all challenges", "Exit"]))
                         .ask())
             if analysis == "Exit":
                 print("Bye " + user_selected)
@@ -95,29 +213,18 @@ def cli():
                 Adds the information whether a streak was reached in the given period.
                 Finally lists the maximum number of streaks in a row for the given challenge.
                 """
-                chal_list = []
-                chal_no = []
-                chal_period = []
-                challenges = list_challenges(db, user_selected)
-                for chal in challenges:
-                    chal_text = chal[1] + " ; " + chal[2] + " ; " + chal[3] + " ; " + str(chal[4])
-                    chal_list.append(chal_text)
-                chal_list.append("Exit")
-                challenge_selected = questionary.select(
-                    'What Challenge do you want to analyse '
-                    '(Challenge ; Periodicity ; Date started ; Date stopped)?',
-                    choices=[elt for elt in chal_list]).ask()
-
-                if challenge_selected == "Exit":
+                challenge_selected = select_page(
+                    questionary,
+                    'What Challenge do you want to analyse (Challenge ; Periodicity ; Date started ; Date stopped)?',
+                    partial(list_challenges_page, db, user_selected),
+                    lambda chal: (chal.habit + " ; " + chal.period + " ; " + chal.start_date + " ; "
+                                  + str(chal.end_date)))
+
+                if challenge_selected is None:
                     print("Bye " + user_selected)
                     break
-                else:
-                    for chal in challenges:
-                        chal_text = chal[1] + " ; " + chal[2] + " ; " + chal[3] + " ; " + str(chal[4])
-                        if chal_text == challenge_selected:
-                            chal_no = chal[0]
-                            chal_period = chal[2]
-                            break
+                chal_no = challenge_selected.challenge_id
+                chal_period = challenge_selected.period
                 max_streak = list_streaks(db, chal_no, chal_period, "list")
                 print(f"Your longest streak was {max_streak} in a row!")
                 print("Bye " + user_selected)
@@ -128,9 +235,9 @@ def cli():
                 Task to list all challenges that are currently started and ongoing (without end date)
                 """
                 print("Habit ; Periodicity ; Tracking interval")
-                challenges_started = list_open_challenges(db, user_selected)
-                for elt in challenges_started:
-                    print(elt)
+                for page in paginate(list_open_challenges_page, db, user_selected):
+                    for elt in page:
+                        print((elt.habit, elt.period, elt.interval))
                 print("Bye " + user_selected)
                 break
 
@@ -140,11 +247,11 @@ def cli():
                 (stopped or ongoing).
                 """
                 habit_period = questionary.select("Challenges of which period do you want to list?",
-                                                  choices=["daily", "weekly", "monthly"]).ask()
-                challenges_by_period = find_challenges_by_period(db, user_selected, habit_period)
+                                                  choices=period_names()).ask()
                 print("Challenge ID ; Habit ; Periodicity ; Interval ; Start date")
-                for elt in challenges_by_period:
-                    print(elt)
+                for page in paginate(find_challenges_by_period_page, db, user_selected, habit_period):
+                    for elt in page:
+                        print((elt.challenge_id, elt.habit, elt.period, elt.interval, elt.start_date))
                 print("Bye " + user_selected)
                 break
 
@@ -153,44 +260,55 @@ def cli():
                 Task to print out a list of all challenges of the logged-in user with the maximum number of streaks
                 in a row for that challenge.
                 """
-                challenges = list_challenges(db, user_selected)
-                max_streaks = 0
-                print("Habit / Periodicity / Start Date / End Date / Max No of Streaks in a Row")
-                for chal in challenges:
-                    chal_text = chal[1] + " ; " + chal[2] + " ; " + chal[3] + " ; " + str(chal[4])
-                    chal_no = chal[0]
-                    chal_period = chal[2]
-                    streak_row = list_streaks(db, chal_no, chal_period, "no")
-                    if max_streaks < streak_row:
-                        max_streaks = streak_row
-                    print(f"{chal_text} : Streaks in a row = {streak_row}")
-                print(f"Your longest streaks in a row are {max_streaks} Streaks")
+                print_longest_streaks(db, user_selected)
+                print("Bye " + user_selected)
+                break
+
+            if analysis == "Overview of all challenges":
+                """
+                Task to print streak runs, completion rate, rolling averages and best and worst period of all
+                challenges of the logged-in user at once. Needs the optional dependency numpy.
+                """
+                print_overview(db, user_selected)
+                print("Bye " + user_selected)
+                break
+
+            if analysis == "Heatmap of all challenges":
+                """
+                Task to print the trackings and streaks of all challenges of the logged-in user of the last year
+                as one grid per challenge with a cell per day.
+                """
+                print_heatmap(db, user_selected)
+                print("Bye " + user_selected)
+                break
+
+            if analysis == "Statistics and ranking of all challenges":
+                """
+                Task to print completion rate, trackings per period and longest streaks in a row of all challenges of
+                the logged-in user and how they rank against all users with the same habit.
+                """
+                print_statistics(db, user_selected, name=name)
                 print("Bye " + user_selected)
                 break
 
         elif task == "Start challenge":
             """
             Task to start a challenge based on habits created by any user.
-            The program lists all habits that the current user did not use to start a challenge.
+            The program searches the habits that the current user did not use to start a challenge while typing.
             With that list, the user can choose a habit an start a challenge with personalized interval and periodicity.
             The program creates an object of the Challenge class and stores it into the database
             """
-            habits_started = get_habits_started(db, user_selected)
-            habit_list = get_habits(db)
-            habits_not_started = set(habit_list) - set(habits_started)
-            habits_not_started = list(habits_not_started)
-            habits_not_started.append("Exit")
-            if len(habits_not_started) == 1:
+            habits_not_started = partial(get_habits_page, db, not_started_by=user_selected)
+            if not habits_not_started(size=1):
                 print("All habits already started as a challenge.")
                 stop = True
             else:
-                habit_selected = questionary.select(
-                    "What is the habit you want to track?",
-                    choices=[elt for elt in habits_not_started]).ask()
+                habit_selected = search_habit(questionary, db, user_selected)
 
-                if not habit_selected == "Exit":
+                if habit_selected is not None:
+                    habit_selected = habit_selected.name
                     habit_period = questionary.select("On what period do you want to track your habit?",
-                                                      choices=["daily", "weekly", "monthly"]).ask()
+                                                      choices=period_names()).ask()
                     while True:
                         try:
                             habit_interval = int(questionary.text(
@@ -216,14 +334,12 @@ def cli():
             By choosing a habit, the challenge will be stopped, so it cannot be tracked.
             Therefore an end date is added to the entry in the Challenge table in the database.
             """
-            habits_started = get_habits_started(db, user_selected)
-            habits_started.append("Exit")
-            habit_selected = questionary.select(
-                "What is the habit you want to stop tracking?",
-                choices=[elt for elt in habits_started]).ask()
-
-            if not habit_selected == "Exit":
-                challenge = Challenge(user_selected, habit_selected)
+            challenge_selected = select_page(questionary, "What is the habit you want to stop tracking?",
+                                             partial(list_open_challenges_page, db, user_selected),
+                                             lambda elt: elt.habit)
+
+            if challenge_selected is not None:
+                challenge = Challenge(user_selected, challenge_selected.habit)
                 challenge.stop(db)
 
                 stop = True
@@ -253,5 +369,399 @@ def cli():
             print("Bye " + user_selected)
 
 
+def print_overview(db, user: str):
+    """
+    Function to print the analysis of all challenges of a user with numpy (see analyse_numpy.print_overview).
+    numpy is optional and only imported here.
+    :param db: an initialized sqlite3 database connection
+    :param user: username to filter challenge entries
+    :return: True if numpy is installed and the overview was printed
+    """
+    import analyse_numpy
+    if not analyse_numpy.available():
+        print("The overview needs numpy: pip install numpy")
+        return False
+    analyse_numpy.print_overview(db, user)
+    return True
+
+
+def command_track(db, args):
+    """
+    Subcommand to track a started challenge of a user.
+    """
+    if not get_challenge_for_habit(db, args.user, args.habit):
+        print(f"No started challenge for habit {args.habit} of {args.user}")
+        return 1
+    if args.date > date.today():
+        print("Invalid date. Tracking in the future is not possible")
+        return 1
+    track = Tracker(args.user)
+    track.import_challenge(db, args.habit)
+    track.safe_track(db, args.date)
+    return 0
+
+
+def command_start(db, args):
+    """
+    Subcommand to start a challenge for a habit.
+    """
+    if get_period(args.period) is None:
+        print(f"Unknown period {args.period}. Choose one of: " + ", ".join(period_names()))
+        return 1
+    if args.habit not in get_habits(db):
+        print(f"Unknown habit {args.habit}")
+        return 1
+    if args.habit in get_habits_started(db, args.user):
+        print(f"Challenge for habit {args.habit} already started")
+        return 1
+    safe_user_name(db, args.user)
+    Challenge(args.user, args.habit).store(db, args.period, args.interval)
+    print("Challenge started")
+    return 0
+
+
+def command_stop(db, args):
+    """
+    Subcommand to stop a started challenge.
+    """
+    if args.habit not in get_habits_started(db, args.user):
+        print(f"No started challenge for habit {args.habit} of {args.user}")
+        return 1
+    Challenge(args.user, args.habit).stop(db)
+    print("Challenge stopped")
+    return 0
+
+
+def command_habit(db, args):
+    """
+    Subcommand to create a new habit.
+    """
+    safe_user_name(db, args.user)
+    Habit(args.name, args.description, args.user).store(db)
+    print("Habit created")
+    return 0
+
+
+def command_search(db, args):
+    """
+    Subcommand to search habits by words or word prefixes of name and description.
+    """
+    habits = search_habits(db, args.text, args.not_started_by, args.limit)
+    for habit in habits:
+        print(f"{habit.name} ; {habit.description}")
+    return 0 if habits else 1
+
+
+def command_report(db, args):
+    """
+    Subcommand to list the streaks of every period of a challenge.
+    Without a challenge ID the latest challenge of the user for the habit is reported.
+    """
+    challenges = [chal for chal in list_challenges(db, args.user)
+                  if chal.challenge_id == args.challenge or (args.challenge is None and chal.habit == args.habit)]
+    if not challenges:
+        print("No challenge found")
+        return 1
+    chal = challenges[-1]
+    max_streak = list_streaks(db, chal.challenge_id, chal.period, "list")
+    print(f"Your longest streak was {max_streak} in a row!")
+    return 0
+
+
+def command_longest(db, args):
+    """
+    Subcommand to list all challenges of a user with their longest streak in a row.
+    """
+    print_longest_streaks(db, args.user)
+    return 0
+
+
+def command_overview(db, args):
+    """
+    Subcommand to print the analysis of all challenges of a user.
+    """
+    return 0 if print_overview(db, args.user) else 1
+
+
+def command_stats(db, args):
+    """
+    Subcommand to print the statistics and cohort ranking of all challenges of a user.
+    """
+    return 0 if print_statistics(db, args.user, name=args.db) else 1
+
+
+def command_due(db, args):
+    """
+    Subcommand to list the open challenges that have not reached their interval in the current period yet, of one
+    user or of all users (e.g. for a reminder job).
+    """
+    if args.user:
+        print_due(DueScheduler(db).due(args.user))
+        return 0
+    lists = [DueScheduler(shard).due_all(args.before) for shard in for_each_shard(args.db, db)]
+    print_due(list(heapq.merge(*lists, key=lambda entry: (entry.last_day, entry.challenge_id))))
+    return 0
+
+
+def command_heatmap(db, args):
+    """
+    Subcommand to print the heatmap of all challenges of a user and optionally write it to an SVG or HTML file.
+    """
+    if args.output and not args.output.endswith((".svg", ".html", ".htm")):
+        print("The heatmap file must end with .svg or .html")
+        return 1
+    print_heatmap(db, args.user, args.first_day, args.last_day, args.resolution, args.output)
+    return 0
+
+
+def command_leaderboard(db, args):
+    """
+    Subcommand to rank the longest streaks in a row of all challenges of all users.
+    """
+    from leaderboard import leaderboard, print_leaderboard
+    print_leaderboard(leaderboard(args.db, args.top, args.workers), args.per_habit)
+    return 0
+
+
+def command_import(db, args):
+    """
+    Subcommand to import tracking events from CSV or JSONL files.
+    """
+    from importer import import_events, read_events
+    for name in args.files:
+        if is_sharded(args.db):
+            done, missing = 0, 0
+            for file, events in route_events(args.db, read_events(name)).items():
+                shard = get_db(file)
+                result = import_events(shard, events)
+                shard.close()
+                done, missing = done + result[0], missing + result[1]
+        else:
+            done, missing = import_events(db, read_events(name))
+        print(f"{name}: {done} events imported, {missing} skipped without started challenge")
+    return 0
+
+
+def command_export(db, args):
+    """
+    Subcommand to export users, habits, challenges, trackings and streaks to a JSONL file or CSV files.
+    """
+    from exporter import export
+    if is_sharded(args.db) and args.user is None:
+        print("A sharded database is exported per user, please add --user")
+        return 1
+    counts = export(db, args.path, args.user, args.challenge, args.first_day, args.last_day)
+    print(", ".join(f"{count} {table}" for table, count in counts.items()) + " exported to " + args.path)
+    return 0
+
+
+def command_restore(db, args):
+    """
+    Subcommand to load an export into the database.
+    """
+    from exporter import read_export
+    from importer import restore_records
+    if is_sharded(args.db):
+        print("Restoring into a sharded database is not supported, restore into a database file and split it")
+        return 1
+    counts = restore_records(db, read_export(args.path))
+    print(", ".join(f"{count} {table}" for table, count in counts.items()) + " restored from " + args.path)
+    return 0
+
+
+def command_rebuild_summary(db, args):
+    """
+    Subcommand to regenerate the StreakSummary table from the Streaks table.
+    """
+    count = sum(rebuild_streak_summaries(shard) for shard in for_each_shard(args.db, db))
+    print(f"Rebuilt streak summary of {count} challenges")
+    return 0
+
+
+def command_streak_triggers(db, args):
+    """
+    Subcommand to enable or disable the streak detection by triggers inside SQLite.
+    """
+    for shard in for_each_shard(args.db, db):
+        if args.mode == "on":
+            create_streak_triggers(shard)
+        elif args.mode == "off":
+            drop_streak_triggers(shard)
+        names = list_streak_triggers(shard)
+    print("Streak triggers: " + (", ".join(names) if names else "off"))
+    return 0
+
+
+def command_compact(db, args):
+    """
+    Subcommand to roll old tracking entries up into daily counts and reclaim the freed space.
+    """
+    count = 0
+    pages = 0
+    for shard in for_each_shard(args.db, db):
+        count += compact_trackings(shard, args.horizon, args.archive)
+        if args.vacuum != "none":
+            pages += reclaim_space(shard, args.vacuum == "incremental")
+    print(f"Compacted {count} tracking entries older than {args.horizon} days, {pages} pages reclaimed")
+    return 0
+
+
+def command_serve(db, args):
+    """
+    Subcommand to run the local HTTP/JSON service until Ctrl+C.
+    """
+    if is_sharded(args.db):
+        print("The service needs a database file, not a sharded database")
+        return 1
+    from service import run
+    run(args.db, args.host, args.port, args.readers, args.window / 1000)
+    return 0
+
+
+def parse_args(argv: list = None):
+    """
+    Function to parse the command line. Without a subcommand the interactive menu is started.
+    :param argv: command line arguments, sys.argv by default
+    :return: parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Habit tracker. Without a command the interactive menu starts.")
+    parser.add_argument("--db", default="main.db",
+                        help="database file or folder of a sharded database (see shards.py)")
+    parser.add_argument("--profile", action="store_true",
+                        help="print SQL statement counts and latencies of the database functions at exit")
+    commands = parser.add_subparsers(dest="command")
+
+    track = commands.add_parser("track", help="track an action of a started challenge")
+    track.add_argument("--user", required=True)
+    track.add_argument("--habit", required=True)
+    track.add_argument("--date", type=date.fromisoformat, default=date.today(), help="YYYY-MM-DD, default today")
+    track.set_defaults(func=command_track)
+
+    start = commands.add_parser("start", help="start a challenge for a habit")
+    start.add_argument("--user", required=True)
+    start.add_argument("--habit", required=True)
+    start.add_argument("--period", required=True, help="e.g. daily, weekly, monthly, "
+                       "every 3 days (counted from the start date of the challenge)")
+    start.add_argument("--interval", type=int, required=True, help="number of trackings per period")
+    start.set_defaults(func=command_start)
+
+    stop = commands.add_parser("stop", help="stop a started challenge")
+    stop.add_argument("--user", required=True)
+    stop.add_argument("--habit", required=True)
+    stop.set_defaults(func=command_stop)
+
+    habit = commands.add_parser("habit", help="create a new habit")
+    habit.add_argument("--user", required=True)
+    habit.add_argument("--name", required=True)
+    habit.add_argument("--description", required=True)
+    habit.set_defaults(func=command_habit)
+
+    search = commands.add_parser("search", help="search habits by words or word prefixes")
+    search.add_argument("text", help="words or beginnings of words of name or description")
+    search.add_argument("--not-started-by", help="leave out the habits of the started challenges of this user")
+    search.add_argument("--limit", type=int, default=PAGE_SIZE, help=f"maximum number of habits, default {PAGE_SIZE}")
+    search.set_defaults(func=command_search)
+
+    report = commands.add_parser("report", help="list the streaks of every period of a challenge")
+    report.add_argument("--user", required=True)
+    selection = report.add_mutually_exclusive_group(required=True)
+    selection.add_argument("--habit")
+    selection.add_argument("--challenge", type=int, help="challenge ID")
+    report.set_defaults(func=command_report)
+
+    longest = commands.add_parser("longest", help="list the longest streaks of all challenges of a user")
+    longest.add_argument("--user", required=True)
+    longest.set_defaults(func=command_longest)
+
+    overview = commands.add_parser("overview", help="analyse all challenges of a user at once (needs numpy)")
+    overview.add_argument("--user", required=True)
+    overview.set_defaults(func=command_overview)
+
+    due = commands.add_parser("due", help="list the open challenges that still need trackings in this period")
+    due.add_argument("--user", help="only the challenges of this user, default all users")
+    due.add_argument("--before", type=date.fromisoformat, help="only deadlines on or before this date, YYYY-MM-DD")
+    due.set_defaults(func=command_due)
+
+    heatmaps = commands.add_parser("heatmap", help="show the trackings and streaks of all challenges of a user")
+    heatmaps.add_argument("--user", required=True)
+    heatmaps.add_argument("--resolution", choices=["day", "week", "month"], default="day", help="period of a cell")
+    heatmaps.add_argument("--from", dest="first_day", type=date.fromisoformat,
+                          help="first date, YYYY-MM-DD, default one year before the last date")
+    heatmaps.add_argument("--to", dest="last_day", type=date.fromisoformat, help="last date, YYYY-MM-DD, default today")
+    heatmaps.add_argument("--output", help="also write the heatmap to a file ending with .svg or .html")
+    heatmaps.set_defaults(func=command_heatmap)
+
+    statistics = commands.add_parser("stats", help="completion rate and cohort ranking of all challenges of a user")
+    statistics.add_argument("--user", required=True)
+    statistics.set_defaults(func=command_stats)
+
+    leaders = commands.add_parser("leaderboard", help="rank the longest streaks of all challenges of all users")
+    leaders.add_argument("--top", type=int, default=10, help="number of entries per list, default 10")
+    leaders.add_argument("--workers", type=int, help="number of worker processes, default the number of CPUs; "
+                                                     "1 computes the leaderboard in a single process")
+    leaders.add_argument("--per-habit", action="store_true", help="also list the leaders of every habit")
+    leaders.set_defaults(func=command_leaderboard)
+
+    imports = commands.add_parser("import", help="import tracking events from CSV or JSONL files")
+    imports.add_argument("files", nargs="+")
+    imports.set_defaults(func=command_import)
+
+    exports = commands.add_parser("export", help="export the data to a JSONL file or a directory of CSV files")
+    exports.add_argument("path", help="file ending with .jsonl or directory for one CSV file per table")
+    exports.add_argument("--user", help="export only the data of this user")
+    exports.add_argument("--challenge", type=int, help="export only the data of this challenge ID")
+    exports.add_argument("--from", dest="first_day", type=date.fromisoformat, help="first tracking date, YYYY-MM-DD")
+    exports.add_argument("--to", dest="last_day", type=date.fromisoformat, help="last tracking date, YYYY-MM-DD")
+    exports.set_defaults(func=command_export)
+
+    restore = commands.add_parser("restore", help="load an export into the database")
+    restore.add_argument("path", help="JSONL file or directory of CSV files of an export")
+    restore.set_defaults(func=command_restore)
+
+    rebuild = commands.add_parser("rebuild-summary", help="regenerate the streak summary of all challenges")
+    rebuild.set_defaults(func=command_rebuild_summary)
+
+    triggers = commands.add_parser("streak-triggers", help="detect streaks with triggers inside the database")
+    triggers.add_argument("mode", nargs="?", choices=["on", "off"], help="without mode the current state is printed")
+    triggers.set_defaults(func=command_streak_triggers)
+
+    compact = commands.add_parser("compact", help="roll old tracking entries up into daily counts")
+    compact.add_argument("--horizon", type=int, default=COMPACT_HORIZON,
+                         help=f"number of days whose tracking entries stay raw, default {COMPACT_HORIZON}")
+    compact.add_argument("--archive", help="database file the raw tracking entries are moved to")
+    compact.add_argument("--vacuum", choices=["full", "incremental", "none"], default="incremental",
+                         help="how the freed space is returned to the file system, default incremental")
+    compact.set_defaults(func=command_compact)
+
+    serve = commands.add_parser("serve", help="run the local HTTP/JSON service for devices")
+    serve.add_argument("--host", default="127.0.0.1", help="address to listen on, default 127.0.0.1")
+    serve.add_argument("--port", type=int, default=8080, help="TCP port, default 8080")
+    serve.add_argument("--readers", type=int, default=4, help="number of read-only connections, default 4")
+    serve.add_argument("--window", type=float, default=2.0,
+                       help="milliseconds the writer waits for more write requests of a batch, default 2")
+    serve.set_defaults(func=command_serve)
+
+    return parser.parse_args(argv)
+
+
+def main(argv: list = None):
+    """
+    Entry point of the program: runs a subcommand or the interactive menu.
+    :param argv: command line arguments, sys.argv by default
+    :return: exit code
+    """
+    args = parse_args(argv)
+    if args.profile:
+        profiling.enable()
+    if args.command is None:
+        cli(args.db)
+        return 0
+    db = get_db(args.db, user=getattr(args, "user", None))
+    try:
+        return args.func(db, args)
+    finally:
+        db.close()
+
+
 if __name__ == '__main__':
-    cli()
+    sys.exit(main())
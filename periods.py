@@ -0,0 +1,316 @@
+import re
+from datetime import date, timedelta
+from functools import lru_cache
+
+"""
+Difference between the julian day numbers of SQLite and the day ordinals (date.toordinal) stored in the database.
+"""
+JULIAN_OFFSET = 1721424.5
+
+
+class Period:
+    """
+    Base class of the periods in which a challenge is tracked.
+    Every date is mapped to a dense integer bucket, so that consecutive periods have consecutive bucket numbers.
+    Subclasses implement bucket(), first_day() and label().
+    """
+    name = ""
+
+    def bucket(self, day: date):
+        """
+        Function to map a date to the number of the period it belongs to.
+        :param day: date to map
+        :return: bucket number of the period
+        """
+        raise NotImplementedError
+
+    def day_bucket(self, day: int):
+        """
+        Function to map a day ordinal (as stored in the database) to the number of the period it belongs to.
+        :param day: day ordinal (date.toordinal)
+        :return: bucket number of the period
+        """
+        return self.bucket(date.fromordinal(day))
+
+    def first_day(self, bucket: int):
+        """
+        Function to find the first date of a period.
+        :param bucket: bucket number of the period
+        :return: first date of the period
+        """
+        raise NotImplementedError
+
+    def label(self, bucket: int):
+        """
+        Function to build a printable name of a period.
+        :param bucket: bucket number of the period
+        :return: printable name of the period
+        """
+        return str(self.first_day(bucket))
+
+    def last_day(self, bucket: int):
+        """
+        Function to find the last date of a period.
+        :param bucket: bucket number of the period
+        :return: last date of the period
+        """
+        return self.first_day(bucket + 1) - timedelta(days=1)
+
+    def sql_bucket(self, day: str):
+        """
+        Function to build the SQL expression of bucket(), used by the streak triggers of the database.
+        :param day: SQL expression of a day ordinal (e.g. NEW.Day)
+        :return: SQL expression of the bucket number or None if the period is only available in Python
+        """
+        return None
+
+    def sql_days(self, day: str):
+        """
+        Function to build the SQL expressions of the first and last day of the period of a day.
+        :param day: SQL expression of a day ordinal (e.g. NEW.Day)
+        :return: SQL expressions of the first and last day ordinal or None if the period is only available in Python
+        """
+        return None
+
+    def buckets(self, start_date: date, end_date: date):
+        """
+        Function to list all periods between two dates, also across year boundaries.
+        :param start_date: first date of the range
+        :param end_date: last date of the range
+        :return: range of bucket numbers from the period of the start date to the period of the end date
+        """
+        return range(self.bucket(start_date), self.bucket(end_date) + 1)
+
+
+class Daily(Period):
+    name = "daily"
+
+    def bucket(self, day):
+        return day.toordinal()
+
+    def day_bucket(self, day):
+        return day
+
+    def first_day(self, bucket):
+        return date.fromordinal(bucket)
+
+    def sql_bucket(self, day):
+        return f"({day})"
+
+    def sql_days(self, day):
+        return f"({day})", f"({day})"
+
+
+class Weekly(Period):
+    """
+    ISO weeks from Monday to Sunday. The 1st of January of year 1 is a Monday, so the ordinal divides into weeks.
+    """
+    name = "weekly"
+
+    def bucket(self, day):
+        return (day.toordinal() - 1) // 7
+
+    def day_bucket(self, day):
+        return (day - 1) // 7
+
+    def first_day(self, bucket):
+        return date.fromordinal(bucket * 7 + 1)
+
+    def sql_bucket(self, day):
+        return f"(({day} - 1) / 7)"
+
+    def sql_days(self, day):
+        return f"(({day} - 1) / 7 * 7 + 1)", f"(({day} - 1) / 7 * 7 + 7)"
+
+    def label(self, bucket):
+        iso = self.first_day(bucket).isocalendar()
+        return "CW" + str(iso.week) + "-" + str(iso.year)
+
+
+class Monthly(Period):
+    name = "monthly"
+
+    def bucket(self, day):
+        return day.year * 12 + day.month - 1
+
+    def day_bucket(self, day):
+        row = calendar_row(day)
+        return row[0] * 12 + row[1] - 1
+
+    def first_day(self, bucket):
+        return date(bucket // 12, bucket % 12 + 1, 1)
+
+    def sql_bucket(self, day):
+        julian = f"{day} + {JULIAN_OFFSET}"
+        return f"(CAST(strftime('%Y', {julian}) AS INTEGER) * 12 + CAST(strftime('%m', {julian}) AS INTEGER) - 1)"
+
+    def sql_days(self, day):
+        julian = f"{day} + {JULIAN_OFFSET}"
+        return (f"CAST(julianday({julian}, 'start of month') - {JULIAN_OFFSET} AS INTEGER)",
+                f"CAST(julianday({julian}, 'start of month', '+1 month', '-1 day') - {JULIAN_OFFSET} AS INTEGER)")
+
+    def label(self, bucket):
+        return "month: " + str(bucket % 12 + 1) + "-" + str(bucket // 12)
+
+
+class EveryNDays(Period):
+    """
+    Periods of a fixed number of days, counted from an anchor date. New challenges anchor the periods on their start
+    date, which is part of the period name then, e.g. "every 3 days from 2024-01-05" (see anchored_period).
+    """
+    def __init__(self, days: int, anchor: date = None):
+        """
+        :param days: length of the period in days
+        :param anchor: first day of a period, the 1st of January of year 1 for names without anchor
+        """
+        self.days = days
+        self.anchor = (anchor or date(1, 1, 1)).toordinal()
+        self.name = f"every {days} days" if anchor is None else f"every {days} days from {anchor}"
+
+    def bucket(self, day):
+        return (day.toordinal() - self.anchor) // self.days
+
+    def first_day(self, bucket):
+        return date.fromordinal(self.anchor + bucket * self.days)
+
+    def label(self, bucket):
+        return str(self.first_day(bucket)) + " - " + str(self.last_day(bucket))
+
+
+class Weekdays(Period):
+    """
+    One period per working day (Monday to Friday). Trackings on a weekend count for the Friday before.
+    """
+    name = "weekdays"
+
+    def bucket(self, day):
+        days = day.toordinal() - 1
+        return days // 7 * 5 + min(days % 7, 4)
+
+    def first_day(self, bucket):
+        return date.fromordinal(bucket // 5 * 7 + bucket % 5 + 1)
+
+    def sql_bucket(self, day):
+        return f"(({day} - 1) / 7 * 5 + MIN(({day} - 1) % 7, 4))"
+
+    def sql_days(self, day):
+        return (f"(({day} - 1) / 7 * 7 + 1 + MIN(({day} - 1) % 7, 4))",
+                f"(CASE WHEN ({day} - 1) % 7 >= 4 THEN ({day} - 1) / 7 * 7 + 7 ELSE {day} END)")
+
+
+PERIODS = {}
+
+
+def register_period(period: Period):
+    """
+    Function to make a period available for challenges under its name.
+    :param period: period object to register
+    :return: none
+    """
+    PERIODS[period.name] = period
+
+
+def get_period(name: str):
+    """
+    Function to find the period object for the period name of a challenge.
+    Names like "every 3 days" or "every 3 days from 2024-01-05" create and register a period of that length.
+    :param name: period name stored in the Challenges table (e.g. daily)
+    :return: period object or None for an unknown period name
+    """
+    period = PERIODS.get(name)
+    if period is None:
+        match = re.fullmatch(r"every (\d+) days(?: from (\d{4}-\d{2}-\d{2}))?", name or "")
+        if match and int(match.group(1)) > 0:
+            try:
+                anchor = date.fromisoformat(match.group(2)) if match.group(2) else None
+            except ValueError:
+                return None
+            period = EveryNDays(int(match.group(1)), anchor)
+            register_period(period)
+    return period
+
+
+def anchored_period(name: str, start_date: date):
+    """
+    Function to find the period name under which a new challenge is stored. Periods of a fixed number of days
+    without anchor are anchored on the start date of the challenge, so that its first period begins that day.
+    :param name: period name chosen for the challenge (e.g. every 3 days)
+    :param start_date: start date of the challenge
+    :return: period name to store in the Challenges table
+    """
+    period = get_period(name)
+    if isinstance(period, EveryNDays) and period.name == f"every {period.days} days":
+        return EveryNDays(period.days, as_date(start_date)).name
+    return name
+
+
+def period_names():
+    """
+    Function to list the names of all registered periods.
+    :return: list of period names
+    """
+    return list(PERIODS)
+
+
+def as_date(value):
+    """
+    Function to convert a date string (YYYY-MM-DD) into a date object. Date objects are returned unchanged.
+    :param value: date or date string
+    :return: date object
+    """
+    if isinstance(value, str):
+        return date.fromisoformat(value)
+    return value
+
+
+def as_day(value):
+    """
+    Function to convert a date or date string (YYYY-MM-DD) into the day ordinal stored in the database.
+    Day ordinals are returned unchanged.
+    :param value: date, date string or day ordinal
+    :return: day ordinal (date.toordinal)
+    """
+    if isinstance(value, int):
+        return value
+    return as_date(value).toordinal()
+
+
+@lru_cache(maxsize=8192)
+def calendar_row(day: int):
+    """
+    Function to compute the calendar information of a day, as stored in the Calendar table.
+    The results are cached, because trackings concentrate on few days.
+    :param day: day ordinal (date.toordinal)
+    :return: year, month, ISO year, ISO week and ISO weekday (1 = Monday) of the day
+    """
+    value = date.fromordinal(day)
+    iso = value.isocalendar()
+    return value.year, value.month, iso.year, iso.week, iso.weekday
+
+
+def sql_calendar_row(day: str):
+    """
+    Function to build the SQL expressions of calendar_row(), used by the calendar trigger of the database.
+    The ISO year and week are those of the Thursday of the same week, as SQLite has no ISO week format.
+    :param day: SQL expression of a day ordinal (e.g. NEW.Day)
+    :return: SQL expressions of year, month, ISO year, ISO week and ISO weekday of the day
+    """
+    julian = f"{day} + {JULIAN_OFFSET}"
+    thursday = f"{day} - ({day} - 1) % 7 + 3 + {JULIAN_OFFSET}"
+    return (f"CAST(strftime('%Y', {julian}) AS INTEGER)", f"CAST(strftime('%m', {julian}) AS INTEGER)",
+            f"CAST(strftime('%Y', {thursday}) AS INTEGER)", f"(CAST(strftime('%j', {thursday}) AS INTEGER) - 1) / 7 + 1",
+            f"(({day} - 1) % 7 + 1)")
+
+
+def date_parts(day):
+    """
+    Function to extract week, month and year of a date as number.
+    :param day: date, date string (YYYY-MM-DD) or day ordinal
+    :return: week-, month- and year number of the date
+    """
+    row = calendar_row(as_day(day))
+    return row[3], row[1], row[0]
+
+
+for _period in (Daily(), Weekly(), Monthly(), Weekdays()):
+    register_period(_period)
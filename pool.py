@@ -0,0 +1,138 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import quote
+from database import get_db, transaction, SYNCHRONOUS
+from cache import CachedConnection
+from profiling import enabled, install
+
+
+def connect_read_only(name: str = "main.db", busy_timeout: float = 5.0, **connect_args):
+    """
+    Function to open a read-only connection to a database file, e.g. for a reader thread or a worker process.
+    The schema is not migrated, the database must have been opened with database.get_db before.
+    :param name: name of the database/sql file
+    :param busy_timeout: seconds to wait for a locked database
+    :param connect_args: further arguments for sqlite3.connect, e.g. check_same_thread
+    :return: a read-only sqlite3 database connection
+    """
+    uri = "file:" + quote(os.path.abspath(name)) + "?mode=ro"
+    connect_args.setdefault("factory", CachedConnection)
+    db = sqlite3.connect(uri, uri=True, timeout=busy_timeout, **connect_args)
+    if enabled():
+        install(db)
+    return db
+
+
+class ConnectionPool:
+    def __init__(self, name: str = "main.db", readers: int = 4, busy_timeout: float = 5.0,
+                 synchronous: str = SYNCHRONOUS):
+        """
+        Pool of sqlite3 connections to one database file, that can be shared between threads.
+        All writes go through a single writer connection, one thread at a time.
+        Reads use N read-only connections, which run in parallel to the writer in WAL journal mode.
+        :param name: name of the database/sql file
+        :param readers: number of read-only connections
+        :param busy_timeout: seconds to wait for a locked database or a free connection
+        :param synchronous: SQLite synchronous level of the writer connection
+        """
+        self.name = name
+        self.busy_timeout = busy_timeout
+        self.writer_connection = get_db(name, synchronous=synchronous, timeout=busy_timeout,
+                                        check_same_thread=False)
+        self.writer_lock = threading.Lock()
+        self.readers = queue.Queue()
+        self.reader_connections = []
+        for i in range(readers):
+            db = connect_read_only(name, busy_timeout, check_same_thread=False)
+            self.reader_connections.append(db)
+            self.readers.put(db)
+        self.stats_lock = threading.Lock()
+        self.counters = {"reader": {"checkouts": 0, "in_use": 0, "wait": 0.0, "max_wait": 0.0, "held": 0.0},
+                         "writer": {"checkouts": 0, "in_use": 0, "wait": 0.0, "max_wait": 0.0, "held": 0.0}}
+
+    def checkout(self, kind: str, wait: float):
+        """
+        Function to count the checkout of a connection.
+        :param kind: "reader" or "writer"
+        :param wait: seconds waited for the connection
+        :return: none
+        """
+        with self.stats_lock:
+            counter = self.counters[kind]
+            counter["checkouts"] += 1
+            counter["in_use"] += 1
+            counter["wait"] += wait
+            counter["max_wait"] = max(counter["max_wait"], wait)
+
+    def checkin(self, kind: str, held: float):
+        """
+        Function to count the return of a connection.
+        :param kind: "reader" or "writer"
+        :param held: seconds the connection was used
+        :return: none
+        """
+        with self.stats_lock:
+            self.counters[kind]["in_use"] -= 1
+            self.counters[kind]["held"] += held
+
+    def stats(self):
+        """
+        Function to read the checkout counters of the pool.
+        :return: dictionary with checkouts, connections in use, total and maximum waiting seconds and total seconds
+        in use, for "reader" and "writer"
+        """
+        with self.stats_lock:
+            return {kind: dict(counter) for kind, counter in self.counters.items()}
+
+    @contextmanager
+    def reader(self):
+        """
+        Context manager to borrow a read-only connection.
+        :return: a read-only sqlite3 database connection
+        """
+        start = time.perf_counter()
+        try:
+            db = self.readers.get(timeout=self.busy_timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No reader connection free after {self.busy_timeout} seconds") from None
+        checked_out = time.perf_counter()
+        self.checkout("reader", checked_out - start)
+        try:
+            yield db
+        finally:
+            if db.in_transaction:
+                db.rollback()
+            self.readers.put(db)
+            self.checkin("reader", time.perf_counter() - checked_out)
+
+    @contextmanager
+    def writer(self):
+        """
+        Context manager to borrow the writer connection. Only one thread at a time holds it and everything written in
+        the block is committed as one transaction.
+        :return: the writer sqlite3 database connection
+        """
+        start = time.perf_counter()
+        if not self.writer_lock.acquire(timeout=self.busy_timeout):
+            raise TimeoutError(f"Writer connection not free after {self.busy_timeout} seconds")
+        checked_out = time.perf_counter()
+        self.checkout("writer", checked_out - start)
+        try:
+            with transaction(self.writer_connection):
+                yield self.writer_connection
+        finally:
+            self.writer_lock.release()
+            self.checkin("writer", time.perf_counter() - checked_out)
+
+    def close(self):
+        """
+        Function to close all connections of the pool.
+        :return: none
+        """
+        for db in self.reader_connections:
+            db.close()
+        self.writer_connection.close()
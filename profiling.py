@@ -0,0 +1,227 @@
+import atexit
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+"""
+Profiles that currently record statements and function calls, and the profile enabled for the whole program run
+(with the environment variable HABIT_PROFILE or the --profile flag of main.py).
+"""
+collectors = []
+program_profile = None
+running = threading.local()
+
+
+class Profile:
+    def __init__(self):
+        """
+        Record of SQL statements, returned rows and call latencies of the instrumented database functions.
+        """
+        self.statements = 0
+        self.rows = 0
+        self.functions = {}
+
+    def function(self, name: str):
+        """
+        Function to find the counters of an instrumented function.
+        :param name: name of the function
+        :return: dictionary with calls, statements, rows, total seconds and latency histogram of the function
+        """
+        if name not in self.functions:
+            self.functions[name] = {"calls": 0, "statements": 0, "rows": 0, "seconds": 0.0, "histogram": {}}
+        return self.functions[name]
+
+    def record_statement(self, name: str):
+        """
+        Function to count an executed SQL statement.
+        :param name: name of the instrumented function that executed the statement or None
+        :return: none
+        """
+        self.statements += 1
+        if name is not None:
+            self.function(name)["statements"] += 1
+
+    def record_call(self, name: str, seconds: float, rows: int):
+        """
+        Function to count a call of an instrumented function. The latency is counted in a histogram with
+        power-of-two buckets in microseconds.
+        :param name: name of the function
+        :param seconds: duration of the call
+        :param rows: number of rows returned by the call
+        :return: none
+        """
+        counter = self.function(name)
+        counter["calls"] += 1
+        counter["rows"] += rows
+        counter["seconds"] += seconds
+        bucket = 1 << int(seconds * 1000000).bit_length()
+        counter["histogram"][bucket] = counter["histogram"].get(bucket, 0) + 1
+        self.rows += rows
+
+    def percentile(self, name: str, share: float):
+        """
+        Function to estimate a latency percentile of a function from its histogram.
+        :param name: name of the function
+        :param share: percentile as share between 0 and 1 (e.g. 0.95)
+        :return: upper limit of the histogram bucket of the percentile in microseconds
+        """
+        counter = self.function(name)
+        seen = 0
+        for bucket in sorted(counter["histogram"]):
+            seen += counter["histogram"][bucket]
+            if seen >= share * counter["calls"]:
+                return bucket
+        return 0
+
+    def summary(self):
+        """
+        Function to format the recorded counters as table, slowest functions first.
+        :return: summary text
+        """
+        lines = [f"{self.statements} SQL statements, {self.rows} rows returned",
+                 f"{'function':<32}{'calls':>8}{'stmts':>8}{'rows':>10}{'total ms':>11}{'mean us':>10}"
+                 f"{'p50 us':>9}{'p95 us':>9}"]
+        for name, counter in sorted(self.functions.items(), key=lambda elt: -elt[1]["seconds"]):
+            if counter["calls"] == 0:
+                continue
+            lines.append(f"{name:<32}{counter['calls']:>8}{counter['statements']:>8}{counter['rows']:>10}"
+                         f"{counter['seconds'] * 1000:>11.2f}{counter['seconds'] * 1000000 / counter['calls']:>10.0f}"
+                         f"{self.percentile(name, 0.5):>9}{self.percentile(name, 0.95):>9}")
+        return "\n".join(lines)
+
+
+def current_function():
+    """
+    Function to find the innermost instrumented function running in this thread.
+    :return: name of the function or None
+    """
+    stack = getattr(running, "stack", None)
+    return stack[-1] if stack else None
+
+
+def trace(statement: str):
+    """
+    Trace callback for sqlite3 connections (Connection.set_trace_callback) that counts every executed statement.
+    :param statement: executed SQL statement
+    :return: none
+    """
+    if collectors:
+        name = current_function()
+        for profile in collectors:
+            profile.record_statement(name)
+
+
+def count_rows(result):
+    """
+    Function to count the rows returned by a database function.
+    :param result: return value of the function
+    :return: length of a returned list, 1 for a single row or value, 0 otherwise
+    """
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, (tuple, int, str)):
+        return 1
+    return 0
+
+
+def profiled(function):
+    """
+    Decorator to record calls of a database function while profiling is active. Without an active profile only a
+    single check is added to the call.
+    :param function: function to wrap
+    :return: wrapped function
+    """
+    name = function.__name__
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        if not collectors:
+            return function(*args, **kwargs)
+        if not hasattr(running, "stack"):
+            running.stack = []
+        running.stack.append(name)
+        start = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            running.stack.pop()
+        rows = count_rows(result)
+        for profile in collectors:
+            profile.record_call(name, seconds, rows)
+        return result
+
+    return wrapper
+
+
+def install(db):
+    """
+    Function to count the statements of a connection while profiling is active.
+    :param db: an initialized sqlite3 database connection
+    :return: none
+    """
+    db.set_trace_callback(trace)
+
+
+def enabled():
+    """
+    Function to check whether profiling is enabled for the whole program run.
+    :return: True if enabled
+    """
+    return program_profile is not None
+
+
+def enable(output=sys.stderr):
+    """
+    Function to enable profiling for the whole program run. The summary is printed when the program exits.
+    Connections opened by database.get_db afterwards are traced.
+    :param output: file for the summary
+    :return: the program profile
+    """
+    global program_profile
+    if program_profile is None:
+        program_profile = Profile()
+        collectors.append(program_profile)
+        atexit.register(lambda: print(program_profile.summary(), file=output))
+    return program_profile
+
+
+@contextmanager
+def capture(db=None):
+    """
+    Context manager to record the statements and calls of a block of code, e.g. to check query budgets in tests.
+    :param db: optional connection, whose statements are counted during the block
+    :return: profile of the block
+    """
+    profile = Profile()
+    collectors.append(profile)
+    if db is not None:
+        install(db)
+    try:
+        yield profile
+    finally:
+        collectors.remove(profile)
+        if db is not None and not enabled():
+            db.set_trace_callback(None)
+
+
+@contextmanager
+def query_budget(db, statements: int):
+    """
+    Context manager that fails if a block of code executes more SQL statements than allowed.
+    :param db: connection whose statements are counted
+    :param statements: maximum number of statements
+    :return: profile of the block
+    """
+    with capture(db) as profile:
+        yield profile
+    if profile.statements > statements:
+        raise AssertionError(f"{profile.statements} SQL statements executed, budget is {statements}\n"
+                             + profile.summary())
+
+
+if os.environ.get("HABIT_PROFILE"):
+    enable()
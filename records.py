@@ -0,0 +1,211 @@
+from datetime import date
+from operator import itemgetter
+
+
+class Record:
+    """
+    Base class of the row types of the database tables. The fields are slots, so a record needs about the memory of
+    a tuple instead of an object with a dictionary, and its values are read by name instead of by column position.
+    Subclasses define the fields as __slots__ in the order of the table columns.
+    """
+    __slots__ = ()
+
+    def values(self):
+        """
+        Function to list the values of all fields.
+        :return: tuple of the values in the order of the fields
+        """
+        return tuple(getattr(self, name) for name in self.fields())
+
+    @classmethod
+    def fields(cls):
+        """
+        Function to list the field names of the record type, also for subclasses without own fields.
+        :return: tuple of the field names
+        """
+        return next(klass.__slots__ for klass in cls.__mro__ if klass.__slots__)
+
+    def __eq__(self, other):
+        return isinstance(other, Record) and self.fields() == other.fields() and self.values() == other.values()
+
+    def __repr__(self):
+        return type(self).__name__ + "(" + ", ".join(f"{name}={getattr(self, name)!r}"
+                                                      for name in self.fields()) + ")"
+
+
+class User(Record):
+    __slots__ = ("name", )
+
+    def __init__(self, name: str = None):
+        self.name = name
+
+    @property
+    def key(self):
+        """
+        Key of the keyset pagination (see database.paginate).
+        """
+        return self.name
+
+
+class Habit(Record):
+    __slots__ = ("name", "description", "creation_date", "user")
+
+    def __init__(self, name: str = None, description: str = None, creation_date: str = None, user: str = None):
+        self.name = name
+        self.description = description
+        self.creation_date = creation_date
+        self.user = user
+
+    @property
+    def key(self):
+        """
+        Key of the keyset pagination (see database.paginate).
+        """
+        return self.name
+
+
+class Challenge(Record):
+    __slots__ = ("challenge_id", "user", "habit", "period", "interval", "start_date", "end_date")
+
+    def __init__(self, challenge_id: int = None, user: str = None, habit: str = None, period: str = None,
+                 interval: int = None, start_date: str = None, end_date: str = None):
+        self.challenge_id = challenge_id
+        self.user = user
+        self.habit = habit
+        self.period = period
+        self.interval = interval
+        self.start_date = start_date
+        self.end_date = end_date
+
+    @property
+    def key(self):
+        """
+        Key of the keyset pagination (see database.paginate).
+        """
+        return self.challenge_id
+
+
+class TrackEntry(Record):
+    __slots__ = ("tracker_id", "challenge_id", "day")
+
+    def __init__(self, tracker_id: int = None, challenge_id: int = None, day: int = None):
+        self.tracker_id = tracker_id
+        self.challenge_id = challenge_id
+        self.day = day
+
+    @property
+    def date(self):
+        """
+        Date of the tracking, the table stores the day ordinal (date.toordinal).
+        """
+        return date.fromordinal(self.day)
+
+
+class Streak(Record):
+    __slots__ = ("streak_id", "challenge_id", "day")
+
+    def __init__(self, streak_id: int = None, challenge_id: int = None, day: int = None):
+        self.streak_id = streak_id
+        self.challenge_id = challenge_id
+        self.day = day
+
+    @property
+    def date(self):
+        """
+        Date of the streak, the table stores the day ordinal (date.toordinal).
+        """
+        return date.fromordinal(self.day)
+
+
+class ChallengeStats(Record):
+    __slots__ = ("challenge_id", "user", "habit", "period", "elapsed", "completions", "completion_percent",
+                 "trackings", "longest")
+
+    def __init__(self, challenge_id: int = None, user: str = None, habit: str = None, period: str = None,
+                 elapsed: int = None, completions: int = None, completion_percent: int = None, trackings: int = None,
+                 longest: int = None):
+        self.challenge_id = challenge_id
+        self.user = user
+        self.habit = habit
+        self.period = period
+        self.elapsed = elapsed
+        self.completions = completions
+        self.completion_percent = completion_percent
+        self.trackings = trackings
+        self.longest = longest
+
+    @property
+    def completion_rate(self):
+        """
+        Share of the elapsed periods with a streak, between 0 and 1.
+        """
+        return self.completions / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def trackings_per_period(self):
+        """
+        Average number of tracking entries per elapsed period.
+        """
+        return self.trackings / self.elapsed if self.elapsed else 0.0
+
+
+class DueChallenge(Record):
+    __slots__ = ("challenge_id", "user", "habit", "period", "interval", "first_day", "last_day", "tracked")
+
+    def __init__(self, challenge_id: int = None, user: str = None, habit: str = None, period: str = None,
+                 interval: int = None, first_day: int = None, last_day: int = None, tracked: int = None):
+        self.challenge_id = challenge_id
+        self.user = user
+        self.habit = habit
+        self.period = period
+        self.interval = interval
+        self.first_day = first_day
+        self.last_day = last_day
+        self.tracked = tracked
+
+    @property
+    def remaining(self):
+        """
+        Number of trackings still needed in the current period for a streak.
+        """
+        return max(self.interval - self.tracked, 0)
+
+    @property
+    def deadline(self):
+        """
+        Last date of the current period as date object.
+        """
+        return date.fromordinal(self.last_day)
+
+
+def row_factory(record):
+    """
+    Function to build a sqlite3 row factory (cursor.row_factory) that returns records instead of tuples.
+    The columns of a query are matched to the fields by name, ignoring case and underscores (e.g. ChallengeID is
+    challenge_id), so queries may select any subset of the fields in any order. Fields without column are None.
+    The matching is done once per query, not per row.
+    :param record: record type, e.g. Challenge
+    :return: row factory function
+    """
+    fields = {name.replace("_", ""): n for n, name in enumerate(record.fields())}
+    layout = [(None, None)]
+
+    def factory(cursor, row):
+        description, getter = layout[0]
+        if description is not cursor.description:
+            description = cursor.description
+            positions = [len(description)] * len(fields)
+            for n, column in enumerate(description):
+                positions[fields[column[0].replace("_", "").lower()]] = n
+            if positions == list(range(len(positions))) and len(description) == len(positions):
+                getter = None
+            elif len(positions) == 1:
+                getter = lambda values, position=positions[0]: (values[position], )
+            else:
+                getter = itemgetter(*positions)
+            layout[0] = description, getter
+        if getter is None:
+            return record(*row)
+        return record(*getter(row + (None, )))
+
+    return factory
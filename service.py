@@ -0,0 +1,485 @@
+import argparse
+import asyncio
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from urllib.parse import urlsplit, parse_qsl
+from analyse import list_streaks
+from challenge import Challenge
+from database import (get_db, get_habits, get_habits_started, get_challenge_for_habit, list_challenges,
+                      safe_user_name, count_current_trackings)
+from due import DueScheduler
+from periods import get_period, period_names
+from pool import ConnectionPool
+from tracker import Tracker
+
+"""
+Address of the service, it only listens on the local machine by default.
+"""
+HOST = "127.0.0.1"
+PORT = 8080
+"""
+Seconds the writer task waits after the first queued write request for more requests of the same batch, and the
+largest number of write requests per transaction.
+"""
+BATCH_WINDOW = 0.002
+BATCH_SIZE = 500
+"""
+Largest accepted request body in bytes.
+"""
+MAX_BODY = 65536
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 409: "Conflict",
+           413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class RequestError(Exception):
+    def __init__(self, status: int, message: str):
+        """
+        Error of a request that is answered with an HTTP status other than 200.
+        :param status: HTTP status code
+        :param message: error text of the JSON response
+        """
+        super().__init__(message)
+        self.status = status
+
+
+def field(request: dict, name: str):
+    """
+    Function to read a required text field of a request.
+    :param request: JSON body or query parameters of the request
+    :param name: name of the field
+    :return: value of the field
+    """
+    value = request.get(name)
+    if not isinstance(value, str) or not value:
+        raise RequestError(400, f"Field {name} is required")
+    return value
+
+
+def track(db, request: dict):
+    """
+    Function to track an action of a started challenge (POST /track, fields user, habit and optional date).
+    :param db: the writer sqlite3 database connection
+    :param request: JSON body of the request
+    :return: challenge ID, date, number of trackings in the period of the date, interval and whether the streak is
+    reached
+    """
+    user = field(request, "user")
+    habit = field(request, "habit")
+    try:
+        day = date.fromisoformat(request["date"]) if request.get("date") else date.today()
+    except (TypeError, ValueError):
+        raise RequestError(400, "Field date must be YYYY-MM-DD") from None
+    if day > date.today():
+        raise RequestError(400, "Tracking in the future is not possible")
+    if not get_challenge_for_habit(db, user, habit):
+        raise RequestError(404, f"No started challenge for habit {habit} of {user}")
+    tracker = Tracker(user)
+    tracker.import_challenge(db, habit)
+    tracked = tracker.store_track(db, day)
+    return {"challenge_id": tracker.challengeID, "date": str(day), "tracked": tracked, "interval": tracker.interval,
+            "streak": tracked >= tracker.interval}
+
+
+def start(db, request: dict):
+    """
+    Function to start a challenge for a habit (POST /start, fields user, habit, period and interval).
+    :param db: the writer sqlite3 database connection
+    :param request: JSON body of the request
+    :return: challenge ID of the new challenge
+    """
+    user = field(request, "user")
+    habit = field(request, "habit")
+    period = field(request, "period")
+    interval = request.get("interval")
+    if get_period(period) is None:
+        raise RequestError(400, f"Unknown period {period}. Choose one of: " + ", ".join(period_names()))
+    if not isinstance(interval, int) or isinstance(interval, bool) or interval < 1:
+        raise RequestError(400, "Field interval must be a positive number")
+    if habit not in get_habits(db):
+        raise RequestError(404, f"Unknown habit {habit}")
+    if habit in get_habits_started(db, user):
+        raise RequestError(409, f"Challenge for habit {habit} already started")
+    safe_user_name(db, user)
+    Challenge(user, habit).store(db, period, interval)
+    return {"challenge_id": get_challenge_for_habit(db, user, habit)[0].challenge_id}
+
+
+def stop(db, request: dict):
+    """
+    Function to stop a started challenge (POST /stop, fields user and habit).
+    :param db: the writer sqlite3 database connection
+    :param request: JSON body of the request
+    :return: challenge ID of the stopped challenge
+    """
+    user = field(request, "user")
+    habit = field(request, "habit")
+    challenge = get_challenge_for_habit(db, user, habit)
+    if not challenge:
+        raise RequestError(404, f"No started challenge for habit {habit} of {user}")
+    Challenge(user, habit).stop(db)
+    return {"challenge_id": challenge[0].challenge_id}
+
+
+def streaks(db, request: dict):
+    """
+    Function to list the challenges of a user with their longest streak in a row (GET /streaks?user=...&habit=...).
+    :param db: a read-only sqlite3 database connection
+    :param request: query parameters of the request, the habit is optional
+    :return: list of the challenges with their longest run of streaks
+    """
+    user = field(request, "user")
+    habit = request.get("habit")
+    return {"user": user, "challenges": [
+        {"challenge_id": chal.challenge_id, "habit": chal.habit, "period": chal.period, "start_date": chal.start_date,
+         "end_date": chal.end_date, "longest": list_streaks(db, chal.challenge_id, chal.period, "")}
+        for chal in list_challenges(db, user) if habit is None or chal.habit == habit]}
+
+
+"""
+Endpoints: POST requests are writes, which go through the queue of the writer task, GET requests are reads, which
+run on the read-only connections of the pool.
+"""
+WRITES = {"/track": track, "/start": start, "/stop": stop}
+READS = {"/streaks": streaks}
+
+
+def respond(handler, db, request: dict):
+    """
+    Function to run a request handler and turn its result or error into an HTTP status and a JSON object.
+    :param handler: request handler (e.g. track)
+    :param db: sqlite3 database connection of the handler
+    :param request: JSON body or query parameters of the request
+    :return: HTTP status and result
+    """
+    try:
+        return 200, handler(db, request)
+    except RequestError as error:
+        return error.status, {"error": str(error)}
+
+
+def write_request(db, handler, request: dict):
+    """
+    Function to run one write request of a batch in a savepoint of the batch transaction. A request that is refused
+    or fails with an error other than a database error is rolled back to the savepoint and answered on its own,
+    with 400 for malformed values (e.g. a field of the wrong type) and 500 otherwise, so it doesn't affect the
+    other requests of the batch. Database errors fail the whole transaction (see write_batch).
+    :param db: the writer sqlite3 database connection inside the batch transaction
+    :param handler: request handler (e.g. track)
+    :param request: JSON body of the request
+    :return: HTTP status and result
+    """
+    db.execute("""SAVEPOINT request""")
+    try:
+        status, result = respond(handler, db, request)
+    except sqlite3.Error:
+        raise
+    except (TypeError, ValueError, KeyError, AttributeError) as error:
+        status, result = 400, {"error": f"Malformed request: {error}"}
+    except Exception as error:
+        status, result = 500, {"error": str(error)}
+    if status != 200:
+        db.execute("""ROLLBACK TO request""")
+    db.execute("""RELEASE request""")
+    return status, result
+
+
+def write_batch(pool: ConnectionPool, batch: list):
+    """
+    Function to run a batch of write requests in one transaction of the writer connection, so that the commit (and
+    its fsync) is shared by all requests of the batch. Requests that are refused or fail don't write and don't
+    affect the others (see write_request). If the transaction fails, every request is repeated in a transaction of
+    its own, so that only the failing request gets an error.
+    :param pool: connection pool of the service
+    :param batch: list of request handler and request
+    :return: list of HTTP status and result per request
+    """
+    try:
+        with pool.writer() as db:
+            return [write_request(db, handler, request) for handler, request in batch]
+    except sqlite3.Error:
+        if len(batch) == 1:
+            raise
+    results = []
+    for elt in batch:
+        try:
+            results += write_batch(pool, [elt])
+        except sqlite3.Error as error:
+            results.append((500, {"error": str(error)}))
+    return results
+
+
+class HabitService:
+    def __init__(self, name: str = "main.db", readers: int = 4, window: float = BATCH_WINDOW,
+                 batch_size: int = BATCH_SIZE):
+        """
+        Local HTTP/JSON service to track habits and query streaks, built on asyncio streams of the standard library.
+        Write requests are put into a queue, which a single writer task drains in batches: it waits a few
+        milliseconds after the first request and writes everything queued until then in one transaction.
+        Read requests run in threads on the read-only connections of a ConnectionPool, in parallel to the writer.
+        The due challenges (GET /due) are kept in memory by a DueScheduler, which the writer task updates after every
+        batch.
+        :param name: name of the database/sql file
+        :param readers: number of read-only connections and reader threads
+        :param window: seconds the writer waits for more requests of a batch
+        :param batch_size: largest number of write requests per transaction
+        """
+        self.pool = ConnectionPool(name, readers)
+        self.window = window
+        self.batch_size = batch_size
+        self.queue = None
+        self.writer_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="writer")
+        self.reader_threads = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="reader")
+        self.counters = {"requests": 0, "writes": 0, "batches": 0, "largest_batch": 0}
+        self.scheduler = None
+        self.advancing = None
+        self.port = None
+
+    async def write(self, handler, request: dict):
+        """
+        Function to queue a write request and wait until its batch is committed.
+        :param handler: request handler (e.g. track)
+        :param request: JSON body of the request
+        :return: HTTP status and result
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((handler, request, future))
+        return await future
+
+    async def writer(self):
+        """
+        Writer task: drains the queue of write requests in batches, one transaction per batch.
+        :return: none, runs until it is cancelled
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            if self.window > 0:
+                await asyncio.sleep(self.window)
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                results = await loop.run_in_executor(self.writer_thread, write_batch, self.pool,
+                                                     [(handler, request) for handler, request, future in batch])
+            except Exception as error:
+                results = [(500, {"error": str(error)})] * len(batch)
+            for (handler, request, future), result in zip(batch, results):
+                self.schedule(handler, request, *result)
+                if not future.done():
+                    future.set_result(result)
+            self.counters["writes"] += len(batch)
+            self.counters["batches"] += 1
+            self.counters["largest_batch"] = max(self.counters["largest_batch"], len(batch))
+
+    def schedule(self, handler, request: dict, status: int, result: dict):
+        """
+        Function to update the due challenges after a committed write request: trackings update the count of their
+        challenge in memory, started and stopped challenges reload the challenges of the user.
+        :param handler: request handler (e.g. track)
+        :param request: JSON body of the request
+        :param status: HTTP status of the request
+        :param result: result of the request
+        :return: none
+        """
+        if status != 200 or self.scheduler is None:
+            return
+        if handler is track:
+            self.scheduler.track(result["challenge_id"], result["date"], result["tracked"])
+        elif handler in (start, stop):
+            self.scheduler.refresh_user(request["user"])
+
+    async def advance(self):
+        """
+        Function to move the due challenges to the current day. The challenges whose period ended are counted again
+        in the writer thread, after the write batches queued before, so the event loop keeps serving meanwhile.
+        :return: none
+        """
+        bounds = self.scheduler.expire()
+        if bounds:
+            rows = await asyncio.get_running_loop().run_in_executor(self.writer_thread, count_current_trackings,
+                                                                    self.scheduler.db, bounds)
+            self.scheduler.add(rows)
+
+    async def due(self, request: dict):
+        """
+        Function to list the due challenges of a user or of all users (GET /due?user=... or /due?before=YYYY-MM-DD).
+        The scheduler is served from memory in the event loop; on a new day the ended periods are counted again
+        (see advance), requests of that day wait for the count.
+        :param request: query parameters of the request
+        :return: list of the challenges that still need trackings in their current period
+        """
+        try:
+            before = date.fromisoformat(request["before"]) if request.get("before") else None
+        except ValueError:
+            raise RequestError(400, "Parameter before must be YYYY-MM-DD") from None
+        if self.scheduler.today != date.today().toordinal():
+            self.advancing = asyncio.ensure_future(self.advance())
+        if self.advancing is not None and not self.advancing.done():
+            await self.advancing
+        entries = self.scheduler.due(request["user"]) if request.get("user") else self.scheduler.due_all(before)
+        return {"due": [{"challenge_id": entry.challenge_id, "user": entry.user, "habit": entry.habit,
+                         "period": entry.period, "tracked": entry.tracked, "remaining": entry.remaining,
+                         "deadline": str(entry.deadline)} for entry in entries]}
+
+    def read(self, handler, request: dict):
+        """
+        Function to run a read request on a read-only connection of the pool, in a reader thread.
+        :param handler: request handler (e.g. streaks)
+        :param request: query parameters of the request
+        :return: HTTP status and result
+        """
+        with self.pool.reader() as db:
+            return respond(handler, db, request)
+
+    def stats(self):
+        """
+        Function to report the request and batch counters of the service and the counters of the pool (GET /stats).
+        :return: dictionary of the counters
+        """
+        return dict(self.counters, queued=self.queue.qsize() if self.queue else 0, pool=self.pool.stats())
+
+    async def dispatch(self, method: str, target: str, body: bytes):
+        """
+        Function to route a request to its endpoint.
+        :param method: HTTP method
+        :param target: path and query of the request
+        :param body: request body
+        :return: HTTP status and result
+        """
+        self.counters["requests"] += 1
+        url = urlsplit(target)
+        if url.path == "/stats" and method == "GET":
+            return 200, self.stats()
+        if url.path == "/due" and method == "GET":
+            try:
+                return 200, await self.due(dict(parse_qsl(url.query)))
+            except RequestError as error:
+                return error.status, {"error": str(error)}
+        if url.path in WRITES:
+            if method != "POST":
+                return 405, {"error": f"Use POST for {url.path}"}
+            try:
+                request = json.loads(body or b"{}")
+            except ValueError:
+                return 400, {"error": "Body must be a JSON object"}
+            if not isinstance(request, dict):
+                return 400, {"error": "Body must be a JSON object"}
+            return await self.write(WRITES[url.path], request)
+        if url.path in READS:
+            if method != "GET":
+                return 405, {"error": f"Use GET for {url.path}"}
+            return await asyncio.get_running_loop().run_in_executor(self.reader_threads, self.read, READS[url.path],
+                                                                    dict(parse_qsl(url.query)))
+        return 404, {"error": f"Unknown endpoint {url.path}"}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Function to serve the requests of one client connection. Connections are kept alive for further requests
+        (HTTP/1.1), so that a device can post many events without a new connection per event.
+        :param reader: stream of the client requests
+        :param writer: stream of the responses
+        :return: none
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line.strip():
+                    break
+                method, target, version = line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY:
+                    status, result = 413, {"error": f"Body larger than {MAX_BODY} bytes"}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length)
+                    try:
+                        status, result = await self.dispatch(method, target, body)
+                    except Exception as error:
+                        status, result = 500, {"error": str(error)}
+                    keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                payload = json.dumps(result).encode("utf-8")
+                head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Type: application/json\r\n"
+                        f"Content-Length: {len(payload)}\r\n")
+                if not keep_alive:
+                    head += "Connection: close\r\n"
+                writer.write(head.encode("latin-1") + b"\r\n" + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = HOST, port: int = PORT, started: asyncio.Event = None):
+        """
+        Function to run the service until it is cancelled (e.g. with Ctrl+C).
+        :param host: address to listen on
+        :param port: TCP port to listen on, 0 for a free port
+        :param started: optional event that is set when the service accepts connections
+        :return: none
+        """
+        self.queue = asyncio.Queue()
+        self.scheduler = DueScheduler(get_db(self.pool.name, check_same_thread=False))
+        writer = asyncio.create_task(self.writer())
+        server = await asyncio.start_server(self.handle, host, port)
+        self.port = server.sockets[0].getsockname()[1]
+        print(f"Habit tracker service on http://{host}:{self.port}", flush=True)
+        if started is not None:
+            started.set()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            writer.cancel()
+
+    def close(self):
+        """
+        Function to stop the threads and close all connections of the service.
+        :return: none
+        """
+        self.writer_thread.shutdown()
+        self.reader_threads.shutdown()
+        if self.scheduler is not None:
+            self.scheduler.db.close()
+        self.pool.close()
+
+
+def run(name: str = "main.db", host: str = HOST, port: int = PORT, readers: int = 4, window: float = BATCH_WINDOW):
+    """
+    Function to run the service in the foreground until Ctrl+C.
+    :param name: name of the database/sql file
+    :param host: address to listen on
+    :param port: TCP port to listen on
+    :param readers: number of read-only connections
+    :param window: seconds the writer waits for more requests of a batch
+    :return: none
+    """
+    service = HabitService(name, readers, window)
+    try:
+        asyncio.run(service.serve(host, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local HTTP/JSON service to track habits and query streaks")
+    parser.add_argument("--db", default="main.db", help="database file")
+    parser.add_argument("--host", default=HOST, help=f"address to listen on, default {HOST}")
+    parser.add_argument("--port", type=int, default=PORT, help=f"TCP port, default {PORT}")
+    parser.add_argument("--readers", type=int, default=4, help="number of read-only connections, default 4")
+    parser.add_argument("--window", type=float, default=BATCH_WINDOW * 1000,
+                        help=f"milliseconds the writer waits for more write requests, default {BATCH_WINDOW * 1000:g}")
+    args = parser.parse_args()
+    run(args.db, args.host, args.port, args.readers, args.window / 1000)
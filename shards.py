@@ -0,0 +1,277 @@
+import argparse
+import os
+import sqlite3
+import zlib
+from database import get_db, transaction, create_streak_triggers, list_streak_triggers, JOURNAL_MODE, SYNCHRONOUS
+from cache import CachedConnection
+
+"""
+Files of the sharded layout: a folder with a catalog of the users and habits and one shard file per hash bucket of
+users with their challenges, trackings and streaks. The shard of a user never changes, as the shard files are listed
+in the Shards table of the catalog.
+"""
+CATALOG = "catalog.db"
+SHARD = "shard_{:03d}.db"
+SHARDS = 16
+CATALOG_TABLES = ("User", "Habit")
+"""
+Full text index of the habits (see database.create_habit_search), kept in the catalog with the Habit table and filled
+by its triggers, so it is not copied by split_database.
+"""
+CATALOG_INDEXES = ("HabitSearch", )
+SHARD_TABLES = ("Challenges", "StreakSummary", "Calendar", "Tracker", "TrackerDaily", "Streaks")
+"""
+Tables counted by table_counts. The Calendar only holds the days used in its file, so days repeat across shards.
+"""
+COUNTED_TABLES = ("User", "Habit", "Challenges", "StreakSummary", "Tracker", "TrackerDaily", "Streaks")
+
+"""
+Challenge IDs of new challenges of shard n start after (n + 1) * ID_RANGE, so that challenge IDs are unique across
+the shards and above the IDs of a split database.
+"""
+ID_RANGE = 1 << 40
+
+"""
+Shard files per layout folder, read once from the catalog.
+"""
+layouts = {}
+
+
+class ShardConnection(CachedConnection):
+    """
+    Connection to a shard file with the catalog attached as schema "catalog". The shard has no User and Habit tables,
+    so that the unchanged queries of the database module find them in the catalog.
+    """
+    schemas = ("catalog", )
+
+
+def is_sharded(name: str):
+    """
+    Function to check whether a database name is the folder of a sharded layout.
+    :param name: name of the database/sql file or folder
+    :return: True for a folder with a catalog
+    """
+    return os.path.isfile(os.path.join(name, CATALOG))
+
+
+def shard_files(folder: str):
+    """
+    Function to list the shard files of a sharded layout.
+    :param folder: folder of the sharded layout
+    :return: list of the paths of the shard files in order of the shard number
+    """
+    folder = os.path.abspath(folder)
+    if folder not in layouts:
+        if not is_sharded(folder):
+            raise FileNotFoundError(f"{folder} contains no sharded layout ({CATALOG} is missing)")
+        catalog = sqlite3.connect(os.path.join(folder, CATALOG))
+        try:
+            files = catalog.execute("""SELECT File FROM Shards ORDER BY Shard""").fetchall()
+        finally:
+            catalog.close()
+        layouts[folder] = [os.path.join(folder, elt[0]) for elt in files]
+    return layouts[folder]
+
+
+def shard_number(user: str, shards: int):
+    """
+    Function to find the hash bucket of a user. crc32 is used instead of hash(), which differs between processes.
+    :param user: username
+    :param shards: number of shards
+    :return: shard number of the user
+    """
+    return zlib.crc32(user.encode("utf-8")) % shards
+
+
+def shard_file(folder: str, user: str):
+    """
+    Function to find the shard file of a user.
+    :param folder: folder of the sharded layout
+    :param user: username
+    :return: path of the shard file
+    """
+    files = shard_files(folder)
+    return files[shard_number(user, len(files))]
+
+
+def open_shard(folder: str, user: str = None, journal_mode: str = JOURNAL_MODE, synchronous: str = SYNCHRONOUS,
+               **connect_args):
+    """
+    Function to connect to the database of a user in a sharded layout (see database.get_db).
+    Users and habits are read and written through the attached catalog. A transaction over both files is atomic
+    for each file, but not across them in WAL mode.
+    :param folder: folder of the sharded layout
+    :param user: username, without user the catalog is opened
+    :param journal_mode: SQLite journal mode of the connection (default WAL)
+    :param synchronous: SQLite synchronous level of the connection (OFF, NORMAL, FULL or EXTRA)
+    :param connect_args: further arguments for sqlite3.connect
+    :return: connection to the shard of the user with the attached catalog, or to the catalog
+    """
+    if not is_sharded(folder):
+        raise FileNotFoundError(f"{folder} contains no sharded layout ({CATALOG} is missing)")
+    catalog = os.path.join(folder, CATALOG)
+    if user is None:
+        return get_db(catalog, journal_mode, synchronous, **connect_args)
+    db = get_db(shard_file(folder, user), journal_mode, synchronous, factory=ShardConnection, **connect_args)
+    db.execute("""ATTACH DATABASE (?) AS catalog""", (catalog, ))
+    db.execute(f"""PRAGMA catalog.synchronous = {synchronous}""")
+    return db
+
+
+def create_layout(folder: str, shards: int = SHARDS):
+    """
+    Function to create an empty sharded layout: the catalog and the shard files with the current schema.
+    :param folder: new or empty folder of the layout
+    :param shards: number of shard files
+    :return: list of the paths of the shard files
+    """
+    if is_sharded(folder):
+        raise FileExistsError(f"{folder} already contains a sharded layout")
+    os.makedirs(folder, exist_ok=True)
+    files = [SHARD.format(n) for n in range(shards)]
+    for n, name in enumerate(files):
+        db = get_db(os.path.join(folder, name))
+        for table in CATALOG_TABLES + CATALOG_INDEXES:
+            db.execute(f"""DROP TABLE IF EXISTS {table}""")
+        db.execute("""INSERT INTO sqlite_sequence(name, seq) VALUES ('Challenges', (?))""", ((n + 1) * ID_RANGE, ))
+        db.commit()
+        db.close()
+
+    db = get_db(os.path.join(folder, CATALOG))
+    for table in SHARD_TABLES:
+        db.execute(f"""DROP TABLE IF EXISTS {table}""")
+    db.execute("""CREATE TABLE Shards(Shard INTEGER PRIMARY KEY, File TEXT NOT NULL)""")
+    db.executemany("""INSERT INTO Shards VALUES (?, ?)""", enumerate(files))
+    db.commit()
+    db.close()
+    return shard_files(folder)
+
+
+def columns(db, table: str):
+    """
+    Function to list the columns of a table, so that rows are copied by name and not by column order.
+    :param db: an initialized sqlite3 database connection
+    :param table: name of the table in the main schema
+    :return: comma separated column names
+    """
+    return ", ".join(elt[1] for elt in db.execute(f"""PRAGMA main.table_info({table})"""))
+
+
+def split_database(source: str, folder: str, shards: int = SHARDS):
+    """
+    Function to split a database into a new sharded layout. Every file attaches the source and copies its part with
+    INSERT ... SELECT, challenge IDs are kept. Streak triggers of the source are created in every shard.
+    :param source: name of the database/sql file to split, it is migrated to the current schema first
+    :param folder: new folder of the sharded layout
+    :param shards: number of shard files
+    :return: dictionary with the number of rows per table in the layout (see table_counts)
+    """
+    db = get_db(source)
+    triggers = list_streak_triggers(db)
+    db.close()
+    files = create_layout(folder, shards)
+
+    db = get_db(os.path.join(folder, CATALOG))
+    db.execute("""ATTACH DATABASE (?) AS source""", (source, ))
+    with transaction(db):
+        for table in CATALOG_TABLES:
+            db.execute(f"""INSERT INTO main.{table}({columns(db, table)}) SELECT {columns(db, table)}
+            FROM source.{table}""")
+    db.execute("""DETACH DATABASE source""")
+    db.close()
+
+    for n, name in enumerate(files):
+        db = get_db(name)
+        db.create_function("shard_number", 2, shard_number, deterministic=True)
+        db.execute("""ATTACH DATABASE (?) AS source""", (source, ))
+        with transaction(db):
+            db.execute(f"""INSERT INTO main.Challenges({columns(db, "Challenges")})
+            SELECT {columns(db, "Challenges")} FROM source.Challenges WHERE shard_number(User, (?)) = (?)""",
+                       (shards, n))
+            for table in ("StreakSummary", "Tracker", "TrackerDaily", "Streaks"):
+                db.execute(f"""INSERT INTO main.{table}({columns(db, table)}) SELECT {columns(db, table)}
+                FROM source.{table} WHERE ChallengeID IN (SELECT Challenge_ID FROM main.Challenges)""")
+            db.execute(f"""INSERT INTO main.Calendar({columns(db, "Calendar")}) SELECT {columns(db, "Calendar")}
+            FROM source.Calendar WHERE Day IN (SELECT Day FROM main.Tracker UNION SELECT Day FROM main.TrackerDaily
+            UNION SELECT Day FROM main.Streaks)""")
+        db.execute("""DETACH DATABASE source""")
+        if triggers:
+            create_streak_triggers(db)
+        db.close()
+    return table_counts(folder)
+
+
+def table_counts(name: str):
+    """
+    Function to count the rows of the tables (see COUNTED_TABLES) over all shards, e.g. to check a split.
+    The shards are attached to the catalog in batches as far as the connection allows (10 by default) and counted
+    with one query per batch.
+    :param name: folder of a sharded layout or name of a database/sql file
+    :return: dictionary with the number of rows per table
+    """
+    if not is_sharded(name):
+        db = get_db(name)
+        counts = {table: db.execute(f"""SELECT COUNT(*) FROM {table}""").fetchone()[0]
+                  for table in COUNTED_TABLES}
+        db.close()
+        return counts
+
+    db = sqlite3.connect(os.path.join(name, CATALOG))
+    counts = {table: db.execute(f"""SELECT COUNT(*) FROM {table}""").fetchone()[0] for table in CATALOG_TABLES}
+    shard_tables = [table for table in COUNTED_TABLES if table not in CATALOG_TABLES]
+    counts.update({table: 0 for table in shard_tables})
+    files = shard_files(name)
+    batch = db.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) if hasattr(db, "getlimit") else 10
+    for start in range(0, len(files), batch):
+        schemas = [f"shard{n}" for n in range(start, min(start + batch, len(files)))]
+        for schema, file in zip(schemas, files[start:]):
+            db.execute("""ATTACH DATABASE (?) AS """ + schema, (file, ))
+        for table in shard_tables:
+            counts[table] += db.execute("""SELECT """ + " + ".join(f"(SELECT COUNT(*) FROM {schema}.{table})"
+                                                                   for schema in schemas)).fetchone()[0]
+        for schema in schemas:
+            db.execute("""DETACH DATABASE """ + schema)
+    db.close()
+    return counts
+
+
+def route_events(folder: str, events):
+    """
+    Function to sort tracking events (see importer.import_events) by the shard file of their user.
+    :param folder: folder of the sharded layout
+    :param events: iterable of user, habit and date of the events
+    :return: dictionary with the shard file as key and the list of its events as value
+    """
+    routes = {}
+    for event in events:
+        routes.setdefault(shard_file(folder, event[0]), []).append(event)
+    return routes
+
+
+def for_each_shard(name: str, db):
+    """
+    Generator over the databases of maintenance tasks that work on all challenges, e.g. rebuilding the streak summary.
+    :param name: folder of a sharded layout or name of a database/sql file
+    :param db: open connection to the database/sql file, used if the layout is not sharded
+    :return: yields a connection per shard file, or the given connection
+    """
+    if not is_sharded(name):
+        yield db
+        return
+    for file in shard_files(name):
+        shard = get_db(file)
+        try:
+            yield shard
+        finally:
+            shard.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Split a database into one catalog and one shard file per hash "
+                                                 "bucket of users")
+    parser.add_argument("source", help="database file to split")
+    parser.add_argument("folder", help="new folder of the sharded layout")
+    parser.add_argument("--shards", type=int, default=SHARDS, help=f"number of shard files, default {SHARDS}")
+    args = parser.parse_args()
+    print(split_database(args.source, args.folder, args.shards))
+    print(table_counts(args.source))
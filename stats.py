@@ -0,0 +1,148 @@
+from datetime import date
+from database import (challenge_statistics, cohort_histograms, list_python_period_challenges, find_streaks,
+                      find_tracking_days)
+from periods import get_period, as_date
+from records import ChallengeStats
+from shards import for_each_shard
+from streaks import summarize
+
+"""
+Statistics that are ranked against the cohort of a habit.
+"""
+MEASURES = ("longest", "completion")
+
+
+def percentile(histogram: list, value: int):
+    """
+    Function to find the percentile rank of a value in a histogram: the share of entries below the value plus half
+    of the entries with the same value, so that the median of a cohort is at 50 and a cohort of one is at 50 as well.
+    :param histogram: list of value and number of entries (see cohort_histogram)
+    :param value: value to rank
+    :return: percentile rank between 0 and 100, None for an empty histogram
+    """
+    total = sum(count for key, count in histogram)
+    if not total:
+        return None
+    below = sum(count for key, count in histogram if key < value)
+    equal = sum(count for key, count in histogram if key == value)
+    return round(100 * (below + equal / 2) / total)
+
+
+def python_statistics(db: str, challenges: list, today: date):
+    """
+    Function to compute the statistics of challenges whose period is only available in Python (see
+    database.list_python_period_challenges) with the period objects, like database.sql_challenge_statistics does
+    in SQL. Challenges with an unknown period are left out.
+    :param db: an initialized sqlite3 database connection
+    :param challenges: list of Challenge records
+    :param today: end date of open challenges
+    :return: list of ChallengeStats records
+    """
+    stats = []
+    for chal in challenges:
+        period = get_period(chal.period)
+        if period is None:
+            continue
+        buckets = period.buckets(as_date(chal.start_date), as_date(chal.end_date) if chal.end_date else today)
+        hits = {period.day_bucket(day) for day in find_streaks(db, chal.challenge_id)}.intersection(buckets)
+        elapsed = len(buckets)
+        stats.append(ChallengeStats(chal.challenge_id, chal.user, chal.habit, chal.period, elapsed, len(hits),
+                                    int(100 * len(hits) / elapsed + 0.5) if elapsed else 0,
+                                    len(find_tracking_days(db, chal.challenge_id)), summarize(list(hits))[1]))
+    return stats
+
+
+def habit_cohorts(db: str, habits, today: date, name: str = None):
+    """
+    Function to read the histograms of the cohorts of habits. In a sharded layout (see shards.py) the challenges of
+    a habit are spread over the shard files, so the histograms of every shard are added up.
+    :param db: an initialized sqlite3 database connection
+    :param habits: iterable of habit names
+    :param today: end date of open challenges
+    :param name: folder of a sharded layout or name of the database/sql file, only the given connection by default
+    :return: dictionary of habit name to a dictionary of measure (see MEASURES) to list of value and number of
+    challenges, ordered by value
+    """
+    counts = {habit: {measure: {} for measure in MEASURES} for habit in habits}
+    for shard in (for_each_shard(name, db) if name is not None else [db]):
+        for habit, histograms in counts.items():
+            for measure, value, count in cohort_histograms(shard, habit, today):
+                histograms[measure][value] = histograms[measure].get(value, 0) + count
+            for stat in python_statistics(shard, list_python_period_challenges(shard, habit=habit), today):
+                for measure, value in (("longest", stat.longest), ("completion", stat.completion_percent)):
+                    histograms[measure][value] = histograms[measure].get(value, 0) + 1
+    return {habit: {measure: sorted(histogram.items()) for measure, histogram in histograms.items()}
+            for habit, histograms in counts.items()}
+
+
+def cohort_histogram(db: str, habit: str, measure: str, today: date = None, name: str = None):
+    """
+    Function to read one histogram of the cohort of a habit from the cached histograms.
+    :param db: an initialized sqlite3 database connection
+    :param habit: name of the habit of the cohort
+    :param measure: "longest" (run of streaks in a row) or "completion" (completion rate in percent)
+    :param today: end date of open challenges, today by default
+    :param name: folder of a sharded layout or name of the database/sql file (see habit_cohorts)
+    :return: list of value and number of challenges, ordered by value
+    """
+    if measure not in MEASURES:
+        raise ValueError(f"Unknown measure {measure}. Choose one of: " + ", ".join(MEASURES))
+    return habit_cohorts(db, [habit], today or date.today(), name)[habit][measure]
+
+
+def cohort_rank(stat: ChallengeStats, histograms: dict):
+    """
+    Function to rank a challenge against all challenges of all users on the same habit.
+    :param stat: statistics of the challenge (see database.challenge_statistics)
+    :param histograms: histograms of the cohort of the habit per measure (see habit_cohorts)
+    :return: dictionary with the size of the cohort and the percentile of longest run and completion rate
+    """
+    longest = histograms["longest"]
+    return {"cohort": sum(count for key, count in longest),
+            "longest_percentile": percentile(longest, stat.longest),
+            "completion_percentile": percentile(histograms["completion"], stat.completion_percent)}
+
+
+def user_statistics(db: str, user: str, today: date = None, name: str = None):
+    """
+    Function to compute the statistics of all challenges of a user together with their rank in the cohort of the habit.
+    Challenges with a period that is only available in Python are computed in Python (see python_statistics).
+    The cohort histograms are cached, so ranking many challenges of the same habit costs one query per habit and shard.
+    :param db: an initialized sqlite3 database connection
+    :param user: username to filter challenge entries
+    :param today: end date of open challenges, today by default
+    :param name: folder of a sharded layout or name of the database/sql file (see habit_cohorts)
+    :return: list of ChallengeStats record and cohort rank (see cohort_rank) per challenge
+    """
+    today = today or date.today()
+    stats = challenge_statistics(db, user, today)
+    stats += python_statistics(db, list_python_period_challenges(db, user=user), today)
+    stats.sort(key=lambda stat: stat.challenge_id)
+    cohorts = habit_cohorts(db, {stat.habit for stat in stats}, today, name)
+    return [(stat, cohort_rank(stat, cohorts[stat.habit])) for stat in stats]
+
+
+def print_statistics(db: str, user: str, today: date = None, name: str = None):
+    """
+    Function to print completion rate, trackings per period, longest run and cohort percentiles of all challenges of
+    a user.
+    :param db: an initialized sqlite3 database connection
+    :param user: username to filter challenge entries
+    :param today: end date of open challenges, today by default
+    :param name: folder of a sharded layout or name of the database/sql file (see habit_cohorts)
+    :return: number of listed challenges
+    """
+    rows = user_statistics(db, user, today, name)
+    unknown = [chal for chal in list_python_period_challenges(db, user=user) if get_period(chal.period) is None]
+    for chal in unknown:
+        print(f"Skipped challenge {chal.challenge_id} ({chal.habit}) with unknown period {chal.period}")
+    if not rows:
+        print("No challenges found for " + user)
+        return 0
+    print("ID ; Habit ; Periodicity ; Periods ; Completed ; Rate ; Trackings per period ; Longest streaks in a row ; "
+          "Percentile longest ; Percentile rate ; Cohort")
+    for stat, rank in rows:
+        print(f"{stat.challenge_id} ; {stat.habit} ; {stat.period} ; {stat.elapsed} ; {stat.completions} ; "
+              f"{stat.completion_percent}% ; {stat.trackings_per_period:.2f} ; {stat.longest} ; "
+              f"{rank['longest_percentile']} ; {rank['completion_percentile']} ; {rank['cohort']}")
+    return len(rows)
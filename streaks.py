@@ -0,0 +1,237 @@
+from database import (find_streaks, find_streaks_for_user, find_challenge_dates, list_challenges, get_db,
+                      get_streak_summary, get_streak_summaries_for_user, safe_streak_summaries, list_all_challenges,
+                      find_all_streaks)
+from periods import get_period, as_date
+from datetime import date
+
+
+def challenge_period(start_date: str, end_date: str):
+    """
+    Function to convert the start and end date of a challenge into date objects.
+    A challenge that was not stopped yet runs until today.
+    :param start_date: start date of the challenge (YYYY-MM-DD)
+    :param end_date: end date of the challenge (YYYY-MM-DD) or None
+    :return: start and end date of the challenge as date objects
+    """
+    start = as_date(start_date)
+    if end_date is None:
+        end = date.today()
+    else:
+        end = as_date(end_date)
+    return start, end
+
+
+def streak_buckets(streak_days: list, period: str):
+    """
+    Function to turn the days of streak entries into a set of period buckets for fast lookups.
+    :param streak_days: list of days (day ordinals) of streak entries
+    :param period: period defined for the challenge (e.g. daily)
+    :return: set of bucket numbers of the periods with a streak
+    """
+    period = get_period(period)
+    if period is None:
+        return set()
+    return {period.day_bucket(elt) for elt in streak_days}
+
+
+def challenge_buckets(start_date: date, end_date: date, period: str):
+    """
+    Function to list all periods between start and end date of a challenge.
+    :param start_date: start date of the challenge
+    :param end_date: end date of the challenge
+    :param period: period defined for the challenge (e.g. daily)
+    :return: range of bucket numbers of every period of the challenge
+    """
+    period = get_period(period)
+    if period is None:
+        return range(0)
+    return period.buckets(start_date, end_date)
+
+
+def count_runs(buckets, streaks: set):
+    """
+    Function to count streaks in a row over a sequence of periods.
+    :param buckets: bucket numbers of the periods in chronological order
+    :param streaks: set of bucket numbers with a streak
+    :return: current number of streaks in a row at the last period and maximum number of streaks in a row
+    """
+    streak_counter = 0
+    streak_counter_max = 0
+    for bucket in buckets:
+        if bucket in streaks:
+            streak_counter += 1
+            if streak_counter > streak_counter_max:
+                streak_counter_max = streak_counter
+        else:
+            streak_counter = 0
+    return streak_counter, streak_counter_max
+
+
+def challenge_streaks(db: str, challenge: int, period: str):
+    """
+    Function to compute current and longest streak run of one challenge with a single query for the streaks.
+    :param db: an initialized sqlite3 database connection
+    :param challenge: unique identifier of challenge in database (challenge ID)
+    :param period: period defined for the challenge (e.g. daily)
+    :return: current and maximum number of streaks in a row
+    """
+    start, end = challenge_period(*find_challenge_dates(db, challenge))
+    streaks = streak_buckets(find_streaks(db, challenge), period)
+    return count_runs(challenge_buckets(start, end, period), streaks)
+
+
+def user_streaks(db: str, user: str):
+    """
+    Function to compute current and longest streak run of all challenges of a user.
+    All streaks of the user are fetched with a single query and counted in memory.
+    :param db: an initialized sqlite3 database connection
+    :param user: username to filter challenge entries
+    :return: dictionary with challenge ID as key and current and maximum number of streaks in a row as value
+    """
+    rows = {}
+    for elt in find_streaks_for_user(db, user):
+        rows.setdefault(elt.challenge_id, []).append(elt.day)
+
+    result = {}
+    for chal in list_challenges(db, user):
+        start, end = challenge_period(chal.start_date, chal.end_date)
+        streaks = streak_buckets(rows.get(chal.challenge_id, []), chal.period)
+        result[chal.challenge_id] = count_runs(challenge_buckets(start, end, chal.period), streaks)
+    return result
+
+
+def derive_streaks(tracking_days: list, period: str, interval: int):
+    """
+    Function to find the streaks of a challenge from its tracking days.
+    Like Tracker.safe_track, a streak is reached by the tracking that brings the number of trackings in its period
+    to the interval of the challenge.
+    :param tracking_days: tracking days (day ordinals) in the order they were tracked
+    :param period: period defined for the challenge (e.g. daily)
+    :param interval: number of trackings per period needed for a streak
+    :return: list of days of the trackings that reached a streak
+    """
+    period_type = get_period(period)
+    if period_type is None:
+        return []
+    buckets = {}
+    tracked = {}
+    streaks = []
+    for elt in tracking_days:
+        bucket = buckets.get(elt)
+        if bucket is None:
+            bucket = buckets[elt] = period_type.day_bucket(elt)
+        tracked[bucket] = tracked.get(bucket, 0) + 1
+        if tracked[bucket] == interval:
+            streaks.append(elt)
+    return streaks
+
+
+def summarize(buckets: list, challenge_range: range = None):
+    """
+    Function to compute a StreakSummary entry from the bucket numbers of all streaks of a challenge.
+    Like in list_streaks, streaks outside of the periods of the challenge (e.g. trackings of a date before the
+    start date) are not counted.
+    :param buckets: bucket numbers of the streaks of a challenge
+    :param challenge_range: bucket numbers of the periods of the challenge (see challenge_buckets), all by default
+    :return: run of streaks in a row ending at the last streak, longest run, last bucket and number of streaks
+    """
+    if challenge_range is not None:
+        buckets = [elt for elt in buckets if elt in challenge_range]
+    current = 0
+    longest = 0
+    last = None
+    for bucket in sorted(set(buckets)):
+        if last is not None and bucket == last + 1:
+            current += 1
+        else:
+            current = 1
+        longest = max(longest, current)
+        last = bucket
+    return current, longest, last, len(buckets)
+
+
+def next_summary(db: str, challenge: int, period: str, bucket: int, challenge_range: range = None):
+    """
+    Function to compute the StreakSummary entry of a challenge after a new streak in a given period.
+    The stored entry is advanced in O(1). Without an entry or for a streak before the last streak (tracking of
+    a past date) the summary is recomputed from the Streaks table.
+    :param db: an initialized sqlite3 database connection
+    :param challenge: unique identifier of challenge in database (challenge ID)
+    :param period: period defined for the challenge (e.g. daily)
+    :param bucket: bucket number of the period with the new streak
+    :param challenge_range: bucket numbers of the periods of the challenge (see challenge_buckets), all by default
+    :return: current run, longest run, last bucket and completions including the new streak, None if the streak
+    is outside of the periods of the challenge and the entry stays unchanged
+    """
+    if challenge_range is not None and bucket not in challenge_range:
+        return None
+    summary = get_streak_summary(db, challenge)
+    if summary is None or (summary[2] is not None and bucket <= summary[2]):
+        period_type = get_period(period)
+        buckets = [period_type.day_bucket(elt) for elt in find_streaks(db, challenge)]
+        return summarize(buckets + [bucket], challenge_range)
+    current, longest, last, completions = summary
+    if last is not None and bucket == last + 1:
+        current += 1
+    else:
+        current = 1
+    return current, max(longest, current), bucket, completions + 1
+
+
+def rebuild_streak_summaries(db: str, challenges: list = None):
+    """
+    Function to regenerate the StreakSummary table from the Streaks table, e.g. for databases from older versions.
+    :param db: an initialized sqlite3 database connection
+    :param challenges: optional list of challenge IDs to rebuild, all challenges by default
+    :return: number of rebuilt entries
+    """
+    rows = {}
+    for elt in find_all_streaks(db):
+        rows.setdefault(elt.challenge_id, []).append(elt.day)
+    if challenges is not None:
+        challenges = set(challenges)
+
+    summaries = []
+    for chal in list_all_challenges(db):
+        if challenges is not None and chal.challenge_id not in challenges:
+            continue
+        period_type = get_period(chal.period)
+        if period_type is None:
+            continue
+        buckets = [period_type.day_bucket(elt) for elt in rows.get(chal.challenge_id, [])]
+        challenge_range = period_type.buckets(*challenge_period(chal.start_date, chal.end_date))
+        summaries.append((chal.challenge_id, ) + summarize(buckets, challenge_range))
+    safe_streak_summaries(db, summaries)
+    return len(summaries)
+
+
+def user_streak_summaries(db: str, user: str):
+    """
+    Function to read current and longest streak run of all challenges of a user from the StreakSummary table.
+    The current run only counts if its last streak is in the current or the previous period.
+    Missing entries are rebuilt from the Streaks table.
+    :param db: an initialized sqlite3 database connection
+    :param user: username to filter challenge entries
+    :return: dictionary with challenge ID as key and current and maximum number of streaks in a row as value
+    """
+    rows = get_streak_summaries_for_user(db, user)
+    missing = [elt[0] for elt in rows if elt[3] is None and get_period(elt[1]) is not None]
+    if missing:
+        rebuild_streak_summaries(db, missing)
+        rows = get_streak_summaries_for_user(db, user)
+
+    today = date.today()
+    result = {}
+    for challenge, period, current, longest, last, completions in rows:
+        period_type = get_period(period)
+        if period_type is None:
+            result[challenge] = (0, 0)
+            continue
+        if last is None or last < period_type.bucket(today) - 1:
+            current = 0
+        result[challenge] = (current, longest)
+    return result
+
+
+if __name__ == '__main__':
+    print(f"Rebuilt streak summary of {rebuild_streak_summaries(get_db())} challenges")
@@ -1,9 +1,34 @@
-from database import get_db, safe_user_name
+from database import (get_db, safe_user_name, get_user_names, get_habits_started, get_streak_summary, transaction,
+                      restore_challenge, list_challenges, list_challenges_page, list_open_challenges_page,
+                      get_habits_page, paginate, find_streaks, find_all_streaks, create_streak_triggers,
+                      drop_streak_triggers, list_streak_triggers, compact_trackings, reclaim_space, tracks_today,
+                      tracks_period, find_tracking_days, safe_tracking_in_period, challenge_statistics,
+                      search_habits, SCHEMA_VERSION)
 from analyse import list_streaks
 from habit import Habit
 from challenge import Challenge
 from tracker import Tracker
-from datetime import date
+from periods import get_period, calendar_row
+from importer import import_events, restore_records
+from exporter import export, read_export
+from leaderboard import leaderboard, shard_ranges
+from shards import split_database, table_counts, shard_file, ID_RANGE
+from streaks import rebuild_streak_summaries, user_streak_summaries
+from pool import ConnectionPool
+from service import HabitService, write_batch, track as service_track
+from heatmap import load_heatmap, render_text, write_heatmap, SHADES, STREAK
+from stats import percentile, cohort_histogram, user_statistics, print_statistics
+from due import DueScheduler
+from main import main, select_page, search_habit
+from functools import partial
+from profiling import query_budget
+import cache
+import records
+from datetime import date, timedelta
+import asyncio
+import json
+import pytest
+import sqlite3
 
 
 class TestTracker:
@@ -49,6 +74,724 @@ class TestTracker:
         streakcounter = list_streaks(self.db, 1, self.period, "")
         assert streakcounter == 1
 
+    def test_query_budget(self):
+        """
+        Function to check that the streak listing of a challenge stays within its budget of SQL statements.
+        """
+        challenge = Challenge(self.username, self.habit_name)
+        challenge.store(self.db, self.period, self.interval)
+        tracker = Tracker(self.username)
+        tracker.import_challenge(self.db, self.habit_name)
+        tracker.safe_track(self.db, self.tracking_date)
+        tracker.safe_track(self.db, self.tracking_date)
+
+        with query_budget(self.db, 2):
+            streakcounter = list_streaks(self.db, 1, self.period, "")
+        assert streakcounter == 1
+
+    def test_migration(self):
+        """
+        Function to check that a new database is migrated to the current schema version including the indexes
+        and that reopening an up-to-date database keeps that version.
+        """
+        cur = self.db.cursor()
+        assert cur.execute("""PRAGMA user_version""").fetchone()[0] == SCHEMA_VERSION
+        indexes = [elt[0] for elt in cur.execute("""SELECT name FROM sqlite_master WHERE type = 'index'""")]
+        assert "Tracker_Challenge_Day" in indexes
+        assert "Challenges_User_End" in indexes
+        db = get_db("test.db")
+        assert db.execute("""PRAGMA user_version""").fetchone()[0] == SCHEMA_VERSION
+        db.close()
+
+    def test_migration_from_baseline(self, tmp_path):
+        """
+        Function to upgrade a database of the first version (schema version 0, tracking and streak dates as text) to
+        the current schema version: the dates become day ordinals with Calendar entries and the streaks stay the same.
+        """
+        name = str(tmp_path / "baseline.db")
+        db = sqlite3.connect(name)
+        db.execute("""CREATE TABLE User(Name TEXT PRIMARY KEY NOT NULL)""")
+        db.execute("""CREATE TABLE Habit(Name TEXT PRIMARY KEY NOT NULL, Description TEXT NOT NULL,
+        Creation_Date Date NOT NULL, User_Created INTEGER NOT NULL,
+        FOREIGN KEY (User_Created) REFERENCES User(User))""")
+        db.execute("""CREATE TABLE Challenges(Challenge_ID INTEGER PRIMARY KEY AUTOINCREMENT, User TEXT NOT NULL,
+        Habit TEXT NOT NULL, Period TEXT NOT NULL, Interval INTEGER NOT NULL, Start_Date Date NOT NULL, End_Date Date,
+        FOREIGN KEY (User) REFERENCES User(Name), FOREIGN KEY (Habit) REFERENCES Habit(Name))""")
+        for table, key in (("Tracker", "Tracker_ID"), ("Streaks", "Streak_ID")):
+            db.execute(f"""CREATE TABLE {table}({key} INTEGER PRIMARY KEY AUTOINCREMENT, ChallengeID INTEGER NOT NULL,
+            Date Datetime NOT NULL, Week INTEGER NOT NULL, Month INTEGER NOT NULL, Year INTEGER NOT NULL,
+            FOREIGN KEY (ChallengeID) REFERENCES Challenges(Challenge_ID))""")
+        db.execute("""INSERT INTO User (Name) VALUES (?)""", (self.username, ))
+        db.execute("""INSERT INTO Habit VALUES (?,?,?,?)""",
+                   (self.habit_name, self.habit_description, "2024-01-01", self.username))
+        db.execute("""INSERT INTO Challenges (User, Habit, Period, Interval, Start_Date, End_Date)
+        VALUES (?,?,?,?,?,?)""", (self.username, self.habit_name, "daily", 1, "2024-01-01", "2024-01-05"))
+        days = [date(2024, 1, day) for day in (1, 2, 4)]
+        for table in ("Tracker", "Streaks"):
+            db.executemany(f"""INSERT INTO {table} (Date, ChallengeID, Week, Month, Year) VALUES (?,?,?,?,?)""",
+                           [(str(day), 1, day.isocalendar()[1], day.month, day.year) for day in days])
+        db.commit()
+        db.close()
+
+        db = get_db(name)
+        try:
+            assert db.execute("""PRAGMA user_version""").fetchone()[0] == SCHEMA_VERSION
+            ordinals = [day.toordinal() for day in days]
+            assert find_tracking_days(db, 1) == ordinals
+            assert sorted(find_streaks(db, 1)) == ordinals
+            assert db.execute("""SELECT * FROM Calendar ORDER BY Day""").fetchall() == [
+                (day, ) + calendar_row(day) for day in ordinals]
+            assert list_streaks(db, 1, "daily", "") == 2
+            assert user_streak_summaries(db, self.username) == {1: (0, 2)}
+            assert get_streak_summary(db, 1) == (1, 2, ordinals[-1], 3)
+        finally:
+            db.close()
+
+    def test_weekly_streak_over_new_year(self):
+        """
+        Function to track a weekly challenge in the ISO week that spans the new year.
+        Both trackings count for the same week and the streak listing ends after the last week of the challenge.
+        """
+        assert get_period("weekly").bucket(date(2024, 12, 30)) == get_period("weekly").bucket(date(2025, 1, 5))
+        challenge = Challenge(self.username, self.habit_name)
+        challenge.store(self.db, "weekly", self.interval)
+        self.db.execute("""UPDATE Challenges SET Start_Date = '2024-12-16' WHERE Challenge_ID = 1""")
+
+        tracker = Tracker(self.username)
+        tracker.import_challenge(self.db, self.habit_name)
+        tracker.safe_track(self.db, date(2024, 12, 31))
+        tracker.safe_track(self.db, date(2025, 1, 2))
+        challenge.stop(self.db)
+        self.db.execute("""UPDATE Challenges SET End_Date = '2025-01-10' WHERE Challenge_ID = 1""")
+
+        assert list_streaks(self.db, 1, "weekly", "") == 1
+
+    def test_anchored_period(self):
+        """
+        Function to start a challenge with a period of a fixed number of days: the periods are counted from the
+        start date, stored in the period name.
+        """
+        today = date.today()
+        Challenge(self.username, self.habit_name).store(self.db, "every 3 days", 1)
+        challenge = list_challenges(self.db, self.username)[0]
+        assert challenge.period == f"every 3 days from {today}"
+        period = get_period(challenge.period)
+        assert period.first_day(period.bucket(today + timedelta(days=2))) == today
+        assert period.first_day(period.bucket(today + timedelta(days=3))) == today + timedelta(days=3)
+        assert get_period("every 3 days from 2024-02-30") is None
+
+    def test_unknown_period(self):
+        """
+        Function to track a challenge whose period is not registered: the tracking is stored without streak.
+        """
+        restore_challenge(self.db, self.username, self.habit_name, "yearly", 0, "2024-01-01", None)
+        tracker = Tracker(self.username)
+        tracker.import_challenge(self.db, self.habit_name)
+        assert tracker.store_track(self.db, date(2024, 1, 2)) == 0
+        assert find_tracking_days(self.db, 1) == [date(2024, 1, 2).toordinal()]
+        assert find_streaks(self.db, 1) == []
+
+    def test_streak_summary(self):
+        """
+        Function to check that the StreakSummary entry of a challenge is kept with the streak of a tracking.
+        """
+        challenge = Challenge(self.username, self.habit_name)
+        challenge.store(self.db, self.period, self.interval)
+        tracker = Tracker(self.username)
+        tracker.import_challenge(self.db, self.habit_name)
+        tracker.safe_track(self.db, self.tracking_date)
+        assert get_streak_summary(self.db, 1) is None
+        tracker.safe_track(self.db, self.tracking_date)
+        assert get_streak_summary(self.db, 1)[:2] == (1, 1)
+
+    def test_streak_triggers(self, capsys):
+        """
+        Function to track a monthly challenge with streak triggers in the database.
+        Each tracking is a single INSERT, the feedback matches the tracking without triggers and the
+        StreakSummary entry kept by the triggers equals a rebuilt one.
+        """
+        assert "monthly" in create_streak_triggers(self.db)
+        challenge = Challenge(self.username, self.habit_name)
+        challenge.store(self.db, "monthly", 2)
+        self.db.execute("""UPDATE Challenges SET Start_Date = '2024-01-01' WHERE Challenge_ID = 1""")
+        rebuild_streak_summaries(self.db)
+        tracker = Tracker(self.username)
+        tracker.import_challenge(self.db, self.habit_name)
+
+        for day in (date(2024, 1, 5), date(2024, 1, 31), date(2024, 2, 1)):
+            tracker.safe_track(self.db, day)
+        statements = []
+        self.db.set_trace_callback(statements.append)
+        tracker.safe_track(self.db, date(2024, 2, 29))
+        self.db.set_trace_callback(None)
+        assert len({elt for elt in statements if elt.lstrip().upper().startswith("INSERT")}) == 1
+        assert not [elt for elt in statements if elt.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE"))]
+        tracker.safe_track(self.db, date(2024, 2, 3))
+        assert capsys.readouterr().out.splitlines() == [
+            "1 more to go.", "Streak! Well done. Come back soon!", "1 more to go.",
+            "Streak! Well done. Come back soon!", "Streak already reached before, but keep on tracking"]
+
+        assert find_streaks(self.db, 1) == [date(2024, 1, 31).toordinal(), date(2024, 2, 29).toordinal()]
+        summary = get_streak_summary(self.db, 1)
+        rebuild_streak_summaries(self.db)
+        assert summary == get_streak_summary(self.db, 1) == (2, 2, 2024 * 12 + 1, 2)
+        drop_streak_triggers(self.db)
+        assert list_streak_triggers(self.db) == []
+
+    def test_backdated_streaks(self):
+        """
+        Function to track a daily challenge on the days before its start date, first without and then with streak
+        triggers. Like in list_streaks, these streaks are not counted in the StreakSummary entry.
+        """
+        challenge = Challenge(self.username, self.habit_name)
+        challenge.store(self.db, "daily", 1)
+        tracker = Tracker(self.username)
+        tracker.import_challenge(self.db, self.habit_name)
+        today = date.today()
+        for days in (5, 4, 3):
+            tracker.store_track(self.db, today - timedelta(days=days))
+        assert list_streaks(self.db, 1, "daily", "") == 0
+        assert user_streak_summaries(self.db, self.username) == {1: (0, 0)}
+
+        tracker.store_track(self.db, today)
+        create_streak_triggers(self.db)
+        for days in (2, 1):
+            tracker.store_track(self.db, today - timedelta(days=days))
+        assert len(find_streaks(self.db, 1)) == 6
+        assert get_streak_summary(self.db, 1) == (1, 1, today.toordinal(), 1)
+        rebuild_streak_summaries(self.db)
+        assert get_streak_summary(self.db, 1) == (1, 1, today.toordinal(), 1)
+        assert user_streak_summaries(self.db, self.username) == {1: (1, 1)}
+
+    def test_numpy_analysis(self):
+        """
+        Function to check the vectorized analysis of all challenges of a user against list_streaks.
+        """
+        pytest.importorskip("numpy")
+        import analyse_numpy
+        habits = {"Walk": ("daily", 1), "Read": ("weekly", 2), "Swim": ("monthly", 1)}
+        for name, (period, interval) in habits.items():
+            Habit(name, "test", self.username).store(self.db)
+            Challenge(self.username, name).store(self.db, period, interval)
+        events = [(self.username, "Walk", f"2024-01-{day:02d}") for day in (1, 2, 3, 5, 6)]
+        events += [(self.username, "Read", day) for day in ("2024-01-01", "2024-01-07", "2024-01-08", "2024-01-20")]
+        events += [(self.username, "Swim", day) for day in ("2024-02-10", "2024-03-01", "2024-03-02")]
+        import_events(self.db, events)
+        self.db.execute("""UPDATE Challenges SET Start_Date = '2024-01-01', End_Date = '2024-03-31'""")
+
+        result = analyse_numpy.analyse_user(self.db, self.username)
+        for chal in list_challenges(self.db, self.username):
+            assert result[chal.challenge_id]["longest"] == list_streaks(self.db, chal.challenge_id, chal.period, "")
+        ids = {elt.habit: elt.challenge_id for elt in list_challenges(self.db, self.username)}
+        walk, read, swim = (result[ids[name]] for name in ("Walk", "Read", "Swim"))
+        assert (walk["current"], walk["longest"], walk["best"]) == (0, 3, ("2024-01-01", 1))
+        assert read["completion_rate"] == 1 / 13
+        assert (swim["current"], swim["longest"], swim["worst"]) == (2, 2, ("month: 1-2024", 0))
+        assert swim["rolling_7"] == 1.0
+
+    def test_numpy_analysis_without_challenges(self, capsys):
+        """
+        Function to analyse a user without challenges and with a challenge of an unknown period only.
+        """
+        pytest.importorskip("numpy")
+        import analyse_numpy
+        assert analyse_numpy.analyse_user(self.db, self.username) == {}
+        restore_challenge(self.db, self.username, self.habit_name, "yearly", 1, "2024-01-01", None)
+        assert analyse_numpy.analyse_user(self.db, self.username) == {}
+        analyse_numpy.print_overview(self.db, self.username)
+        assert len(capsys.readouterr().out.splitlines()) == 1
+
+    def test_pagination(self):
+        """
+        Function to page through the challenges and habits of a user and to select a challenge on the second page
+        of the menu with "Next page" and "Previous page".
+        """
+        for number in range(5):
+            Habit(f"Habit{number}", "test", self.username).store(self.db)
+            Challenge(self.username, f"Habit{number}").store(self.db, self.period, self.interval)
+        Challenge(self.username, "Habit1").stop(self.db)
+
+        pages = list(paginate(list_challenges_page, self.db, self.username, size=2))
+        assert [len(page) for page in pages] == [2, 2, 1]
+        assert [elt.challenge_id for page in pages for elt in page] == [1, 2, 3, 4, 5]
+        assert [elt.habit for page in paginate(list_open_challenges_page, self.db, self.username) for elt in page] == [
+            "Habit0", "Habit2", "Habit3", "Habit4"]
+        assert get_habits_page(self.db, after="Habit0", size=2, not_started_by=self.username) == [
+            records.Habit("Habit1")]
+
+        class Questions:
+            answers = ["Next page", "Previous page", "Next page"]
+
+            @staticmethod
+            def Choice(title, value):
+                return value
+
+            @classmethod
+            def select(cls, message, choices):
+                cls.choices = choices
+                answer = cls.answers.pop(0) if cls.answers else choices[0]
+                return type("Question", (), {"ask": lambda self: answer})()
+
+        selected = select_page(Questions, "Challenge?", partial(list_challenges_page, self.db, self.username),
+                               lambda elt: elt.habit, size=2)
+        assert selected.challenge_id == 3
+        assert Questions.choices == [selected, records.Challenge(4, None, "Habit3", "daily", None, str(date.today())),
+                                     "Next page", "Previous page", "Exit"]
+
+    def test_habit_search(self):
+        """
+        Function to search habits by word prefixes with the full text index, leaving out the started habits of the
+        user, to build the index when an existing database is migrated, to search without the index and to pick a
+        habit with the type-ahead of the menu.
+        """
+        for name, description in (("Walk", "Walk the dog"), ("Swim", "Swim in the lake"), ("Yoga", "Stretching"),
+                                  ("Water plants", "Walk to the garden")):
+            Habit(name, description, self.username).store(self.db)
+        Challenge(self.username, "Swim").store(self.db, self.period, self.interval)
+
+        assert [elt.name for elt in search_habits(self.db, "wa")] == ["Walk", "Water plants"]
+        assert [elt.name for elt in search_habits(self.db, "walk")] == ["Walk", "Water plants"]
+        assert [elt.name for elt in search_habits(self.db, "swi lak")] == ["Swim"]
+        assert search_habits(self.db, "sw la") == [] and [elt.name for elt in search_habits(self.db, "d")] == []
+        assert search_habits(self.db, "sw", not_started_by=self.username) == []
+        assert [elt.name for elt in search_habits(self.db, "", not_started_by=self.username, size=2)] == [
+            "Walk", "Water plants"]
+        assert search_habits(self.db, '"walk" OR') == []
+
+        self.db.execute("""DROP TABLE HabitSearch""")
+        assert [elt.name for elt in search_habits(self.db, "dog")] == ["Walk"]
+        self.db.execute("""PRAGMA user_version = 6""")
+        db = get_db("test.db")
+        assert [elt.name for elt in search_habits(db, "garden")] == ["Water plants"]
+        db.close()
+
+        class Questions:
+            texts = ["gard", "stretch"]
+
+            @staticmethod
+            def Choice(title, value):
+                return value
+
+            @classmethod
+            def autocomplete(cls, message, choices, completer):
+                cls.completer = completer
+                answer = cls.texts.pop(0)
+                return type("Question", (), {"ask": lambda self: answer})()
+
+            @classmethod
+            def select(cls, message, choices):
+                cls.choices = choices
+                return type("Question", (), {"ask": lambda self: choices[0]})()
+
+        assert search_habit(Questions, self.db, self.username).name == "Water plants"
+        document = type("Document", (), {"text_before_cursor": "y"})()
+        assert [elt.text for elt in Questions.completer.get_completions(document, None)] == ["Yoga"]
+        assert search_habit(Questions, self.db, self.username).name == "Yoga"
+
+    def test_records(self):
+        """
+        Function to check that the row factories match the columns by name and that records and the objects of the
+        program have no instance dictionary.
+        """
+        challenge = Challenge(self.username, self.habit_name)
+        challenge.store(self.db, self.period, 1)
+        tracker = Tracker(self.username)
+        tracker.import_challenge(self.db, self.habit_name)
+        tracker.safe_track(self.db, date(2024, 1, 1))
+
+        cur = self.db.cursor()
+        cur.row_factory = records.row_factory(records.Challenge)
+        row = cur.execute("""SELECT Period, Habit, Challenge_ID FROM Challenges""").fetchone()
+        assert (row.challenge_id, row.habit, row.period, row.user) == (1, self.habit_name, self.period, None)
+        assert find_all_streaks(self.db) == [records.Streak(None, 1, date(2024, 1, 1).toordinal())]
+        assert find_all_streaks(self.db)[0].date == date(2024, 1, 1)
+        for elt in (row, challenge, tracker, Habit(self.habit_name, self.habit_description, self.username)):
+            assert not hasattr(elt, "__dict__")
+
+    def test_lookup_cache(self):
+        """
+        Function to check that repeated lookups are served from the cache, that the write functions
+        invalidate exactly the affected entries and that the entries of a connection are dropped when it is closed.
+        """
+        cache.lookups.clear()
+        challenge = Challenge(self.username, self.habit_name)
+        challenge.store(self.db, self.period, self.interval)
+        assert get_habits_started(self.db, self.username) == [self.habit_name]
+        assert get_habits_started(self.db, self.username) == [self.habit_name]
+        assert get_user_names(self.db) == [self.username]
+        assert cache.stats()["hits"] == 1
+
+        names = get_user_names(self.db)
+        names.append("Changed")
+        safe_user_name(self.db, "Second")
+        assert get_user_names(self.db) == [self.username, "Second"]
+        assert get_habits_started(self.db, self.username) == [self.habit_name]
+        assert cache.stats()["hits"] == 3
+
+        challenge.stop(self.db)
+        assert get_habits_started(self.db, self.username) == []
+
+        db = get_db("test.db")
+        assert get_user_names(db) == [self.username, "Second"]
+        size = cache.stats()["size"]
+        db.close()
+        assert cache.stats()["size"] == size - 1
+        db = get_db("test.db")
+        try:
+            assert get_user_names(db) == [self.username, "Second"]
+            assert cache.stats()["hits"] == 3
+        finally:
+            db.close()
+        assert cache.stats()["size"] == size - 1
+
+    def test_import_events(self):
+        """
+        Function to import tracking events in bulk for a started daily challenge.
+        Events of habits without started challenge are skipped and the streaks are derived from the imported events.
+        """
+        challenge = Challenge(self.username, self.habit_name)
+        challenge.store(self.db, self.period, self.interval)
+        self.db.execute("""UPDATE Challenges SET Start_Date = '2024-01-01' WHERE Challenge_ID = 1""")
+        events = [(self.username, self.habit_name, "2024-01-01"), (self.username, self.habit_name, "2024-01-02"),
+                  (self.username, self.habit_name, "2024-01-02"), (self.username, self.habit_name, "2024-01-01"),
+                  (self.username, "Unknown", "2024-01-01")]
+
+        assert import_events(self.db, events) == (4, 1)
+        challenge.stop(self.db)
+        self.db.execute("""UPDATE Challenges SET End_Date = '2024-01-03' WHERE Challenge_ID = 1""")
+        assert list_streaks(self.db, 1, self.period, "") == 2
+        assert get_streak_summary(self.db, 1) == (2, 2, date(2024, 1, 2).toordinal(), 2)
+
+    def test_export_round_trip(self, tmp_path):
+        """
+        Function to export the database as JSONL and CSV files and restore both exports into new databases.
+        The date filter limits the exported trackings.
+        """
+        challenge = Challenge(self.username, self.habit_name)
+        challenge.store(self.db, self.period, self.interval)
+        events = [(self.username, self.habit_name, day)
+                  for day in ("2024-01-01", "2024-01-01", "2024-01-02", "2024-01-02", "2024-01-03")]
+        import_events(self.db, events)
+
+        for name in ("backup.jsonl", "backup"):
+            path = str(tmp_path / name)
+            counts = export(self.db, path, chunk_size=2)
+            assert (counts["User"], counts["Challenges"], counts["Tracker"], counts["Streaks"]) == (1, 1, 5, 2)
+            restored = get_db(str(tmp_path / (name + ".db")))
+            assert restore_records(restored, read_export(path))["Tracker"] == 5
+            assert find_streaks(restored, 1) == find_streaks(self.db, 1)
+            assert get_streak_summary(restored, 1) == get_streak_summary(self.db, 1)
+            assert get_habits_started(restored, self.username) == [self.habit_name]
+            restored.close()
+
+        restored = get_db(str(tmp_path / "triggers.db"))
+        create_streak_triggers(restored)
+        assert restore_records(restored, read_export(str(tmp_path / "backup.jsonl")))["Streaks"] == 2
+        assert find_streaks(restored, 1) == find_streaks(self.db, 1)
+        assert get_streak_summary(restored, 1) == get_streak_summary(self.db, 1)
+        restored.close()
+
+        counts = export(self.db, str(tmp_path / "filtered.jsonl"), user=self.username, first_day=date(2024, 1, 2))
+        assert (counts["User"], counts["Tracker"], counts["Streaks"]) == (1, 3, 1)
+
+    def test_compaction(self, tmp_path):
+        """
+        Function to roll old trackings up into daily counts with an archive: counts, streaks and exports stay the
+        same, and a streak trigger counts the compacted trackings of its period.
+        """
+        restore_challenge(self.db, self.username, self.habit_name, self.period, self.interval, "2024-01-01", None)
+        import_events(self.db, [(self.username, self.habit_name, day)
+                                for day in ("2024-01-01", "2024-01-01", "2024-01-02", "2024-01-03", "2024-01-03")])
+        streaks = list_streaks(self.db, 1, self.period, "")
+        exported = export(self.db, str(tmp_path / "before.jsonl"))
+
+        archive = str(tmp_path / "archive.db")
+        assert compact_trackings(self.db, 1, archive, today=date(2024, 1, 4)) == 3
+        assert reclaim_space(self.db, incremental=True) >= 0
+        assert tracks_today(self.db, 1, date(2024, 1, 1)) == 2
+        assert tracks_period(self.db, 1, date(2024, 1, 1), date(2024, 1, 3)) == 5
+        assert find_tracking_days(self.db, 1) == [date(2024, 1, day).toordinal() for day in (1, 1, 2, 3, 3)]
+        assert list_streaks(self.db, 1, self.period, "") == streaks
+        assert export(self.db, str(tmp_path / "after.jsonl")) == exported
+        assert sqlite3.connect(archive).execute("""SELECT COUNT(*) FROM Tracker""").fetchone()[0] == 3
+
+        create_streak_triggers(self.db)
+        assert safe_tracking_in_period(self.db, date(2024, 1, 2), 1, self.period, date(2024, 1, 2),
+                                       date(2024, 1, 2)) == (2, True)
+        assert sorted(find_streaks(self.db, 1)) == [date(2024, 1, day).toordinal() for day in (1, 2, 3)]
+
+    def test_service(self):
+        """
+        Function to post concurrent track requests to the HTTP service, which are written in one batch, and to query
+        the streaks of the challenge on a read-only connection. The due challenges follow the committed trackings,
+        also when the day changed and the ended periods are counted again.
+        """
+        Habit(self.habit_name, self.habit_description, self.username).store(self.db)
+        Challenge(self.username, self.habit_name).store(self.db, self.period, self.interval)
+        service = HabitService("test.db", readers=1, window=0.05)
+
+        async def request(method, path, body=None):
+            reader, writer = await asyncio.open_connection("127.0.0.1", service.port)
+            payload = json.dumps(body).encode() if body is not None else b""
+            writer.write(f"{method} {path} HTTP/1.1\r\nContent-Length: {len(payload)}\r\nConnection: close\r\n\r\n"
+                         .encode() + payload)
+            head, _, text = (await reader.read()).partition(b"\r\n\r\n")
+            writer.close()
+            return int(head.split()[1]), json.loads(text)
+
+        async def scenario():
+            started = asyncio.Event()
+            server = asyncio.create_task(service.serve(port=0, started=started))
+            await started.wait()
+            track = {"user": self.username, "habit": self.habit_name}
+            due = await request("GET", "/due?before=" + str(date.today()))
+            results = await asyncio.gather(*(request("POST", "/track", track) for i in range(3)))
+            results.append(await request("GET", "/streaks?user=" + self.username))
+            results.append(await request("POST", "/track", dict(track, habit="Unknown")))
+            results.append(await request("GET", "/due?user=" + self.username))
+            results.append(due)
+            scheduler = service.scheduler
+            scheduler.today -= 1
+            scheduler.load(scheduler.bounds([self.period]))
+            assert scheduler.due(self.username)
+            results.append(await request("GET", "/due?user=" + self.username))
+            server.cancel()
+            return results
+
+        try:
+            results = asyncio.run(scenario())
+        finally:
+            service.close()
+        assert sorted(result["tracked"] for status, result in results[:3]) == [1, 2, 3]
+        assert results[3] == (200, {"user": self.username, "challenges": [
+            {"challenge_id": 1, "habit": self.habit_name, "period": self.period, "start_date": str(date.today()),
+             "end_date": None, "longest": 1}]})
+        assert results[4][0] == 404
+        assert results[5] == (200, {"due": []})
+        assert [(elt["tracked"], elt["remaining"]) for elt in results[6][1]["due"]] == [(0, self.interval)]
+        assert results[7] == (200, {"due": []})
+        assert (service.counters["writes"], service.counters["batches"]) == (4, 2)
+
+    def test_service_batch_errors(self):
+        """
+        Function to write a batch with a malformed request: its writes are rolled back and it gets a 400, while the
+        valid requests of the same batch are committed.
+        """
+        Challenge(self.username, self.habit_name).store(self.db, self.period, self.interval)
+        track = {"user": self.username, "habit": self.habit_name}
+
+        def malformed(db, request):
+            safe_user_name(db, "Malformed")
+            return date.fromisoformat(request["date"])
+
+        pool = ConnectionPool("test.db", readers=1)
+        try:
+            results = write_batch(pool, [(service_track, track), (malformed, {"date": "2024-02-30"}),
+                                         (service_track, track)])
+        finally:
+            pool.close()
+        assert [status for status, result in results] == [200, 400, 200]
+        assert results[2][1]["tracked"] == 2
+        assert "Malformed" not in get_user_names(self.db)
+
+    def test_heatmap(self, tmp_path):
+        """
+        Function to count the trackings and streaks of all challenges of a user per day and per week and to render
+        the heatmap as text and HTML.
+        """
+        restore_challenge(self.db, self.username, self.habit_name, self.period, self.interval, "2024-01-01", None)
+        restore_challenge(self.db, self.username, "Walk", "weekly", 1, "2024-01-01", None)
+        import_events(self.db, [(self.username, self.habit_name, day) for day in ("2024-01-01", "2024-01-01",
+                                                                                   "2024-01-02", "2024-01-10")]
+                      + [(self.username, "Walk", "2024-01-03")])
+
+        heatmap = load_heatmap(self.db, self.username, date(2024, 1, 1), date(2024, 1, 14))
+        assert heatmap["cells"][1] == {date(2024, 1, day).toordinal(): value
+                                       for day, value in ((1, (2, 1)), (2, (1, 0)), (10, (1, 0)))}
+        text = render_text(heatmap)
+        assert "Mon " + STREAK + SHADES[0] in text and "Tue " + SHADES[2] + SHADES[0] in text
+        assert load_heatmap(self.db, self.username, date(2024, 1, 1), date(2024, 1, 14), "week")["cells"] == {
+            1: {(date(2024, 1, 1).toordinal() - 1) // 7: (3, 1), (date(2024, 1, 8).toordinal() - 1) // 7: (1, 0)},
+            2: {(date(2024, 1, 1).toordinal() - 1) // 7: (1, 1)}}
+
+        write_heatmap(heatmap, str(tmp_path / "heatmap.html"))
+        assert "<title>2024-01-01: 2 trackings, streak</title>" in (tmp_path / "heatmap.html").read_text()
+
+    def test_statistics(self, capsys):
+        """
+        Function to compute completion rate, trackings per period and longest run of the daily challenges of three
+        users on the same habit and to rank them against each other with the cached cohort histograms.
+        """
+        today = date(2024, 1, 10)
+        days = {self.username: (1, 2, 3, 5, 5), "Second": (1, 2), "Third": ()}
+        for user, tracked in days.items():
+            safe_user_name(self.db, user)
+            restore_challenge(self.db, user, self.habit_name, "daily", 1, "2024-01-01", None)
+            import_events(self.db, [(user, self.habit_name, date(2024, 1, day)) for day in tracked])
+
+        stats = challenge_statistics(self.db, self.username, today)
+        assert [(elt.elapsed, elt.completions, elt.completion_percent, elt.trackings, elt.longest)
+                for elt in stats] == [(10, 4, 40, 5, 3)]
+        assert stats[0].completion_rate == 0.4 and stats[0].trackings_per_period == 0.5
+        assert stats[0].longest == list_streaks(self.db, stats[0].challenge_id, "daily", "")
+
+        assert percentile([(0, 1), (2, 1), (3, 1)], 3) == 83 and percentile([], 1) is None
+        cache.lookups.clear()
+        ranks = [user_statistics(self.db, user, today)[0][1] for user in days]
+        assert [(elt["longest_percentile"], elt["completion_percentile"]) for elt in ranks] == [(83, 83), (50, 50),
+                                                                                               (17, 17)]
+        assert ranks[0]["cohort"] == 3 and cache.stats()["misses"] == 1 and cache.stats()["hits"] == 2
+
+        assert cohort_histogram(self.db, self.habit_name, "completion", today) == [(0, 1), (20, 1), (40, 1)]
+        import_events(self.db, [("Third", self.habit_name, date(2024, 1, day)) for day in (6, 7, 8, 9)])
+        assert user_statistics(self.db, "Third", today)[0][1]["longest_percentile"] == 83
+
+        restore_challenge(self.db, "Second", "Walk", "every 1 days from 2024-01-01", 1, "2024-01-01", None)
+        restore_challenge(self.db, "Second", "Swim", "yearly", 1, "2024-01-01", None)
+        import_events(self.db, [("Second", "Walk", date(2024, 1, day)) for day in days[self.username]])
+        stat, rank = user_statistics(self.db, "Second", today)[1]
+        assert (stat.habit, stat.elapsed, stat.completions, stat.completion_percent, stat.trackings,
+                stat.longest) == ("Walk", 10, 4, 40, 5, 3)
+        assert rank["cohort"] == 1 and cohort_histogram(self.db, "Walk", "longest", today) == [(3, 1)]
+        assert print_statistics(self.db, "Second", today) == 2
+        assert "Skipped challenge 5 (Swim) with unknown period yearly" in capsys.readouterr().out
+
+    def test_due_scheduler(self):
+        """
+        Function to index the open challenges of two users by deadline, to count new trackings in memory and to
+        count the challenges again whose period ended when the date moves on.
+        """
+        safe_user_name(self.db, "Second")
+        restore_challenge(self.db, self.username, self.habit_name, "daily", 2, "2024-01-01", None)
+        restore_challenge(self.db, self.username, "Walk", "weekly", 1, "2024-01-01", None)
+        restore_challenge(self.db, "Second", self.habit_name, "every 3 days", 1, "2024-01-01", None)
+        restore_challenge(self.db, "Second", "Walk", "monthly", 1, "2023-01-01", "2023-12-31")
+        import_events(self.db, [(self.username, self.habit_name, "2024-01-03"),
+                                (self.username, self.habit_name, "2024-01-04")])
+
+        scheduler = DueScheduler(self.db, date(2024, 1, 3))
+        assert len(scheduler) == 3
+        assert [(elt.challenge_id, elt.tracked, elt.remaining, elt.deadline) for elt in scheduler.due(self.username)
+                ] == [(1, 1, 1, date(2024, 1, 3)), (2, 0, 1, date(2024, 1, 7))]
+        assert [elt.challenge_id for elt in scheduler.due_all()] == [1, 3, 2]
+        assert [elt.challenge_id for elt in scheduler.due_all(before=date(2024, 1, 3))] == [1, 3]
+        assert scheduler.track(1, date(2024, 1, 3)) == 0 and scheduler.track(1, date(2024, 1, 2)) == 0
+        assert [elt.challenge_id for elt in scheduler.due(self.username)] == [2]
+
+        assert scheduler.advance(date(2024, 1, 4)) == 2
+        assert [(elt.tracked, elt.remaining) for elt in scheduler.due(self.username)] == [(1, 1), (0, 1)]
+        assert scheduler.advance(date(2024, 1, 8)) == 3
+        assert [elt.challenge_id for elt in scheduler.due_all()] == [1, 3, 2]
+        Challenge(self.username, "Walk").stop(self.db)
+        assert scheduler.refresh_user(self.username) == 1 and len(scheduler) == 2
+
+    def test_leaderboard(self):
+        """
+        Function to rank the longest streaks of the challenges of two users in worker processes and serially.
+        Both ways must give the same leaderboard.
+        """
+        safe_user_name(self.db, "Second")
+        restore_challenge(self.db, self.username, self.habit_name, "daily", 1, "2024-01-01", None)
+        restore_challenge(self.db, "Second", self.habit_name, "weekly", 1, "2024-01-01", None)
+        restore_challenge(self.db, "Second", "Walk", "daily", 1, "2024-01-01", None)
+        events = [(self.username, self.habit_name, day) for day in ("2024-01-01", "2024-01-02", "2024-01-03")]
+        events += [("Second", self.habit_name, day) for day in ("2024-01-01", "2024-01-08", "2024-01-22")]
+        events += [("Second", "Walk", day) for day in ("2024-01-01", "2024-01-03")]
+        import_events(self.db, events)
+
+        assert shard_ranges([1, 2, 3], 2) == [(1, 2), (3, 3)]
+        board = leaderboard("test.db", top=2, workers=2)
+        assert board == leaderboard("test.db", top=2, workers=1)
+        assert [(elt[0], elt[2]) for elt in board["overall"]] == [(3, self.username), (2, "Second")]
+        assert [elt[0] for elt in board["period"]["daily"]] == [3, 1]
+        assert [elt[0] for elt in board["habit"]["Walk"]] == [1]
+
+    def test_sharding(self, tmp_path):
+        """
+        Function to split the test database into shards, to track a new challenge in the shard of its user through the
+        attached catalog and to rank the challenges of all shards, in the leaderboard and in the cohort of a habit.
+        """
+        safe_user_name(self.db, "Second")
+        restore_challenge(self.db, self.username, self.habit_name, "daily", 1, "2024-01-01", None)
+        restore_challenge(self.db, "Second", "Walk", "daily", 1, "2024-01-01", None)
+        import_events(self.db, [(self.username, self.habit_name, "2024-01-01"), ("Second", "Walk", "2024-01-01"),
+                                ("Second", "Walk", "2024-01-02")])
+
+        folder = str(tmp_path / "shards")
+        assert split_database("test.db", folder, shards=4) == table_counts("test.db")
+        assert shard_file(folder, self.username) != shard_file(folder, "Second")
+        assert leaderboard(folder, workers=1) == leaderboard("test.db", workers=1)
+
+        db = get_db(folder, user="Second")
+        Habit("Swim", self.habit_description, "Second").store(db)
+        Challenge("Second", "Swim").store(db, self.period, 1)
+        tracker = Tracker("Second")
+        tracker.import_challenge(db, "Swim")
+        assert tracker.challengeID > ID_RANGE
+        tracker.safe_track(db, date.today())
+        assert [elt.habit for elt in list_challenges(db, "Second")] == ["Walk", "Swim"]
+        assert list_challenges(db, self.username) == []
+        restore_challenge(db, "Second", self.habit_name, "daily", 1, "2024-01-01", None)
+        ranks = {stat.habit: rank for stat, rank in user_statistics(db, "Second", name=folder)}
+        assert (ranks[self.habit_name]["cohort"], ranks["Walk"]["cohort"]) == (2, 1)
+        db.close()
+
+        catalog = get_db(folder)
+        assert get_user_names(catalog) == [self.username, "Second"]
+        catalog.close()
+        assert table_counts(folder)["Streaks"] == table_counts("test.db")["Streaks"] + 1
+
+    def test_transaction(self):
+        """
+        Function to check that writes inside a transaction block are committed together at its end
+        and rolled back together on an error.
+        """
+        with transaction(self.db):
+            safe_user_name(self.db, "Second")
+            safe_user_name(self.db, "Third")
+        assert {"Second", "Third"} <= set(get_user_names(self.db))
+
+        with pytest.raises(RuntimeError):
+            with transaction(self.db):
+                safe_user_name(self.db, "Fourth")
+                raise RuntimeError
+        assert "Fourth" not in get_user_names(self.db)
+
+    def test_connection_pool(self):
+        """
+        Function to write through the writer connection of a connection pool and read the result in parallel threads
+        through its read-only connections.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        pool = ConnectionPool("test.db", readers=2)
+        with pool.writer() as db:
+            safe_user_name(db, "Pooled")
+
+        def read(number):
+            with pool.reader() as db:
+                return get_user_names(db)
+
+        with ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(read, range(8)))
+        assert all("Pooled" in elt for elt in results)
+        assert pool.stats()["reader"]["checkouts"] == 8
+        assert pool.stats()["writer"]["in_use"] == 0
+        pool.close()
+
+    def test_command_line(self, capsys):
+        """
+        Function to create a habit, start a challenge and track it with the non-interactive subcommands.
+        """
+        assert main(["--db", "test.db", "habit", "--user", self.username, "--name", self.habit_name,
+                     "--description", self.habit_description]) == 0
+        assert main(["--db", "test.db", "start", "--user", self.username, "--habit", self.habit_name,
+                     "--period", self.period, "--interval", "1"]) == 0
+        assert main(["--db", "test.db", "track", "--user", self.username, "--habit", self.habit_name]) == 0
+        assert "Streak!" in capsys.readouterr().out
+        assert main(["--db", "test.db", "longest", "--user", self.username]) == 0
+        assert "Your longest streaks in a row are 1 Streaks" in capsys.readouterr().out
+        assert main(["--db", "test.db", "track", "--user", self.username, "--habit", "Unknown"]) == 1
+
     def teardown_method(self):
         """
         Closure and removal of the test database.
@@ -1,25 +1,28 @@
-from datetime import date
-from database import safe_tracking, get_challenge_for_habit, tracks_today, safe_streak, tracks_week, tracks_month
+from database import transaction, safe_tracking, safe_tracking_in_period, get_challenge_for_habit, safe_streak
+from periods import get_period, date_parts, as_day
+from streaks import next_summary, challenge_buckets, challenge_period
 
 
 class Tracker:
+    __slots__ = ("user", "habit", "challengeID", "period", "interval", "date_started", "date", "week", "month", "year")
+
     def __init__(self, user):
         """
         Class to track executed habits/actions into a tracker.
+        The challenge fields are None until a challenge is imported (see import_challenge).
         :param user: Logged in user that tracks the action.
         """
         self.user = user
-        self.habit = ""
-        self.challengeID = ""
-        self.period = ""
-        self.interval = 0
-        self.date_started = "2000-01-01"
-        self.date = "2000-01-01"
-        self.week = 1
-        self.month = 1
-        self.year = 2000
-        self.db = ""
-        
+        self.habit = None
+        self.challengeID = None
+        self.period = None
+        self.interval = None
+        self.date_started = None
+        self.date = None
+        self.week = None
+        self.month = None
+        self.year = None
+
     def import_challenge(self, db, habit):
         """
         Function to import challenge information into the tracker object.
@@ -29,47 +32,61 @@ class Tracker:
         :return: none
         """
         self.habit = habit
-        challenge = get_challenge_for_habit(db, self.user, self.habit)
-        self.challengeID = challenge[0][0]
-        self.period = challenge[0][3]
-        self.interval = challenge[0][4]
-        self.date_started = challenge[0][5]
+        challenge = get_challenge_for_habit(db, self.user, self.habit)[0]
+        self.challengeID = challenge.challenge_id
+        self.period = challenge.period
+        self.interval = challenge.interval
+        self.date_started = challenge.start_date
 
-    def safe_track(self, db, date_track):
+    def store_track(self, db, date_track):
         """
-        Function to safe tracking information from track object into sqlite3 database.
-        The function gives feedback on how many trackings are needed to reach streak.
+        Function to safe tracking information from track object into sqlite3 database without printed feedback.
+        Tracking, streak and streak summary are stored in one transaction.
         :param db:  an initialized sqlite3 database connection
         :param date_track: date for the to be tracked action
-        :return: none
+        :return: number of trackings in the period of the tracking date (0 for an unknown period)
         """
-        self.date = date_track
-        date_str = str(date_track)
-        date_split = date_str.split('-')
-        self.week = date(int(date_split[0]), int(date_split[1]), int(date_split[2])).isocalendar().week
-        self.month = int(date_split[1])
-        self.year = int(date_split[0])
-        safe_tracking(db, self.date, self.challengeID, self.week, self.month, self.year)
-        tracked = 0
+        with transaction(db):
+            self.date = date_track
+            self.week, self.month, self.year = date_parts(date_track)
+            tracked = 0
+            triggered = False
 
+            """
+            The following block safes the tracking and counts the trackings in the period (e.g. day, week, month) of
+            the tracking date with the same statement. The number of trackings per period is safed into the "tracked"
+            variable. With streak triggers (see database.create_streak_triggers) the streak is already stored then.
+            """
+            period = get_period(self.period)
+            if period is not None:
+                bucket = period.day_bucket(as_day(self.date))
+                tracked, triggered = safe_tracking_in_period(db, self.date, self.challengeID, self.period,
+                                                             period.first_day(bucket), period.last_day(bucket))
+            else:
+                safe_tracking(db, self.date, self.challengeID)
+            """
+            The following block checks the number of trackings per period saved in the "tracked" variable.
+            It is checked against the specific number in the "interval" variable of the given object.
+            In case of a streak, it is saved into the "Streak" table unless a trigger did. Challenges with an
+            unknown period have no streaks.
+            """
+            if period is not None and tracked == self.interval and not triggered:
+                challenge_range = challenge_buckets(*challenge_period(self.date_started, None), self.period)
+                summary = next_summary(db, self.challengeID, self.period, bucket, challenge_range)
+                safe_streak(db, self.challengeID, self.date, summary)
+        return tracked
+
+    def safe_track(self, db, date_track):
         """
-        The following block checks the "Tracker" table in the database for the number of trackings per period
-        (daily, weekly, monthly). The number of trackings per period is safed into ht "tracked" variable.
-        """
-        if self.period == "daily":
-            tracked = tracks_today(db, self.challengeID, self.date)
-        elif self.period == "weekly":
-            tracked = tracks_week(db, self.challengeID, self.week, self.year)
-        elif self.period == "monthly":
-            tracked = tracks_month(db, self.challengeID, self.month, self.year)
-        """
-        The following block checks the number of trackings per period saved in the "tracked" variable.
-        It is checked against the specific number in the "interval" variable of the given object.
-        In case of a streak, it is saved into the "Streak" table. Then a result text is printed.
+        Function to safe tracking information from track object into sqlite3 database (see store_track).
+        The function gives feedback on how many trackings are needed to reach streak.
+        :param db:  an initialized sqlite3 database connection
+        :param date_track: date for the to be tracked action
+        :return: none
         """
+        tracked = self.store_track(db, date_track)
         if tracked == self.interval:
             print("Streak! Well done. Come back soon!")
-            safe_streak(db, self.challengeID, self.date, self.week, self.month, self.year)
         elif tracked > self.interval:
             print("Streak already reached before, but keep on tracking")
         else: